@@ -1,41 +1,29 @@
-import requests
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from datetime import datetime, timezone, timedelta
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml_model"))
+from downloader import load_open_meteo
+from history_store import AQ_URL, DEFAULT_ROOT, HistoryStore
 
 import pandas as pd
 import numpy as np
 
-url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-
-utc_now = datetime.now(timezone.utc)
+# Últimos 30 días desde el almacén local de ml_model (history_store.py);
+# sólo se descargan de Open-Meteo las horas que aún no están guardadas
+utc_now = pd.Timestamp.now(tz="UTC").floor("h")
 start_date = utc_now - timedelta(days=30)
 
-start_date = start_date.strftime("%Y-%m-%d")
-utc_now = utc_now.strftime("%Y-%m-%d")
-
-params = {
-    "latitude": 38.8951,
-    "longitude": -77.0364,
-    "start_date": start_date,
-    "end_date": utc_now,
-    "hourly": ",".join([
-        "pm10","pm2_5","carbon_monoxide","carbon_dioxide",
-        "nitrogen_dioxide","ozone","sulphur_dioxide",
-    ])
-}
-
-r = requests.get(url, params=params, timeout=60)
-r.raise_for_status()
-data = r.json()
-
-hourly = data.get("hourly", {})
-units = data.get("hourly_units", {})
-timezone = data.get("timezone")
+store = HistoryStore(os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+df = load_open_meteo(store, "air_quality", AQ_URL, 38.8951, -77.0364, [
+    "pm10","pm2_5","carbon_monoxide","carbon_dioxide",
+    "nitrogen_dioxide","ozone","sulphur_dioxide",
+], start_date, utc_now)
 
-df = pd.DataFrame(hourly)
-df["time"] = pd.to_datetime(df["time"])
+df = df.rename_axis("time").reset_index()
 
 def convert_units(df):
     df = df.copy()
@@ -0,0 +1,113 @@
+"""Alineación horaria: bucle hora a hora (loc + argmin, la versión
+original) frente a tempo_collection.hourly_alignment (merge_asof).
+
+Genera tablas de granulos como las de granule_table (un granulo cada
+~40 min de 11 a 23 UTC, con huecos, timestamps repetidos y empates a
+igual distancia de dos granulos) y compara resultado y tiempo.
+
+Uso (desde TempoDataCollection/):
+    python bench_alignment.py --years 1,3
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from tempo_collection import TOL_MINUTES, hourly_alignment
+
+TAG = "NO2"
+
+
+def legacy_hourly_alignment(df_raw, tag, hour_start, hour_stop, tol_minutes=TOL_MINUTES):
+    """Versión original: una ventana loc[t - tol : t + tol] por hora (referencia)"""
+    hours = pd.date_range(hour_start, hour_stop, freq="h", tz="UTC")
+    tol = pd.Timedelta(minutes=tol_minutes)
+    vals, src_ts, src_file, qc_mode = [], [], [], []
+
+    for t in hours:
+        window = df_raw.loc[t - tol : t + tol]
+        if len(window):
+            diffs = np.abs((window.index - t).to_numpy())
+            idx = np.argmin(diffs)
+            picked = window.iloc[idx]
+            vals.append(picked[f"{tag}_vcol"])
+            src_ts.append(window.index[idx])
+            src_file.append(picked["file"])
+            qc_mode.append(picked["qc_mode"])
+        else:
+            vals.append(np.nan)
+            src_ts.append(pd.NaT)
+            src_file.append("")
+            qc_mode.append("NA")
+
+    return pd.DataFrame({
+        f"{tag}_vcol": vals,
+        "source_time": src_ts,
+        "source_file": src_file,
+        "qc_mode": qc_mode,
+        "filled": np.where(pd.notna(vals), 1, 0)
+    }, index=hours)
+
+
+def synthetic_granules(days, seed=0):
+    """Tabla cruda de granulos (time, NO2_vcol, qc_mode, file) de `days` días"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-09-01 11:00", tz="UTC")
+    per_day = 18
+    day = np.repeat(np.arange(days), per_day)
+    minutes = np.tile(np.arange(per_day) * 40, days) + rng.integers(-15, 16, days * per_day)
+    times = start + pd.to_timedelta(day, unit="D") + pd.to_timedelta(minutes, unit="min")
+    keep = rng.random(len(times)) > 0.15  # huecos (días nublados, jobs fallidos)
+    times = times[keep]
+    n = len(times)
+    # Empates exactos (granulos a las y media) y timestamps repetidos
+    ties = rng.random(n) < 0.03
+    times = times.where(~ties, times.floor("h") + pd.Timedelta(minutes=30))
+    dup = np.flatnonzero(rng.random(n) < 0.01)
+    times = times.append(times[dup])
+    n = len(times)
+    vcol = rng.lognormal(36, 0.5, n)
+    vcol[rng.random(n) < 0.05] = np.nan
+    qc = rng.choice(np.array(["QC==0", "QC<=1", "noQC", "NaN"], dtype=object), n)
+    files = np.array([f"TEMPO_NO2_L2_V03_{t:%Y%m%dT%H%M%S}Z_S{i:05d}G01.nc" for i, t in enumerate(times)],
+                     dtype=object)
+    df = pd.DataFrame({f"{TAG}_vcol": vcol, "qc_mode": qc, "file": files},
+                      index=pd.DatetimeIndex(times, name="time"))
+    return df.sort_index(kind="stable")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default="0.1,1,3", help="años de granulos a probar")
+    parser.add_argument("--legacy-max-years", type=float, default=1,
+                        help="no correr el bucle original por encima de esto")
+    args = parser.parse_args()
+
+    print(f"{'años':>5} {'granulos':>9} {'horas':>7} {'bucle s':>8} {'asof s':>7} {'igual':>6}")
+    for years in (float(y) for y in args.years.split(",")):
+        days = max(1, int(years * 365))
+        df_raw = synthetic_granules(days)
+        hour_start = df_raw.index[0].floor("D")
+        hour_stop = hour_start + pd.Timedelta(days=days) - pd.Timedelta(hours=1)
+
+        t0 = time.perf_counter()
+        out = hourly_alignment(df_raw, TAG, hour_start, hour_stop)
+        t_new = time.perf_counter() - t0
+
+        t_old, equal = float("nan"), ""
+        if years <= args.legacy_max_years:
+            t0 = time.perf_counter()
+            ref = legacy_hourly_alignment(df_raw, TAG, hour_start, hour_stop)
+            t_old = time.perf_counter() - t0
+            try:
+                pd.testing.assert_frame_equal(out, ref, check_freq=False)
+                equal = "True"
+            except AssertionError as e:
+                equal = "False"
+                print(e)
+        print(f"{years:>5g} {len(df_raw):>9} {len(out):>7} {t_old:>8.2f} {t_new:>7.3f} {equal:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Reducción de granulos: datatree completo y cascada de QC con
+var.where(...).mean() en serie (la versión original) frente a
+tempo_collection.reduce_granules con 1..N procesos.
+
+Genera un directorio de NetCDF4 sintéticos con la forma de un L2 de TEMPO
+(grupos product, geolocation y support_data; mirror_step x xtrack,
+comprimidos con zlib) y reduce todos con la cascada de QC de cada forma.
+
+Uso (desde TempoDataCollection/, requiere netCDF4 y xarray/datatree):
+    python bench_reduce.py --files 48 --workers 1,2,4,8
+    python bench_reduce.py --dir /tmp/tempo_synth --keep
+"""
+import argparse
+import datetime as dt
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from tempo_collection import QC_LEVELS, _open_dtree, _qc_cascade, reduce_granules
+
+VALUE_VAR = "product/vertical_column_troposphere"
+QC_VAR = "product/main_data_quality_flag"
+FILL = -1.0e30
+
+
+def write_granule(path, rows, cols, rng, bad_quality=False):
+    import netCDF4
+
+    with netCDF4.Dataset(path, "w") as nc:
+        nc.createDimension("mirror_step", rows)
+        nc.createDimension("xtrack", cols)
+        dims = ("mirror_step", "xtrack")
+        opts = {"zlib": True, "complevel": 4, "chunksizes": (min(rows, 64), min(cols, 256))}
+
+        product = nc.createGroup("product")
+        value = product.createVariable("vertical_column_troposphere", "f8", dims, fill_value=FILL, **opts)
+        data = rng.lognormal(36, 0.5, (rows, cols))
+        data[rng.random((rows, cols)) < 0.1] = FILL
+        value[:] = data
+        qc = product.createVariable("main_data_quality_flag", "i2", dims, **opts)
+        # Granulos con mala calidad: sin píxeles QC==0 (la cascada baja de nivel)
+        qc[:] = rng.choice([1, 2], (rows, cols)) if bad_quality else rng.choice([0, 0, 0, 1, 2], (rows, cols))
+
+        geo = nc.createGroup("geolocation")
+        lat = np.linspace(38.86, 38.94, rows)[:, None] + np.zeros(cols)
+        lon = np.linspace(-77.10, -76.97, cols)[None, :] + np.zeros((rows, 1))
+        for name, values in (("latitude", lat), ("longitude", lon)):
+            geo.createVariable(name, "f4", dims, **opts)[:] = values
+
+        # Lo que el datatree completo también abre y no hace falta
+        support = nc.createGroup("support_data")
+        for name in ("amf_total", "amf_troposphere", "scattering_weights", "surface_pressure"):
+            support.createVariable(name, "f4", dims, **opts)[:] = rng.random((rows, cols))
+
+
+def make_granules(directory, files, rows, cols, seed=0):
+    rng = np.random.default_rng(seed)
+    start = dt.datetime(2024, 12, 15, 11, 40)
+    paths = []
+    for i in range(files):
+        ts = (start + dt.timedelta(minutes=40 * i)).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(directory, f"TEMPO_NO2_L2_V03_{ts}Z_S{i:03d}G01.nc")
+        if not os.path.exists(path):
+            write_granule(path, rows, cols, rng, bad_quality=i % 5 == 4)
+        paths.append(path)
+    return paths
+
+
+def legacy_mean_with_qc(dtree, value_var, qc_var, qc_levels):
+    """Versión original: un where + mean por nivel (referencia)"""
+    var = dtree[value_var]
+    qf = dtree[qc_var]
+    for lvl in qc_levels:
+        if lvl is None:
+            m = float(var.mean().values)
+            if np.isfinite(m):
+                return m, "noQC"
+        elif lvl == 0:
+            m = float(var.where(qf == 0).mean().values)
+            if np.isfinite(m):
+                return m, "QC==0"
+        else:
+            m = float(var.where(qf <= lvl).mean().values)
+            if np.isfinite(m):
+                return m, f"QC<={lvl}"
+    return float("nan"), "NaN"
+
+
+def serial_datatree(paths):
+    out = {}
+    for p in paths:
+        out[p] = legacy_mean_with_qc(_open_dtree(p), VALUE_VAR, QC_VAR, QC_LEVELS)
+    return out
+
+
+def pooled(paths, workers):
+    return {p: (mean_val, qc_mode) for p, mean_val, qc_mode, _ in
+            reduce_granules(paths, VALUE_VAR, QC_VAR, QC_LEVELS, workers)}
+
+
+def cascade_cases(rng, n=400):
+    """Casos borde de la cascada en memoria: (nombre, valores, flags)"""
+    values = rng.lognormal(36, 0.5, (20, 30))
+    flags = rng.choice([0, 1, 2], (20, 30)).astype(float)
+    cases = [("mezcla", values, flags)]
+    cases.append(("sin QC==0", values, np.where(flags == 0, 2, flags)))
+    cases.append(("sólo QC==2", values, np.full_like(flags, 2)))
+    cases.append(("flags NaN", values, np.where(flags == 0, np.nan, flags)))
+    cases.append(("flags negativos", values, np.where(flags == 2, -1, flags)))
+    cases.append(("todo relleno", np.full_like(values, np.nan), flags))
+    with_inf = values.copy()
+    with_inf[flags == 0] = np.inf
+    cases.append(("inf en QC==0", with_inf, flags))
+    for i in range(n):
+        v = np.where(rng.random(values.shape) < rng.random(), np.nan, values)
+        f = rng.choice([0, 1, 2, np.nan], values.shape, p=rng.dirichlet(np.ones(4)))
+        cases.append((f"aleatorio {i}", v, f))
+    return cases
+
+
+def check_cascade(seed=0):
+    import xarray as xr
+
+    mismatches = []
+    for name, values, flags in cascade_cases(np.random.default_rng(seed)):
+        arrays = {"v": xr.DataArray(values, dims=("mirror_step", "xtrack")),
+                  "q": xr.DataArray(flags, dims=("mirror_step", "xtrack"))}
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # medias de arrays vacíos
+            ref = legacy_mean_with_qc(arrays, "v", "q", QC_LEVELS)
+            new = _qc_cascade(arrays["v"], arrays["q"], QC_LEVELS, block_rows=7)
+        if ref[1] != new[1] or not np.isclose(ref[0], new[0], rtol=1e-12, equal_nan=True):
+            mismatches.append((name, ref, new[:2]))
+    return len(cascade_cases(np.random.default_rng(seed))), mismatches
+
+
+def same(a, b):
+    return all(a[p][1] == b[p][1] and np.isclose(a[p][0], b[p][0], rtol=1e-12, equal_nan=True) for p in a)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=48)
+    parser.add_argument("--rows", type=int, default=131, help="mirror_step por granulo")
+    parser.add_argument("--cols", type=int, default=2048, help="xtrack por granulo")
+    parser.add_argument("--workers", default="1,2,4", help="procesos a probar")
+    parser.add_argument("--dir", default=None, help="directorio de granulos (se reutiliza)")
+    parser.add_argument("--keep", action="store_true", help="no borrar los granulos generados")
+    args = parser.parse_args()
+
+    n_cases, mismatches = check_cascade()
+    print(f"Cascada de QC: {n_cases - len(mismatches)}/{n_cases} casos iguales a la versión original")
+    for name, ref, new in mismatches:
+        print(f"  ❌ {name}: {ref} != {new}")
+
+    directory = args.dir or tempfile.mkdtemp(prefix="tempo_synth_")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        t0 = time.perf_counter()
+        paths = make_granules(directory, args.files, args.rows, args.cols)
+        size = sum(os.path.getsize(p) for p in paths) / 2**20
+        print(f"{len(paths)} granulos {args.rows}x{args.cols} ({size:.0f} MB) en {directory} "
+              f"({time.perf_counter() - t0:.1f}s)")
+
+        t0 = time.perf_counter()
+        ref = serial_datatree(paths)
+        t_ref = time.perf_counter() - t0
+        print(f"{'forma':<22} {'s':>7} {'granulos/s':>11} {'speedup':>8} {'igual':>6}")
+        print(f"{'datatree en serie':<22} {t_ref:>7.2f} {len(paths) / t_ref:>11.1f} {1:>7.1f}x")
+
+        for workers in (int(w) for w in args.workers.split(",")):
+            if workers > 1:
+                pooled(paths[:workers], workers)  # arranque del pool fuera de la medida
+            t0 = time.perf_counter()
+            out = pooled(paths, workers)
+            t = time.perf_counter() - t0
+            print(f"{f'selectivo, {workers} proc':<22} {t:>7.2f} {len(paths) / t:>11.1f} "
+                  f"{t_ref / t:>7.1f}x {str(same(ref, out)):>6}")
+    finally:
+        if not (args.keep or args.dir):
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Cliente de Harmony falso para probar harmony_jobs.py sin red.
+
+Cada job "se procesa" durante un tiempo fijo y luego ofrece `granules`
+URLs; cada descarga tarda `download_seconds` y escribe un archivo vacío
+con el nombre de un granulo TEMPO (la hora va en el nombre). Cuenta el
+máximo de descargas simultáneas para comprobar el límite del orquestador.
+
+Uso directo (compara el flujo de antes, colección por colección, con el
+orquestador):
+    python fake_harmony.py --jobs 4 --queue-seconds 2,4,1,3 --granules 11 --max-downloads 4
+"""
+import argparse
+import datetime as dt
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harmony_jobs import CollectionOrchestrator
+
+
+class FakeHarmonyClient:
+    """submit / status / result_urls / download / wait_for_processing /
+    download_all, con la misma forma que harmony.Client"""
+
+    def __init__(self, queue_seconds, granules=11, download_seconds=0.1, fail=(), workers=16):
+        self.queue_seconds = list(queue_seconds)
+        self.granules = granules
+        self.download_seconds = download_seconds
+        self.fail = set(fail)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.status_calls = 0
+
+    def submit(self, request):
+        with self._lock:
+            n = len(self._jobs)
+            job_id = f"job-{n}"
+            self._jobs[job_id] = {
+                "request": request,
+                "ready_at": time.monotonic() + self.queue_seconds[n % len(self.queue_seconds)],
+                "failed": request in self.fail,
+            }
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            self.status_calls += 1
+        job = self._jobs[job_id]
+        if time.monotonic() < job["ready_at"]:
+            return {"status": "running", "progress": 50}
+        if job["failed"]:
+            return {"status": "failed", "progress": 100, "message": "fake failure"}
+        return {"status": "successful", "progress": 100}
+
+    def wait_for_processing(self, job_id, show_progress=False):
+        while self.status(job_id)["status"] == "running":
+            time.sleep(0.05)
+
+    def result_urls(self, job_id):
+        start = dt.datetime(2024, 12, 15, 12, 0)
+        for i in range(self.granules):
+            ts = (start + dt.timedelta(minutes=60 * i + 7)).strftime("%Y%m%dT%H%M%S")
+            yield f"https://fake/{job_id}/TEMPO_{job_id}_{ts}Z_S{i:03d}G01.nc"
+
+    def _download(self, url, directory):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.download_seconds)
+            path = os.path.join(directory, url.rsplit("/", 1)[-1])
+            open(path, "wb").close()
+            return path
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def download(self, url, directory="", overwrite=False):
+        return self._pool.submit(self._download, url, directory)
+
+    def download_all(self, job_id, directory="", overwrite=False):
+        for url in self.result_urls(job_id):
+            yield self.download(url, directory, overwrite)
+
+
+def count_granules(job, files):
+    """Reducción de prueba: los granulos descargados del job"""
+    return len(files)
+
+
+def sequential(client, jobs):
+    """El flujo de los scripts antes del orquestador"""
+    results = {}
+    for job in jobs:
+        os.makedirs(job["out_dir"], exist_ok=True)
+        job_id = client.submit(job["request"])
+        client.wait_for_processing(job_id)
+        if client.status(job_id)["status"] != "successful":
+            continue
+        futures = list(client.download_all(job_id, directory=job["out_dir"]))
+        files = [f.result() for f in futures]
+        results[job["tag"]] = count_granules(job, files)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--queue-seconds", default="2,4,1,3", help="tiempo en cola de cada job (cíclico)")
+    parser.add_argument("--granules", type=int, default=11)
+    parser.add_argument("--download-seconds", type=float, default=0.1)
+    parser.add_argument("--max-downloads", type=int, default=4)
+    parser.add_argument("--poll-seconds", type=float, default=0.2)
+    parser.add_argument("--fail", type=int, default=None, help="índice de un job que falla")
+    args = parser.parse_args()
+
+    queue = [float(v) for v in args.queue_seconds.split(",")]
+    with tempfile.TemporaryDirectory() as root:
+        def make_jobs(name):
+            return [{"tag": f"C{i}", "request": f"C{i}", "out_dir": os.path.join(root, name, f"C{i}")}
+                    for i in range(args.jobs)]
+        fail = {f"C{args.fail}"} if args.fail is not None else ()
+
+        client = FakeHarmonyClient(queue, args.granules, args.download_seconds, fail)
+        t0 = time.perf_counter()
+        seq = sequential(client, make_jobs("seq"))
+        t_seq = time.perf_counter() - t0
+        seq_max = client.max_in_flight
+
+        client = FakeHarmonyClient(queue, args.granules, args.download_seconds, fail)
+        orchestrator = CollectionOrchestrator(client, max_downloads=args.max_downloads,
+                                              poll_seconds=args.poll_seconds, reduce=count_granules,
+                                              log=lambda msg: None)
+        t0 = time.perf_counter()
+        results, errors = orchestrator.run(make_jobs("orq"))
+        t_orq = time.perf_counter() - t0
+
+    print(f"{'flujo':<14} {'s':>7} {'jobs ok':>8} {'granulos':>9} {'descargas máx':>14}")
+    print(f"{'secuencial':<14} {t_seq:>7.2f} {len(seq):>8} {sum(seq.values()):>9} {seq_max:>14}")
+    print(f"{'orquestador':<14} {t_orq:>7.2f} {len(results):>8} {sum(results.values()):>9} "
+          f"{client.max_in_flight:>14}")
+    print(f"Consultas de estado: {client.status_calls}; errores: {errors or 'ninguno'}")
+    if client.max_in_flight > args.max_downloads:
+        raise SystemExit(f"Límite de descargas superado ({client.max_in_flight} > {args.max_downloads})")
+    if sum(results.values()) != sum(seq.values()):
+        raise SystemExit("El orquestador no descargó los mismos granulos")
+
+
+if __name__ == "__main__":
+    main()
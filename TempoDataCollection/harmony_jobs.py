@@ -0,0 +1,147 @@
+"""Orquestador de jobs de Harmony para varias colecciones TEMPO a la vez.
+
+En lugar de submit -> wait_for_processing -> download_all colección por
+colección (el tiempo total es la suma de las colas del servidor):
+
+1. Se envían todos los jobs al principio.
+2. Un solo bucle consulta el estado de todos los pendientes cada
+   `poll_seconds`.
+3. En cuanto un job termina, un hilo descarga sus granulos y los reduce
+   (tempo_collection.reduce_collection) mientras los demás siguen en cola.
+4. Las descargas de todos los jobs comparten un semáforo: como mucho
+   `max_downloads` a la vez.
+5. Si la consulta de estado de un job falla `max_status_errors` veces
+   seguidas, el job se da por fallido en lugar de consultarlo para siempre.
+
+El cliente sólo necesita submit, status, result_urls y download (la API de
+harmony-py), así que se puede probar con fake_harmony.FakeHarmonyClient.
+
+`skip(job, url)` permite no descargar granulos ya procesados (el backfill
+de tempo_backfill.py, que reanuda a partir de su manifiesto).
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tempo_collection import GEOLOCATION, reduce_collection
+
+DONE = {"successful", "complete_with_errors"}
+FAILED = {"failed", "canceled"}
+
+
+def collection_jobs(collections, bbox, start, stop, hour_start, hour_stop, output_root):
+    """Un job por colección (tag, collection_id, value_var, qc_var) con su
+    Request de Harmony y lo que necesita reduce_collection"""
+    from harmony import Collection, Request
+
+    return [{
+        "tag": tag,
+        "request": Request(
+            collection=Collection(id=collection_id),
+            spatial=bbox,
+            temporal={"start": start, "stop": stop},
+            variables=[value_var, qc_var] + GEOLOCATION,
+        ),
+        "value_var": value_var,
+        "qc_var": qc_var,
+        "out_dir": os.path.join(output_root, tag),
+        "hour_start": hour_start,
+        "hour_stop": hour_stop,
+    } for tag, collection_id, value_var, qc_var in collections]
+
+
+def _key(job):
+    return job.get("key", job["tag"])
+
+
+class CollectionOrchestrator:
+    def __init__(self, client, max_downloads=8, poll_seconds=10, overwrite=False,
+                 reduce=reduce_collection, log=print, skip=None, max_status_errors=30):
+        self.client = client
+        self.max_status_errors = max_status_errors
+        self.poll_seconds = poll_seconds
+        self.overwrite = overwrite
+        self.reduce = reduce
+        self.log = log
+        self.skip = skip
+        self.max_downloads = max_downloads
+        self._slots = threading.BoundedSemaphore(max_downloads)
+
+    def _fetch_and_reduce(self, job, job_id):
+        """Descarga acotada de los granulos de un job terminado y reducción"""
+        futures, skipped = [], 0
+        for url in self.client.result_urls(job_id):
+            if self.skip is not None and self.skip(job, url):
+                skipped += 1
+                continue
+            self._slots.acquire()
+            try:
+                future = self.client.download(url, directory=job["out_dir"], overwrite=self.overwrite)
+            except Exception:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+        files = [f.result() for f in futures]
+        done = f" ({skipped} ya procesados)" if skipped else ""
+        self.log(f"[OK] {_key(job)}: {len(files)} granulos descargados{done}")
+        return self.reduce(job, files)
+
+    def run(self, jobs):
+        """Procesa los jobs (dicts con tag, request, out_dir y lo que necesite
+        `reduce`) y devuelve ({clave: resultado}, {clave: error}); la clave es
+        job["key"] si existe (varios jobs de la misma colección) o el tag"""
+        t_start = time.perf_counter()
+        results, errors, pending = {}, {}, {}
+        for job in jobs:
+            os.makedirs(job["out_dir"], exist_ok=True)
+            try:
+                pending[_key(job)] = (job, self.client.submit(job["request"]))
+                self.log(f"=== {_key(job)} enviado ===")
+            except Exception as e:
+                errors[_key(job)] = f"submit: {e}"
+                self.log(f"[ERROR] {_key(job)} falló al enviar: {e}")
+
+        with ThreadPoolExecutor(max(1, len(pending))) as pool:
+            running, status_errors = {}, {}
+            while pending or running:
+                for tag, (job, job_id) in list(pending.items()):
+                    try:
+                        status = self.client.status(job_id)
+                    except Exception as e:
+                        # Un fallo puntual de la consulta no cancela el job; muchos seguidos sí
+                        status_errors[tag] = status_errors.get(tag, 0) + 1
+                        if status_errors[tag] >= self.max_status_errors:
+                            del pending[tag]
+                            errors[tag] = f"estado no disponible tras {status_errors[tag]} consultas: {e}"
+                            self.log(f"[ERROR] {tag} falló: {errors[tag]}")
+                        else:
+                            self.log(f"[WARN] {tag}: estado no disponible ({e})")
+                        continue
+                    status_errors.pop(tag, None)
+                    if status["status"] in DONE:
+                        del pending[tag]
+                        self.log(f"=== {tag} listo en Harmony ({time.perf_counter() - t_start:.0f}s) ===")
+                        running[pool.submit(self._fetch_and_reduce, job, job_id)] = tag
+                    elif status["status"] in FAILED:
+                        del pending[tag]
+                        errors[tag] = f"job {status['status']}: {status.get('message', '')}"
+                        self.log(f"[ERROR] {tag} falló: {errors[tag]}")
+
+                # Espera al siguiente sondeo, o antes si termina una reducción
+                if running:
+                    timeout = self.poll_seconds if pending else None
+                    finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    finished = ()
+                    if pending:
+                        time.sleep(self.poll_seconds)
+                for future in finished:
+                    tag = running.pop(future)
+                    try:
+                        results[tag] = future.result()
+                    except Exception as e:
+                        errors[tag] = str(e)
+                        self.log(f"[ERROR] {tag} falló: {e}")
+        return results, errors
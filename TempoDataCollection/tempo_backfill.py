@@ -0,0 +1,282 @@
+"""Backfill de TEMPO sobre un rango de fechas, reanudable.
+
+Los scripts HISTORICAL/NRT procesan un solo DATE_UTC. Esto recorre
+[--start, --end] en tramos de --days-per-job días: por cada tramo, un job
+de Harmony por colección (harmony_jobs.collection_jobs), --chunks-per-run
+tramos a la vez con el orquestador.
+
+Todo queda en --output-root:
+- manifest_granules.csv: cada granulo reducido (tag, time, file, vcol,
+  qc_mode, pixels_<nivel>), una línea por granulo en cuanto termina.
+- manifest_jobs.csv: cada (tag, tramo) terminado; el tramo es
+  <primer día>_<último día> y el estado, "done" (reducido) o "no_granules"
+  (Harmony no encontró granulos: fallo definitivo, el tramo se añade con
+  esa colección vacía).
+- dc_hourly_all_pollutants.csv: la tabla horaria combinada (mismo formato
+  que la de los scripts); cada tramo se añade al final cuando están todas
+  sus colecciones, sin reescribir lo anterior.
+- granules/<tramo>/<tag>/: los NetCDF descargados (--delete-granules los
+  borra tras reducirlos).
+
+Al relanzar se saltan los tramos ya presentes en la tabla combinada y los
+jobs terminados (con otro rango o --days-per-job los tramos cambian, pero
+sólo se añaden las horas que faltan); de los jobs a medias (caída del
+proceso o de Harmony) sólo se descargan y reducen los granulos que no están
+en el manifiesto. Si un tramo falla se añade en una ejecución posterior, así
+que la tabla combinada puede no estar ordenada: ordenar al leerla. Los tramos
+con "no_granules" ya quedan en la tabla: para volver a pedirlos, quitar sus
+filas de la tabla combinada y de manifest_jobs.csv.
+
+Uso (desde TempoDataCollection/, con EARTHDATA_USERNAME/EARTHDATA_PASSWORD):
+    python tempo_backfill.py --start 2024-09-01 --end 2025-09-30 --output-root D:/tempo_backfill
+"""
+import argparse
+import csv
+import datetime as dt
+import os
+import re
+import threading
+
+import pandas as pd
+
+from harmony_jobs import CollectionOrchestrator, collection_jobs
+from tempo_collection import QC_LEVELS, _extract_ts_from_name, _qc_label, hourly_alignment, reduce_granules
+
+BBOX = (-77.10, 38.86, -76.97, 38.94)
+HOUR_FIRST, HOUR_LAST = 12, 22  # horas UTC con granulos sobre DC
+DAYS_PER_JOB = 7
+CHUNKS_PER_RUN = 4
+MAX_DOWNLOADS = 8
+POLL_SECONDS = 10
+COMBINED = "dc_hourly_all_pollutants.csv"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+# Errores de Harmony que no cambian al reintentar (rango sin granulos)
+NO_GRANULES = re.compile(r"no (matching )?granules", re.IGNORECASE)
+
+collections = [
+    ("HCHO",  "C2930730944-LARC_CLOUD", "product/vertical_column",            "product/main_data_quality_flag"),
+    ("NO2",   "C2930725014-LARC_CLOUD", "product/vertical_column_troposphere","product/main_data_quality_flag"),
+    ("O3",    "C2930726639-LARC_CLOUD", "product/column_amount_o3",           "product/quality_flag"),
+    ("CLDO4", "C2930760329-LARC_CLOUD", "product/cloud_pressure",             "product/processing_quality_flag"),
+]
+
+
+class CsvLog:
+    """CSV sólo de añadir; cada fila se escribe y se vuelca en cuanto llega.
+
+    Una línea cortada por una caída se descarta al leer (y su granulo o job
+    se vuelve a hacer).
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self._lock = threading.Lock()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerow(columns)
+        else:
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def append(self, row):
+        with self._lock, open(self.path, "a", newline="") as f:
+            csv.writer(f).writerow([row[c] for c in self.columns])
+            f.flush()
+
+    def read(self):
+        df = pd.read_csv(self.path, dtype=str, keep_default_na=False, on_bad_lines="skip")
+        return df[(df[self.columns] != "").all(axis=1)] if len(df) else df
+
+
+def _chunk_id(chunk):
+    return f"{chunk[0].isoformat()}_{chunk[1].isoformat()}"
+
+
+class Backfill:
+    def __init__(self, root, hour_first=HOUR_FIRST, hour_last=HOUR_LAST, delete_granules=False):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.hour_first, self.hour_last = hour_first, hour_last
+        self.delete_granules = delete_granules
+        self.pixel_columns = [f"pixels_{_qc_label(lvl)}" for lvl in QC_LEVELS]
+        self.granules = CsvLog(os.path.join(root, "manifest_granules.csv"),
+                               ["tag", "time", "file", "vcol", "qc_mode"] + self.pixel_columns)
+        self.jobs = CsvLog(os.path.join(root, "manifest_jobs.csv"), ["tag", "chunk", "reduced", "state"])
+        self.combined = os.path.join(root, COMBINED)
+
+        done = self.granules.read()
+        self._done_granules = set(zip(done["tag"], done["file"]))
+        jobs = self.jobs.read()
+        self._done_jobs = set(zip(jobs["tag"], jobs["chunk"]))
+
+    def chunks(self, start, end, days_per_job=DAYS_PER_JOB):
+        """Tramos (primer día, último día) de `days_per_job` días entre start y end"""
+        out, day = [], start
+        while day <= end:
+            last = min(day + dt.timedelta(days=days_per_job - 1), end)
+            out.append((day, last))
+            day = last + dt.timedelta(days=1)
+        return out
+
+    def hours(self, chunk):
+        first, last = chunk
+        hours = pd.date_range(dt.datetime.combine(first, dt.time(self.hour_first)),
+                              dt.datetime.combine(last, dt.time(self.hour_last)), freq="h", tz="UTC")
+        return hours[(hours.hour >= self.hour_first) & (hours.hour <= self.hour_last)]
+
+    def appended_hours(self):
+        if not os.path.exists(self.combined):
+            return pd.DatetimeIndex([], tz="UTC")
+        stamps = pd.read_csv(self.combined, usecols=[0]).iloc[:, 0]
+        return pd.DatetimeIndex(pd.to_datetime(stamps, utc=True, errors="coerce").dropna())
+
+    def jobs_for(self, chunk, tags):
+        """Jobs de Harmony (harmony_jobs.collection_jobs) de las colecciones
+        del tramo aún sin terminar"""
+        from harmony import BBox
+
+        first, last = chunk
+        chunk_id = _chunk_id(chunk)
+        todo = [c for c in collections if c[0] in tags and (c[0], chunk_id) not in self._done_jobs]
+        if not todo:
+            return []
+        # Media hora de margen a cada lado, como START_UTC/STOP_UTC en los scripts
+        start = dt.datetime.combine(first, dt.time(self.hour_first)) - dt.timedelta(minutes=30)
+        stop = dt.datetime.combine(last, dt.time(self.hour_last)) + dt.timedelta(minutes=30)
+        hours = self.hours(chunk)
+        jobs = collection_jobs(todo, BBox(*BBOX), start, stop, hours[0], hours[-1],
+                               os.path.join(self.root, "granules", chunk_id))
+        for job in jobs:
+            job["chunk"] = chunk_id
+            job["key"] = f"{job['tag']} {chunk_id}"
+        return jobs
+
+    def skip(self, job, url):
+        """Granulo ya en el manifiesto: no se descarga"""
+        return (job["tag"], url.rsplit("/", 1)[-1]) in self._done_granules
+
+    def reduce(self, job, files):
+        """Reduce los granulos nuevos de un job, cada uno al manifiesto según
+        termina, y marca el job como terminado"""
+        tag = job["tag"]
+        nc_files = [str(p) for p in files if str(p).lower().endswith((".nc", ".nc4", ".cdf"))]
+        new = [p for p in nc_files if (tag, os.path.basename(p)) not in self._done_granules]
+        for path, mean_val, qc_mode, pixels in reduce_granules(new, job["value_var"], job["qc_var"]):
+            name = os.path.basename(path)
+            self.granules.append({
+                "tag": tag,
+                "time": _extract_ts_from_name(path).isoformat(),
+                "file": name,
+                "vcol": repr(mean_val),
+                "qc_mode": qc_mode,
+                **{f"pixels_{label}": n for label, n in pixels.items()},
+            })
+            self._done_granules.add((tag, name))
+            if self.delete_granules:
+                os.remove(path)
+        self._finish(job, len(new), "done")
+        return len(new)
+
+    def _finish(self, job, reduced, state):
+        self.jobs.append({"tag": job["tag"], "chunk": job["chunk"], "reduced": reduced, "state": state})
+        self._done_jobs.add((job["tag"], job["chunk"]))
+
+    @staticmethod
+    def granule_table(manifest, tag, hours, tol=pd.Timedelta(hours=1)):
+        """Tabla cruda (time, <tag>_vcol, qc_mode, file), como la de
+        tempo_collection.granule_table, con los granulos del manifiesto
+        alrededor de `hours`"""
+        df = manifest[manifest["tag"] == tag]
+        raw = pd.DataFrame({
+            f"{tag}_vcol": df["vcol"].astype(float).to_numpy(),
+            "qc_mode": df["qc_mode"].to_numpy(dtype=object),
+            "file": df["file"].to_numpy(dtype=object),
+        }, index=pd.DatetimeIndex(pd.to_datetime(df["time"], utc=True), name="time"))
+        return raw.sort_index(kind="stable").loc[hours[0] - tol : hours[-1] + tol]
+
+    def append_chunk(self, chunk, tags, appended):
+        """Horas del tramo que no están en `appended` (una columna <tag>_vcol
+        por colección) al final de la combinada; devuelve las añadidas"""
+        hours = self.hours(chunk)
+        manifest = self.granules.read()
+        columns = []
+        for tag in tags:
+            hourly = hourly_alignment(self.granule_table(manifest, tag, hours), tag, hours[0], hours[-1])
+            columns.append(hourly[f"{tag}_vcol"].reindex(hours))
+        frame = pd.concat(columns, axis=1)
+        frame = frame[~frame.index.isin(appended)]  # tramos de otra ejecución que se solapan
+        exists = os.path.exists(self.combined)
+        if exists:
+            header = list(pd.read_csv(self.combined, nrows=0).columns[1:])
+            if header != list(frame.columns):
+                raise ValueError(f"{self.combined} tiene las columnas {header}, no {list(frame.columns)}")
+        frame.to_csv(self.combined, mode="a" if exists else "w", header=not exists, date_format=DATE_FORMAT)
+        return frame.index
+
+    def run(self, client, start, end, tags, days_per_job=DAYS_PER_JOB, chunks_per_run=CHUNKS_PER_RUN,
+            max_downloads=MAX_DOWNLOADS, poll_seconds=POLL_SECONDS):
+        appended = self.appended_hours()
+        chunks = [c for c in self.chunks(start, end, days_per_job) if not self.hours(c).isin(appended).all()]
+        print(f"[INFO] {len(chunks)} tramos pendientes entre {start} y {end}")
+        orchestrator = CollectionOrchestrator(client, max_downloads=max_downloads, poll_seconds=poll_seconds,
+                                              reduce=self.reduce, skip=self.skip)
+        failed = []
+        for i in range(0, len(chunks), chunks_per_run):
+            batch = chunks[i:i + chunks_per_run]
+            jobs = [job for chunk in batch for job in self.jobs_for(chunk, tags)]
+            if jobs:
+                # Los errores ya salen en el log del orquestador; los de "sin
+                # granulos" dejan el job terminado para no relanzarlo siempre
+                _, errors = orchestrator.run(jobs)
+                for job in jobs:
+                    error = errors.get(job["key"])
+                    if error and NO_GRANULES.search(error):
+                        self._finish(job, 0, "no_granules")
+                        print(f"[WARN] {job['key']}: Harmony sin granulos, se añade vacío ({error})")
+            for chunk in batch:
+                missing = [t for t in tags if (t, _chunk_id(chunk)) not in self._done_jobs]
+                if missing:
+                    failed.append(chunk)
+                    print(f"[WARN] Tramo {_chunk_id(chunk)} sin {', '.join(missing)}: queda para la próxima ejecución")
+                    continue
+                added = self.append_chunk(chunk, tags, appended)
+                appended = appended.union(added)
+                print(f"[OK] Tramo {_chunk_id(chunk)}: {len(added)} horas añadidas a {self.combined}")
+        return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", type=dt.date.fromisoformat, required=True, help="primer día (UTC)")
+    parser.add_argument("--end", type=dt.date.fromisoformat, required=True, help="último día (UTC), incluido")
+    parser.add_argument("--output-root", default=os.getenv("TEMPO_BACKFILL_ROOT", "tempo_backfill"))
+    parser.add_argument("--tags", default=",".join(c[0] for c in collections), help="colecciones a procesar")
+    parser.add_argument("--days-per-job", type=int, default=DAYS_PER_JOB)
+    parser.add_argument("--chunks-per-run", type=int, default=CHUNKS_PER_RUN, help="tramos enviados a la vez")
+    parser.add_argument("--max-downloads", type=int, default=MAX_DOWNLOADS)
+    parser.add_argument("--poll-seconds", type=float, default=POLL_SECONDS)
+    parser.add_argument("--delete-granules", action="store_true", help="borrar los NetCDF tras reducirlos")
+    args = parser.parse_args()
+
+    from harmony import Client
+    from harmony.config import Environment
+
+    tags = [t for t in args.tags.split(",") if t]
+    unknown = set(tags) - {c[0] for c in collections}
+    if unknown:
+        raise SystemExit(f"Colecciones desconocidas: {', '.join(sorted(unknown))}")
+    client = Client(env=Environment.PROD, auth=(os.getenv("EARTHDATA_USERNAME"), os.getenv("EARTHDATA_PASSWORD")))
+    backfill = Backfill(args.output_root, delete_granules=args.delete_granules)
+    failed = backfill.run(client, args.start, args.end, tags, args.days_per_job, args.chunks_per_run,
+                          args.max_downloads, args.poll_seconds)
+    if failed:
+        raise SystemExit(f"{len(failed)} tramos incompletos; relanzar el mismo comando para reintentarlos")
+
+
+# Los granulos se reducen en procesos que reimportan este script
+# (tempo_collection.py): sólo se ejecuta al lanzarlo directamente
+if __name__ == "__main__":
+    main()
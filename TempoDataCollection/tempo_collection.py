@@ -0,0 +1,244 @@
+"""Reducción de granulos TEMPO a series horarias, común a los scripts
+HISTORICAL y NRT.
+
+Cada granulo descargado de Harmony se reduce a un valor medio sobre el
+BBOX con la cascada de QC (QC==0, QC<=1, sin QC), y la tabla de granulos se
+alinea a horas en punto con el granulo más cercano dentro de TOL_MINUTES.
+
+Los granulos se reducen en un pool de procesos (TEMPO_REDUCE_WORKERS, por
+defecto un proceso por CPU) y los resultados llegan según terminan. Cada
+proceso abre sólo el grupo de la variable y el flag de QC, en modo lazy:
+del archivo se decodifican únicamente esos dos arrays, no el datatree
+entero.
+
+Los scripts que usan el pool necesitan `if __name__ == "__main__":`: los
+procesos se crean con spawn (el único modo en Windows) y reimportan el
+script principal.
+"""
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+TOL_MINUTES = 50
+QC_LEVELS = [0, 1, None]
+GEOLOCATION = ["geolocation/latitude", "geolocation/longitude"]
+REDUCE_WORKERS = int(os.getenv("TEMPO_REDUCE_WORKERS", os.cpu_count() or 1))
+BLOCK_ROWS = 256  # filas (mirror_step) leídas por bloque al reducir un granulo
+
+_ts_regex = re.compile(r"_(\d{8}T\d{6})Z_")
+_pools = {}
+_pools_lock = threading.Lock()
+_netcdf_lock = threading.Lock()  # netCDF4/HDF5 no admite lecturas desde varios hilos
+
+
+def _open_dtree(path):
+    import datatree as xrdt
+
+    try:
+        return xrdt.open_datatree(path, engine="netcdf4")
+    except Exception:
+        return xrdt.open_datatree(path, engine="h5netcdf")
+
+
+def _open_group(path, group):
+    """Un grupo del NetCDF sin leer datos (xarray carga cada variable al usarla)"""
+    import xarray as xr
+
+    try:
+        return xr.open_dataset(path, group=group, engine="netcdf4")
+    except Exception:
+        return xr.open_dataset(path, group=group, engine="h5netcdf")
+
+
+def _extract_ts_from_name(path):
+    m = _ts_regex.search(os.path.basename(path))
+    if not m:
+        raise ValueError(f"Timestamp not found: {path}")
+    return pd.to_datetime(m.group(1), format="%Y%m%dT%H%M%S", utc=True)
+
+
+def _qc_label(lvl):
+    if lvl is None:
+        return "noQC"
+    return "QC==0" if lvl == 0 else f"QC<={lvl}"
+
+
+def _qc_codes(flags, qc_levels):
+    """Índice del primer nivel que acepta cada píxel (len(qc_levels) si ninguno).
+
+    Los niveles van de más a menos estrictos y cada uno incluye al anterior
+    (QC==0 ⊂ QC<=1 ⊂ sin QC), así que un píxel cuenta para su nivel y todos
+    los siguientes. Un flag NaN sólo entra en el nivel sin QC.
+    """
+    codes = np.full(flags.shape, len(qc_levels), dtype=np.int8)
+    for i in range(len(qc_levels) - 1, -1, -1):
+        lvl = qc_levels[i]
+        if lvl is None:
+            codes[:] = i
+        elif lvl == 0:
+            codes[flags == 0] = i
+        else:
+            codes[flags <= lvl] = i
+    return codes
+
+
+def _qc_cascade(var, qf, qc_levels, block_rows=BLOCK_ROWS):
+    """Cascada de QC en una pasada: suma y número de píxeles válidos por nivel.
+
+    Lee `var` y `qf` (DataArrays, pueden ser lazy) por bloques de filas y
+    acumula con un solo bincount por bloque. Devuelve (media, qc_mode,
+    píxeles por nivel {qc_mode: n}); la media y el nivel son los mismos que
+    probar var.where(...).mean() nivel a nivel.
+    """
+    n_levels = len(qc_levels)
+    sums = np.zeros(n_levels + 1)
+    counts = np.zeros(n_levels + 1, dtype=np.int64)
+    rows = var.shape[0] if var.ndim else 1
+    dim = var.dims[0] if var.ndim else None
+    for start in range(0, rows, block_rows):
+        if dim is None:
+            values, flags = np.atleast_1d(var.values), np.atleast_1d(qf.values)
+        else:
+            block = {dim: slice(start, start + block_rows)}
+            values, flags = var.isel(block).values, qf.isel(block).values
+        values, flags = values.ravel(), np.broadcast_to(flags, values.shape).ravel()
+        valid = ~np.isnan(values)  # mean() de xarray ignora NaN (inf no)
+        codes = _qc_codes(flags[valid], qc_levels)
+        sums += np.bincount(codes, weights=values[valid], minlength=n_levels + 1)
+        counts += np.bincount(codes, minlength=n_levels + 1)
+
+    # Nivel j = sus píxeles y los de los niveles más estrictos
+    level_sums, level_counts = np.cumsum(sums[:n_levels]), np.cumsum(counts[:n_levels])
+    pixels = {_qc_label(lvl): int(n) for lvl, n in zip(qc_levels, level_counts)}
+    for lvl, total, n in zip(qc_levels, level_sums, level_counts):
+        m = float(total / n) if n else float("nan")
+        if np.isfinite(m):
+            return m, _qc_label(lvl), pixels
+    return float("nan"), "NaN", pixels
+
+
+def _mean_with_qc(dtree, value_var, qc_var, qc_levels):
+    mean_val, qc_mode, _ = _qc_cascade(dtree[value_var], dtree[qc_var], qc_levels)
+    return mean_val, qc_mode
+
+
+def reduce_granule(path, value_var, qc_var, qc_levels=QC_LEVELS):
+    """(path, media, qc_mode, píxeles por nivel) de un granulo, abriendo sólo
+    los grupos de `value_var` y `qc_var` ("grupo/variable")"""
+    datasets, arrays = {}, {}
+    try:
+        for full in (value_var, qc_var):
+            group, name = full.rsplit("/", 1) if "/" in full else (None, full)
+            if group not in datasets:
+                datasets[group] = _open_group(path, group)
+            arrays[full] = datasets[group][name]
+        mean_val, qc_mode, pixels = _qc_cascade(arrays[value_var], arrays[qc_var], qc_levels)
+    finally:
+        for ds in datasets.values():
+            ds.close()
+    return path, mean_val, qc_mode, pixels
+
+
+def reduction_pool(workers):
+    """Pool de procesos compartido (también entre los hilos del orquestador)"""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pools[workers]
+
+
+def reduce_granules(paths, value_var, qc_var, qc_levels=QC_LEVELS, workers=None):
+    """Genera (path, media, qc_mode, píxeles por nivel) de cada granulo según terminan"""
+    workers = REDUCE_WORKERS if workers is None else workers
+    if workers <= 1 or len(paths) <= 1:
+        # En este proceso: los hilos del orquestador reducen de uno en uno
+        for p in paths:
+            with _netcdf_lock:
+                result = reduce_granule(p, value_var, qc_var, qc_levels)
+            yield result
+        return
+    pool = reduction_pool(workers)
+    futures = [pool.submit(reduce_granule, p, value_var, qc_var, qc_levels) for p in paths]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def granule_table(tag, files, value_var, qc_var, qc_levels=QC_LEVELS, workers=None):
+    """Un registro (time, <tag>_vcol, qc_mode, file, pixels_<nivel>...) por
+    granulo NetCDF; pixels_<nivel> son los píxeles válidos de cada nivel de QC
+    (para ponderar)"""
+    nc_files = [str(p) for p in files if str(p).lower().endswith((".nc", ".nc4", ".cdf"))]
+    if not nc_files:
+        raise RuntimeError(f"No NetCDF files for {tag}")
+
+    reduced = {p: rest for p, *rest in reduce_granules(nc_files, value_var, qc_var, qc_levels, workers)}
+    # En el orden de los archivos, como antes del pool (sort_index no es estable)
+    records = []
+    for p in nc_files:
+        mean_val, qc_mode, pixels = reduced[p]
+        records.append({
+            "time": _extract_ts_from_name(p),
+            f"{tag}_vcol": mean_val,
+            "qc_mode": qc_mode,
+            "file": os.path.basename(p),
+            **{f"pixels_{label}": n for label, n in pixels.items()},
+        })
+    return pd.DataFrame(records).set_index("time").sort_index()
+
+
+def hourly_alignment(df_raw, tag, hour_start, hour_stop, tol_minutes=TOL_MINUTES):
+    """Granulo más cercano a cada hora en punto dentro de la tolerancia.
+
+    Un solo merge_asof(direction="nearest") sobre la tabla ordenada: en un
+    empate gana el granulo anterior y, con timestamps repetidos, el primero
+    (lo mismo que elegía el argmin hora a hora).
+    """
+    hours = pd.date_range(hour_start, hour_stop, freq="h", tz="UTC")
+    raw = df_raw.sort_index(kind="stable")
+    raw = raw[~raw.index.duplicated(keep="first")]
+    granules = pd.DataFrame({
+        "source_time": raw.index.tz_convert("UTC").as_unit(hours.unit),
+        f"{tag}_vcol": raw[f"{tag}_vcol"].to_numpy(dtype=float),
+        "source_file": raw["file"].to_numpy(dtype=object),
+        "qc_mode": raw["qc_mode"].to_numpy(dtype=object),
+    })
+    picked = pd.merge_asof(pd.DataFrame({"hour": hours}), granules, left_on="hour",
+                           right_on="source_time", direction="nearest",
+                           tolerance=pd.Timedelta(minutes=tol_minutes))
+
+    vals = picked[f"{tag}_vcol"].to_numpy()
+    return pd.DataFrame({
+        f"{tag}_vcol": vals,
+        "source_time": picked["source_time"].array,
+        "source_file": picked["source_file"].fillna("").to_numpy(),
+        "qc_mode": picked["qc_mode"].fillna("NA").to_numpy(),
+        "filled": np.where(pd.notna(vals), 1, 0)
+    }, index=hours)
+
+
+def reduce_collection(job, files):
+    """Granulos descargados de un job -> CSV crudo y horario en job["out_dir"].
+
+    `job` lleva tag, value_var, qc_var, out_dir, hour_start y hour_stop.
+    Devuelve el DataFrame horario.
+    """
+    tag, out_dir = job["tag"], job["out_dir"]
+    df_raw = granule_table(tag, files, job["value_var"], job["qc_var"])
+    csv_raw = os.path.join(out_dir, f"dc_{tag.lower()}_granules_raw.csv")
+    df_raw.to_csv(csv_raw)
+    print(f"[OK] CSV crudo guardado: {csv_raw}")
+
+    df_hourly = hourly_alignment(df_raw, tag, job["hour_start"], job["hour_stop"])
+    csv_hourly = os.path.join(out_dir, f"dc_{tag.lower()}_hourly.csv")
+    df_hourly.to_csv(csv_hourly)
+    print(f"[OK] CSV horario guardado: {csv_hourly}")
+    return df_hourly
@@ -40,6 +40,35 @@ router.post('/predict', async (req, res) => {
   }
 });
 
+/**
+ * Predicción para varias ubicaciones en una sola llamada al modelo ML
+ */
+router.post('/predict/batch', async (req, res) => {
+  try {
+    const { locations, hours_ahead = 24 } = req.body;
+
+    if (!Array.isArray(locations) || locations.length === 0) {
+      return res.status(400).json({
+        success: false,
+        error: 'locations must be a non-empty array of { latitude, longitude }'
+      });
+    }
+
+    const response = await axios.post(`${ML_API_URL}/predict/batch`, {
+      locations,
+      hours_ahead
+    }, { timeout: 60000 });
+
+    return res.json(response.data);
+  } catch (error) {
+    console.error('Error in batch predict route:', error.message);
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: error.response?.data?.detail || 'Prediction service unavailable'
+    });
+  }
+});
+
 /**
  * Obtiene datos históricos del día actual
  */
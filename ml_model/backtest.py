@@ -0,0 +1,148 @@
+"""Backtest de origen móvil: el pronóstico de producción desde cada hora del
+periodo de test.
+
+Todos los orígenes avanzan a la vez en un solo forecast_batch (un predict de
+N filas por hora de horizonte en el modo recursivo), con los históricos
+cargados como matriz (N, capacity) sin recorrer la serie origen a origen.
+Informa MAE/RMSE/sesgo por horizonte junto a la persistencia (último valor
+conocido) como referencia.
+
+Uso (desde ml_model/, con el modelo activo o MODEL_PATH):
+    python backtest.py --days 30 --hours 24
+    python backtest.py --start 2025-06-01 --end 2025-07-01 --output backtest.json
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from downloader import load_open_meteo
+from forecast_engine import DirectForecaster, RecursiveForecaster
+from history_store import AQ_URL, DEFAULT_ROOT, HistoryStore
+from model_meta import current_model_path, load_meta
+from tree_eval import compile_model
+
+LAT, LON = 38.8951, -77.0364
+TARGET = "pm2_5"
+
+
+def rolling_origin(forecaster, y, origins, hours_ahead=24, batch=4096):
+    """Pronóstico desde cada origen de `origins` (primera hora pronosticada).
+
+    `y` es la serie horaria continua (asfreq("h")). Se descartan los orígenes
+    sin `capacity` horas de historia completas. Devuelve (orígenes usados,
+    predicción (N, hours_ahead), verdad (N, hours_ahead) con NaN donde falte).
+    """
+    values = y.to_numpy(dtype=float)
+    pos = y.index.get_indexer(pd.DatetimeIndex(origins))
+    cap = forecaster.capacity
+    pos = pos[pos >= cap]
+    # Historia de `cap` horas antes de cada origen y las horas pronosticadas
+    windows = sliding_window_view(values, cap)
+    pos = pos[~np.isnan(windows[pos - cap]).any(axis=1)]
+    windows = windows[pos - cap]
+    padded = np.concatenate([values, np.full(hours_ahead, np.nan)])
+    truth = sliding_window_view(padded, hours_ahead)[pos]
+
+    starts = y.index[pos]
+    pred = np.empty((len(pos), hours_ahead))
+    for i in range(0, len(pos), batch):
+        part = slice(i, i + batch)
+        pred[part] = forecaster.forecast_batch(windows[part], starts[part], hours_ahead)
+    return starts, pred, truth
+
+
+def error_by_horizon(pred, truth):
+    """MAE, RMSE y sesgo por horizonte ignorando las horas sin verdad"""
+    err = pred - truth
+    count = (~np.isnan(err)).sum(axis=0)
+    return {
+        "mae_by_horizon": np.nanmean(np.abs(err), axis=0).round(4).tolist(),
+        "rmse_by_horizon": np.sqrt(np.nanmean(err ** 2, axis=0)).round(4).tolist(),
+        "bias_by_horizon": np.nanmean(err, axis=0).round(4).tolist(),
+        "count_by_horizon": count.tolist(),
+        "mae": float(np.nanmean(np.abs(err))),
+        "rmse": float(np.sqrt(np.nanmean(err ** 2))),
+    }
+
+
+def backtest(forecaster, y, origins, hours_ahead=24):
+    """Error por horizonte del forecaster y de la persistencia"""
+    t0 = time.perf_counter()
+    starts, pred, truth = rolling_origin(forecaster, y, origins, hours_ahead)
+    if not len(starts):
+        raise ValueError("No hay orígenes con historia completa. Revisa fechas.")
+    seconds = time.perf_counter() - t0
+    last = y.to_numpy(dtype=float)[y.index.get_indexer(starts) - 1]
+    return {
+        "origins": len(starts),
+        "hours_ahead": hours_ahead,
+        "seconds": seconds,
+        "model": error_by_horizon(pred, truth),
+        "persistence": error_by_horizon(np.repeat(last[:, None], hours_ahead, axis=1), truth),
+    }
+
+
+def load_forecaster(path):
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+    meta = load_meta(path)
+    lags, wins = meta.get("lags"), meta.get("wins")
+    kwargs = {"lags": lags, "wins": wins} if lags and wins else {}
+    if meta.get("mode") == "direct":
+        return DirectForecaster(compile_model(model), horizons=meta["horizons"], **kwargs), meta
+    return RecursiveForecaster(compile_model(model), **kwargs), meta
+
+
+def print_report(result, every=6):
+    m, p = result["model"], result["persistence"]
+    print(f"{result['origins']} orígenes x {result['hours_ahead']} h en {result['seconds']:.2f}s")
+    print(f"{'h':>4} {'MAE':>7} {'RMSE':>7} {'sesgo':>7} {'MAE pers':>9}")
+    for h in range(result["hours_ahead"]):
+        if h == 0 or (h + 1) % every == 0:
+            print(f"{h + 1:>4} {m['mae_by_horizon'][h]:>7.3f} {m['rmse_by_horizon'][h]:>7.3f} "
+                  f"{m['bias_by_horizon'][h]:>7.3f} {p['mae_by_horizon'][h]:>9.3f}")
+    print(f"{'todo':>4} {m['mae']:>7.3f} {m['rmse']:>7.3f} {'':>7} {p['mae']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None,
+                        help="model.pkl; por defecto MODEL_PATH o la versión activa de MODELS_DIR")
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--days", type=float, default=30, help="días de test hasta --end")
+    parser.add_argument("--start", default=None, help="primer origen (UTC); por defecto --end menos --days")
+    parser.add_argument("--end", default=None, help="fin exclusivo (UTC); por defecto la hora actual")
+    parser.add_argument("--output", default=None, help="JSON con el resultado completo")
+    args = parser.parse_args()
+
+    path = (args.model or os.getenv("MODEL_PATH")
+            or current_model_path(os.getenv("MODELS_DIR", "models")) or "trained_model.pkl")
+    forecaster, meta = load_forecaster(path)
+    hours = min(args.hours, forecaster.horizons) if isinstance(forecaster, DirectForecaster) else args.hours
+
+    end = pd.Timestamp(args.end, tz="UTC") if args.end else pd.Timestamp.now(tz="UTC").floor("h")
+    first = pd.Timestamp(args.start, tz="UTC") if args.start else end - pd.Timedelta(days=args.days)
+    # Historia suficiente para el primer origen
+    begin = first - pd.Timedelta(hours=forecaster.capacity + 24)
+    store = HistoryStore(os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+    y = load_open_meteo(store, "air_quality", AQ_URL, LAT, LON, [TARGET], begin, end)[TARGET]
+    # Mismo saneo del objetivo que train_and_save.py
+    y = y.asfreq("h").ffill(limit=3).bfill(limit=1)
+
+    result = backtest(forecaster, y, y.index[y.index >= first], hours)
+    result.update(model_path=path, mode=meta.get("mode", "recursive"))
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Tiempo de construcción de la matriz de entrenamiento con features.py.
+
+Historia horaria sintética de varios años para varias estaciones:
+- pandas: shift/rolling columna a columna (como hacía train_and_save.py)
+- lotes: feature_matrix (arrays contiguos + ventanas con strides)
+- streaming: RollingFeatures avanzando todas las estaciones a la vez
+
+Uso (desde ml_model/):
+    python benchmarks/bench_features.py
+    python benchmarks/bench_features.py --years 5 --sites 16
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from features import (  # noqa: E402
+    CALENDAR, LAGS, WINS, RollingFeatures, feature_matrix, feature_names,
+)
+
+
+def synthetic_sites(years, sites, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2020-01-01", periods=int(years * 8760), freq="h", tz="UTC")
+    hour = idx.hour.to_numpy()
+    series = []
+    for s in range(sites):
+        daily = 8 + 4 * np.sin(2 * np.pi * (hour + s) / 24)
+        y = daily + rng.gamma(2.0, 1.5, len(idx))
+        # Algunos huecos, como los que deja ffill(limit=3)
+        y[rng.choice(len(idx), len(idx) // 500, replace=False)] = np.nan
+        series.append(pd.Series(y, index=idx))
+    return series
+
+
+def pandas_features(y):
+    dfm = pd.DataFrame(index=y.index)
+    dfm["hour"] = dfm.index.hour
+    dfm["dow"] = dfm.index.dayofweek
+    dfm["sin_hour"] = np.sin(2*np.pi*dfm["hour"]/24)
+    dfm["cos_hour"] = np.cos(2*np.pi*dfm["hour"]/24)
+    dfm["sin_dow"] = np.sin(2*np.pi*dfm["dow"]/7)
+    dfm["cos_dow"] = np.cos(2*np.pi*dfm["dow"]/7)
+    for L in LAGS:
+        dfm[f"lag_{L}"] = y.shift(L)
+    for w in WINS:
+        dfm[f"roll_mean_{w}"] = y.rolling(w).mean()
+        dfm[f"roll_std_{w}"] = y.rolling(w).std()
+    return dfm[feature_names()].to_numpy()
+
+
+def streaming_features(series):
+    values = np.column_stack([s.to_numpy() for s in series])
+    rolling = RollingFeatures(n_series=len(series))
+    out = np.empty((len(values), len(series), rolling.n_features))
+    for i in range(len(values)):
+        rolling.append(values[i])
+        rolling.features(out[i])
+    return out
+
+
+def max_diff(a, b):
+    same_nan = np.array_equal(np.isnan(a), np.isnan(b))
+    return float(np.nanmax(np.abs(a - b))), same_nan
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--sites", type=int, default=8)
+    parser.add_argument("--skip-streaming", action="store_true")
+    args = parser.parse_args()
+
+    series = synthetic_sites(args.years, args.sites)
+    rows = len(series[0]) * len(series)
+    print(f"{args.sites} estaciones x {len(series[0])} horas = {rows} filas, {len(feature_names())} features")
+
+    t0 = time.perf_counter()
+    ref = [pandas_features(y) for y in series]
+    t_pandas = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = [feature_matrix(y.to_numpy(), y.index) for y in series]
+    t_batch = time.perf_counter() - t0
+
+    print(f"{'modo':<12} {'s':>8} {'filas/s':>12} {'max |dif|':>10} {'NaN igual':>10}")
+    print(f"{'pandas':<12} {t_pandas:>8.3f} {rows / t_pandas:>12.0f}")
+    diff, same = max_diff(np.vstack(ref), np.vstack(batch))
+    print(f"{'lotes':<12} {t_batch:>8.3f} {rows / t_batch:>12.0f} {diff:>10.2e} {str(same):>10}")
+
+    if not args.skip_streaming:
+        t0 = time.perf_counter()
+        stream = streaming_features(series)
+        t_stream = time.perf_counter() - t0
+        # El streaming no lleva calendario ni marca la historia incompleta
+        # con NaN; se compara donde todas las ventanas y lags están llenos
+        warm = max(max(LAGS), max(WINS))
+        n_cal = len(CALENDAR)
+        a = np.vstack([b[warm:, n_cal:] for b in batch])
+        b = np.vstack([stream[warm:, s] for s in range(len(series))])
+        diff, same = max_diff(a, b)
+        print(f"{'streaming':<12} {t_stream:>8.3f} {rows / t_stream:>12.0f} {diff:>10.2e} {str(same):>10}")
+
+
+if __name__ == "__main__":
+    main()
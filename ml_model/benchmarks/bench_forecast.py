@@ -0,0 +1,138 @@
+"""Compara el pronóstico recursivo original (prepare_features + DataFrame)
+con RecursiveForecaster sobre trained_model.pkl.
+
+Uso (desde ml_model/):  python benchmarks/bench_forecast.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from model_server import load_current, target  # noqa: E402
+from features import FEATURES, LAGS, WINS  # noqa: E402
+from forecast_engine import RecursiveForecaster  # noqa: E402
+from tree_eval import FlatTreeModel  # noqa: E402
+
+model = load_current()[0]
+
+HORIZONS = [24, 72, 168]
+REPEATS = 5
+
+
+def synthetic_history(hours=168, seed=0):
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.now(tz="UTC").floor("h")
+    idx = pd.date_range(end - pd.Timedelta(hours=hours - 1), periods=hours, freq="h")
+    daily = 8 + 4 * np.sin(2 * np.pi * idx.hour.to_numpy() / 24)
+    return pd.Series(daily + rng.gamma(2.0, 1.5, hours), index=idx, name=target)
+
+
+def prepare_features(t, series_ext, lags=LAGS, wins=WINS):
+    """Versión original de model_server, fila a fila con dicts (referencia):
+    la hora t se predice con las features de la hora anterior"""
+    origin = t - pd.Timedelta(hours=1)
+    features = {
+        "hour": origin.hour,
+        "dow": origin.dayofweek,
+        "sin_hour": np.sin(2*np.pi*origin.hour/24),
+        "cos_hour": np.cos(2*np.pi*origin.hour/24),
+        "sin_dow": np.sin(2*np.pi*origin.dayofweek/7),
+        "cos_dow": np.cos(2*np.pi*origin.dayofweek/7),
+    }
+    
+    # Lags
+    for L in lags:
+        lag_time = origin - pd.Timedelta(hours=L)
+        # Redondear a hora completa
+        lag_time = lag_time.floor('h')
+        
+        if lag_time in series_ext.index:
+            features[f"lag_{L}"] = series_ext.loc[lag_time]
+        else:
+            features[f"lag_{L}"] = series_ext.iloc[-1] if len(series_ext) > 0 else 0
+    
+    # Rolling windows
+    for w in wins:
+        window_start = t - pd.Timedelta(hours=w)
+        window_end = t - pd.Timedelta(hours=1)
+        # Redondear a horas completas
+        window_start = window_start.floor('h')
+        window_end = window_end.floor('h')
+        
+        try:
+            # Usar fechas exactas disponibles en el índice
+            available_times = series_ext.loc[window_start:window_end]
+            if len(available_times) > 0:
+                features[f"roll_mean_{w}"] = available_times.mean()
+                features[f"roll_std_{w}"] = available_times.std()
+            else:
+                features[f"roll_mean_{w}"] = series_ext.iloc[-1] if len(series_ext) > 0 else 0
+                features[f"roll_std_{w}"] = 0
+        except:
+            features[f"roll_mean_{w}"] = series_ext.iloc[-1] if len(series_ext) > 0 else 0
+            features[f"roll_std_{w}"] = 0
+    
+    return features
+
+
+def legacy_forecast(series, hours_ahead):
+    series_ext = series.copy()
+    future_times = pd.date_range(series.index[-1] + pd.Timedelta(hours=1),
+                                 periods=hours_ahead, freq="h")
+    out = []
+    for t in future_times:
+        features = prepare_features(t, series_ext)
+        X_row = pd.DataFrame([features], index=[t])
+        y_hat = max(0, model.predict(X_row)[0])
+        series_ext.loc[t] = y_hat
+        out.append(y_hat)
+    return np.array(out)
+
+
+def model_only(hours_ahead):
+    x = np.zeros((1, len(FEATURES)))
+    for _ in range(hours_ahead):
+        model.predict(x)
+
+
+def best_of(fn, *args):
+    times = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000
+
+
+def main():
+    if model is None:
+        sys.exit("No se pudo cargar el modelo (ejecutar desde ml_model/)")
+
+    series = synthetic_history()
+    engine = RecursiveForecaster(model)
+    flat_engine = RecursiveForecaster(FlatTreeModel(model))
+    start = series.index[-1] + pd.Timedelta(hours=1)
+    history = series.to_numpy()
+
+    print(f"{'horas':>6} {'original ms':>12} {'engine ms':>10} {'solo modelo ms':>15} {'speedup':>8} "
+          f"{'max |dif|':>10} {'engine+plano ms':>16}")
+    for h in HORIZONS:
+        ref = legacy_forecast(series, h)
+        new = engine.forecast(history, start, h)
+        diff = float(np.max(np.abs(ref - new)))
+        diff = max(diff, float(np.max(np.abs(ref - flat_engine.forecast(history, start, h)))))
+
+        t_old = best_of(legacy_forecast, series, h)
+        t_new = best_of(engine.forecast, history, start, h)
+        t_model = best_of(model_only, h)
+        t_flat = best_of(flat_engine.forecast, history, start, h)
+        print(f"{h:>6} {t_old:>12.1f} {t_new:>10.1f} {t_model:>15.1f} {t_old / t_new:>7.1f}x "
+              f"{diff:>10.2e} {t_flat:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
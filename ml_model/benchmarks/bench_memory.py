@@ -0,0 +1,110 @@
+"""Memoria pico, tiempo de ajuste y error con tablas float64 frente a float32.
+
+Cada configuración corre en un proceso nuevo (spawn) para que el pico de
+memoria (ru_maxrss) sea sólo suyo: serie sintética de varios años, features
+(features.py), tabla del modo directo si toca y el ajuste completo de
+retrain.py con los 30 últimos días como test.
+
+Uso (desde ml_model/):
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --years 5 --mode direct --horizons 24
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from features import feature_frame, fit_table, stack_horizons  # noqa: E402
+from retrain import full_model  # noqa: E402
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_target(years, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2020-01-01", periods=int(years * 8760), freq="h", tz="UTC")
+    hour = idx.hour.to_numpy()
+    # Ciclo diario + AR(1) para que lags y ventanas tengan señal
+    noise = rng.normal(0, 1.5, len(idx))
+    ar = np.empty(len(idx))
+    ar[0] = 0
+    for i in range(1, len(idx)):
+        ar[i] = 0.9 * ar[i - 1] + noise[i]
+    y = np.maximum(8 + 4 * np.sin(2 * np.pi * hour / 24) + ar, 0)
+    return pd.Series(y.astype(dtype), index=idx)
+
+
+def run(config):
+    dtype = np.dtype(config["dtype"])
+    base = peak_mb()
+    t0 = time.perf_counter()
+    y = synthetic_target(config["years"], dtype)
+    dfm = feature_frame(y, dtype=dtype)
+    dfm["y_next"] = y.shift(-1)
+    dfm = dfm.dropna()
+    split = dfm.index.max() - pd.Timedelta(days=30)
+    train, test = dfm.loc[:split], dfm.loc[split + pd.Timedelta(hours=1):]
+    X_train, X_test = train.drop(columns="y_next"), test.drop(columns="y_next")
+    y_train = train["y_next"].to_numpy()
+    del dfm, train
+    if config["mode"] == "direct":
+        X_fit, y_fit = stack_horizons(X_train, y.loc[:split], config["horizons"])
+        X_eval, y_eval = stack_horizons(X_test, y, config["horizons"])
+    else:
+        X_fit, y_fit = X_train, y_train
+        X_eval, y_eval = X_test, test["y_next"].to_numpy()
+    build_seconds = time.perf_counter() - t0
+    table_mb = X_fit.memory_usage(index=False).sum() / 2**20
+    build_peak = peak_mb()
+
+    t0 = time.perf_counter()
+    X_fit = fit_table(X_fit)
+    model = full_model(X_fit, y_fit)
+    fit_seconds = time.perf_counter() - t0
+    err = model.predict(X_eval) - y_eval
+    return {
+        **config,
+        "rows": len(y_fit),
+        "table_mb": table_mb,
+        "build_seconds": build_seconds,
+        "fit_seconds": fit_seconds,
+        "build_peak_mb": build_peak - base,
+        "peak_mb": peak_mb() - base,
+        "mae": float(np.abs(err).mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--mode", choices=["recursive", "direct", "both"], default="both")
+    parser.add_argument("--horizons", type=int, default=24)
+    args = parser.parse_args()
+
+    modes = ["recursive", "direct"] if args.mode == "both" else [args.mode]
+    configs = [{"years": args.years, "mode": mode, "horizons": args.horizons, "dtype": dtype}
+               for mode in modes for dtype in ("float64", "float32")]
+
+    print(f"{'modo':<10} {'dtype':<8} {'filas':>9} {'tabla MB':>9} {'pico tabla':>11} {'pico MB':>8} "
+          f"{'tabla s':>8} {'ajuste s':>9} {'MAE':>7}")
+    ctx = multiprocessing.get_context("spawn")
+    for config in configs:
+        with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            r = pool.submit(run, config).result()
+        print(f"{r['mode']:<10} {r['dtype']:<8} {r['rows']:>9} {r['table_mb']:>9.1f} {r['build_peak_mb']:>11.0f} "
+              f"{r['peak_mb']:>8.0f} {r['build_seconds']:>8.2f} {r['fit_seconds']:>9.2f} {r['mae']:>7.4f}")
+    print("(pico = ru_maxrss del proceso menos el de arranque con las librerías importadas)")
+
+
+if __name__ == "__main__":
+    main()
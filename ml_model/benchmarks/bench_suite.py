@@ -0,0 +1,232 @@
+"""Benchmark reproducible del servidor de modelo, sin red.
+
+1. Componentes aislados: prepare_features, history_to_array, el bucle de
+   pronóstico (sklearn y evaluador plano) y una predicción de una fila.
+2. Carga: arranca fake_upstream.py en un hilo y model_server.py en un
+   subproceso apuntando a él, y lanza /predict a concurrencia fija. Por
+   nivel reporta throughput, p50/p95/p99 y CPU/memoria del servidor.
+
+Uso (desde ml_model/):
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --concurrency 1,8,32 --delay 0.2 --fail-rate 0.05 --json out.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ML_DIR = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+sys.path.insert(0, ML_DIR)
+
+from fake_upstream import make_app, serve_in_thread  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# ---------- Componentes ----------
+
+def time_call(fn, *args, repeats=50):
+    fn(*args)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - t0) / repeats
+
+
+def bench_components():
+    import pandas as pd
+    from bench_forecast import model, prepare_features, synthetic_history
+    from forecast_engine import RecursiveForecaster, history_to_array
+    from tree_eval import FlatTreeModel
+
+    series = synthetic_history()
+    history = series.to_numpy()
+    t = series.index[-1] + pd.Timedelta(hours=1)
+    raw = {k.tz_localize(None): v for k, v in series.items()}
+    flat = FlatTreeModel(model)
+    x = np.zeros((1, flat.n_features_in_))
+
+    results = {
+        "prepare_features (1 paso)": time_call(prepare_features, t, series),
+        "history_to_array": time_call(history_to_array, raw, t),
+        "pronóstico 24 h (sklearn)": time_call(RecursiveForecaster(model).forecast, history, t, 24, repeats=5),
+        "pronóstico 24 h (plano)": time_call(RecursiveForecaster(flat).forecast, history, t, 24, repeats=20),
+        "predict 1 fila (sklearn)": time_call(model.predict, x),
+        "predict 1 fila (plano)": time_call(flat.predict, x),
+    }
+    print("\nComponentes")
+    for name, secs in results.items():
+        print(f"  {name:<28} {secs * 1e6:>10.1f} µs")
+    return {k: v * 1e6 for k, v in results.items()}
+
+
+# ---------- Carga ----------
+
+class ProcessStats:
+    """CPU (s) y memoria (bytes) de un proceso: psutil o /proc en Linux."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.proc = psutil.Process(pid) if psutil else None
+
+    def cpu(self):
+        if self.proc:
+            t = self.proc.cpu_times()
+            return t.user + t.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss(self):
+        if self.proc:
+            return self.proc.memory_info().rss
+        return self._status("VmRSS:")
+
+    def peak_rss(self):
+        if self.proc:
+            info = self.proc.memory_info()
+            return getattr(info, "peak_wset", None) or info.rss
+        return self._status("VmHWM:")
+
+    def _status(self, key):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+
+def start_server(port, upstream_port, args):
+    env = dict(os.environ)
+    env.update({
+        "OPEN_METEO_AQ_URL": f"http://127.0.0.1:{upstream_port}/v1/air-quality",
+        "FORECAST_STORE_ENABLED": "1" if args.store else "0",
+        "CACHE_MAX_MB": "64" if args.cache else "0",
+        "INFERENCE_MODE": args.inference_mode,
+        "UPSTREAM_RETRIES": str(args.retries),
+    })
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "model_server:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ML_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            # /health responde antes de cargar el modelo; /ready cuando ya está
+            if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("El servidor de modelo no arrancó")
+
+
+async def drive(port, concurrency, duration, n_locations):
+    url = f"http://127.0.0.1:{port}/predict"
+    latencies, errors = [], 0
+    stop = time.perf_counter() + duration
+    counter = 0
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal errors, counter
+            while time.perf_counter() < stop:
+                i = counter % n_locations
+                counter += 1
+                # Ubicaciones en celdas distintas de la rejilla
+                body = {"latitude": 20 + (i % 40) * 0.5, "longitude": -120 + (i // 40) * 0.5, "hours_ahead": 24}
+                t0 = time.perf_counter()
+                r = await client.post(url, json=body)
+                if r.status_code == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def bench_load(args):
+    upstream = make_app(delay=args.delay, jitter=args.jitter, fail_rate=args.fail_rate, seed=0)
+    serve_in_thread(upstream, args.upstream_port)
+    proc = start_server(args.port, args.upstream_port, args)
+    stats = ProcessStats(proc.pid)
+    rows = []
+    try:
+        print(f"\nCarga: retardo upstream={args.delay}s (+{args.jitter}s jitter), fallos={args.fail_rate:.0%}, "
+              f"ubicaciones={args.locations}, inferencia={args.inference_mode}")
+        print(f"{'conc':>5} {'req/s':>7} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'CPU ms/req':>10} {'RSS MB':>7} {'pico MB':>8}")
+        for c in [int(x) for x in args.concurrency.split(",")]:
+            cpu0, t0 = stats.cpu(), time.perf_counter()
+            latencies, errors = asyncio.run(drive(args.port, c, args.duration, args.locations))
+            elapsed = time.perf_counter() - t0
+            cpu = stats.cpu() - cpu0
+            done = max(len(latencies), 1)
+            lat = np.asarray(latencies) * 1000 if latencies else np.array([np.nan])
+            row = {
+                "concurrency": c,
+                "throughput": len(latencies) / elapsed,
+                "errors": errors,
+                "p50_ms": float(np.percentile(lat, 50)),
+                "p95_ms": float(np.percentile(lat, 95)),
+                "p99_ms": float(np.percentile(lat, 99)),
+                "cpu_ms_per_request": cpu * 1000 / done,
+                "rss_mb": stats.rss() / 2**20,
+                "peak_rss_mb": stats.peak_rss() / 2**20,
+            }
+            rows.append(row)
+            print(f"{c:>5} {row['throughput']:>7.1f} {errors:>5} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                  f"{row['p99_ms']:>8.1f} {row['cpu_ms_per_request']:>10.2f} {row['rss_mb']:>7.1f} "
+                  f"{row['peak_rss_mb']:>8.1f}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--delay", type=float, default=0.05, help="retardo base del upstream (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--cache", action="store_true", help="dejar activa la caché de Open-Meteo")
+    parser.add_argument("--store", action="store_true", help="dejar activos los pronósticos precalculados")
+    parser.add_argument("--inference-mode", default="thread")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--upstream-port", type=int, default=8101)
+    parser.add_argument("--skip-components", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    results = {}
+    if not args.skip_components:
+        results["components_us"] = bench_components()
+    if not args.skip_load:
+        results["load"] = bench_load(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Resultados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
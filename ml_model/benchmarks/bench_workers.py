@@ -0,0 +1,53 @@
+"""Throughput de pronósticos de 24 h según el modo y el número de workers
+del InferencePool (sin HTTP ni upstream).
+
+Uso (desde ml_model/):  python benchmarks/bench_workers.py [--jobs 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from model_server import load_current  # noqa: E402
+from inference import InferencePool  # noqa: E402
+
+
+async def drive(pool, jobs, history, start):
+    await asyncio.gather(*(pool.forecast_batch([history], start, 24) for _ in range(jobs)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+    forecaster = load_current()[2]
+    if forecaster is None:
+        sys.exit("No se pudo cargar el modelo (ejecutar desde ml_model/)")
+
+    rng = np.random.default_rng(0)
+    history = 8 + rng.gamma(2.0, 1.5, 168)
+    start = pd.Timestamp.now(tz="UTC").floor("h")
+
+    print(f"CPUs={os.cpu_count()}  trabajos={args.jobs} (pronóstico de 24 h cada uno)")
+    print(f"{'modo':>8} {'workers':>8} {'pron/s':>8}")
+    configs = [("inline", 1)] + [(m, int(w)) for m in ("thread", "process") for w in args.workers.split(",")]
+    for mode, workers in configs:
+        pool = InferencePool(mode, workers=workers, queue_size=args.jobs)
+        pool.start(forecaster)
+        asyncio.run(drive(pool, workers, history, start))  # calentamiento
+        t0 = time.perf_counter()
+        asyncio.run(drive(pool, args.jobs, history, start))
+        elapsed = time.perf_counter() - t0
+        pool.shutdown()
+        print(f"{mode:>8} {workers:>8} {args.jobs / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Verifica que FlatTreeModel coincide con model.predict sobre la tabla de
+features de entrenamiento (misma construcción que train_and_save.py).
+
+Uso (desde ml_model/):
+    python benchmarks/check_tree_parity.py --synthetic      # sin red: serie sintética con huecos
+    python benchmarks/check_tree_parity.py                # descarga Open-Meteo
+    python benchmarks/check_tree_parity.py --csv serie.csv  # columnas time, pm2_5
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from features import feature_frame, fit_table  # noqa: E402
+from tree_eval import FlatTreeModel  # noqa: E402
+
+ATOL = 1e-9
+
+
+def download_series(lat=38.8951, lon=-77.0364, start="2024-06-01", end="2025-10-03"):
+    r = requests.get("https://air-quality-api.open-meteo.com/v1/air-quality", params={
+        "latitude": lat, "longitude": lon,
+        "start_date": start, "end_date": end, "hourly": "pm2_5",
+    }, timeout=60)
+    r.raise_for_status()
+    hourly = r.json()["hourly"]
+    return pd.Series(hourly["pm2_5"], index=pd.to_datetime(hourly["time"]), name="pm2_5")
+
+
+def synthetic_series(hours=24 * 90, seed=0, gap_fraction=0.02):
+    """Ciclo diario + ruido gamma, como bench_forecast.synthetic_history, con
+    huecos NaN para que la tabla tenga filas con features ausentes"""
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2025-01-01", periods=hours, freq="h", tz="UTC")
+    daily = 8 + 4 * np.sin(2 * np.pi * idx.hour.to_numpy() / 24)
+    y = daily + rng.gamma(2.0, 1.5, hours)
+    y[rng.random(hours) < gap_fraction] = np.nan
+    return pd.Series(y, index=idx, name="pm2_5")
+
+
+def synthetic_table(hours=24 * 90, seed=0):
+    """feature_frame sin dropna: incluye las filas con NaN (arranque de lags
+    y ventanas y huecos de la serie), que los árboles mandan por la rama de
+    valores ausentes"""
+    X = fit_table(feature_frame(synthetic_series(hours, seed)))
+    assert X.isna().any(axis=1).any()
+    return X
+
+
+def feature_table(y):
+    """Tabla de features como en train_and_save.py (features.feature_frame)"""
+    y = y.asfreq("h").ffill(limit=3).bfill(limit=1)
+    return fit_table(feature_frame(y).dropna())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", help="serie horaria con columnas time, pm2_5")
+    parser.add_argument("--synthetic", action="store_true", help="serie sintética, sin red ni CSV")
+    parser.add_argument("--model", default="trained_model.pkl")
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+
+    if args.synthetic:
+        X = synthetic_table()
+    else:
+        if args.csv:
+            df = pd.read_csv(args.csv, parse_dates=["time"]).set_index("time")
+            y = df["pm2_5"]
+        else:
+            y = download_series()
+        X = feature_table(y)
+    flat = FlatTreeModel(model)
+
+    t0 = time.perf_counter()
+    ref = model.predict(X)
+    t_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    got = flat.predict(X.to_numpy())
+    t_flat = time.perf_counter() - t0
+
+    diff = float(np.max(np.abs(ref - got)))
+    print(f"filas={len(X)} (con NaN: {int(X.isna().any(axis=1).sum())})  max |dif|={diff:.2e}  sklearn={t_ref*1000:.0f} ms  plano={t_flat*1000:.0f} ms")
+
+    for name, fn, x in [("sklearn", model.predict, X.iloc[:1]), ("plano", flat.predict, X.to_numpy()[:1])]:
+        t0 = time.perf_counter()
+        for _ in range(200):
+            fn(x)
+        print(f"{name:>8}: {(time.perf_counter() - t0) / 200 * 1e6:.0f} µs por fila")
+
+    if not diff <= ATOL:
+        sys.exit(f"FALLO: diferencia {diff:.2e} > {ATOL:.0e}")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Imitación local de air-quality-api.open-meteo.com para pruebas de carga.
+
+Responde /v1/air-quality (`current` u `hourly`) con payloads grabados en
+benchmarks/payloads/ (ver record_payloads.py), reajustados al rango de
+fechas pedido. Permite inyectar latencia, jitter, errores HTTP y cuelgues.
+
+Uso directo:  python benchmarks/fake_upstream.py --port 8101 --delay 0.2 --fail-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+
+def load_payloads(directory=PAYLOAD_DIR):
+    payloads = {}
+    for kind in ("current", "hourly"):
+        path = os.path.join(directory, f"air_quality_{kind}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                payloads[kind] = json.load(f)
+    return payloads
+
+
+def synthetic_hourly(times, lat):
+    hour = times.hour.to_numpy()
+    return np.round(8 + 4 * np.sin(2 * np.pi * hour / 24) + lat / 100, 1).tolist()
+
+
+def make_app(delay=0.0, jitter=0.0, fail_rate=0.0, hang_rate=0.0, hang_seconds=120.0,
+             payload_dir=PAYLOAD_DIR, seed=None):
+    """`delay` + U(0, `jitter`) segundos por respuesta; con probabilidad
+    `fail_rate` responde 503 y con `hang_rate` tarda `hang_seconds`."""
+    app = FastAPI()
+    app.state.delay = delay
+    app.state.jitter = jitter
+    app.state.fail_rate = fail_rate
+    app.state.hang_rate = hang_rate
+    app.state.calls = 0
+    app.state.failures = 0
+    payloads = load_payloads(payload_dir)
+    rng = random.Random(seed)
+
+    @app.get("/v1/air-quality")
+    async def air_quality(request: Request):
+        app.state.calls += 1
+        wait = app.state.delay + rng.random() * app.state.jitter
+        if rng.random() < app.state.hang_rate:
+            wait = hang_seconds
+        await asyncio.sleep(wait)
+        if rng.random() < app.state.fail_rate:
+            app.state.failures += 1
+            return JSONResponse({"error": True, "reason": "falla inyectada"}, status_code=503)
+
+        q = request.query_params
+        lat = float(q.get("latitude", 0))
+        now = pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%dT%H:00")
+
+        if "current" in q:
+            if "current" in payloads:
+                body = dict(payloads["current"])
+                body["current"] = {**body["current"], "time": now}
+                return body
+            return {"current": {
+                "time": now, "pm10": 15.0, "pm2_5": 9.0 + lat / 100,
+                "carbon_monoxide": 210.0, "nitrogen_dioxide": 12.0,
+                "ozone": 55.0, "sulphur_dioxide": 2.0,
+            }}
+
+        start = pd.Timestamp(q["start_date"])
+        end = pd.Timestamp(q["end_date"]) + pd.Timedelta(hours=23)
+        times = pd.date_range(start, end, freq="h")
+        variables = q.get("hourly", "pm2_5").split(",")
+
+        # Valores grabados repetidos cíclicamente sobre el rango pedido
+        recorded = payloads.get("hourly", {}).get("hourly", {})
+        hourly = {"time": times.strftime("%Y-%m-%dT%H:%M").tolist()}
+        for var in variables:
+            values = recorded.get(var)
+            if values:
+                hourly[var] = [values[i % len(values)] for i in range(len(times))]
+            else:
+                hourly[var] = synthetic_hourly(times, lat)
+        return {
+            "latitude": lat,
+            "longitude": float(q.get("longitude", 0)),
+            "timezone": "GMT",
+            "hourly_units": {"time": "iso8601", **{v: "μg/m³" for v in variables}},
+            "hourly": hourly,
+        }
+
+    return app
+
+
+def serve_in_thread(app, port):
+    """Arranca uvicorn en un hilo daemon y espera a que acepte conexiones."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(make_app(args.delay, args.jitter, args.fail_rate, args.hang_rate),
+                host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,107 @@
+"""Latencia de /predict y /health con un upstream lento, antes y después del
+cliente HTTP asíncrono.
+
+"blocking" reproduce el comportamiento anterior (requests.get dentro de
+async def, bloqueando el event loop); "async" usa UpstreamClient.
+
+Cada petición va a una celda distinta de la rejilla y el servidor arranca
+sin caché de Open-Meteo, sin HistoryStore y sin pronósticos precalculados:
+así todas las peticiones llegan al upstream lento.
+
+Uso (desde ml_model/):  python benchmarks/load_upstream.py [--concurrency 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+import requests
+
+UPSTREAM_PORT = 8101
+SERVER_PORT = 8100
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["OPEN_METEO_AQ_URL"] = f"http://127.0.0.1:{UPSTREAM_PORT}/v1/air-quality"
+os.environ.update({"CACHE_MAX_MB": "0", "HISTORY_STORE_DIR": "", "FORECAST_STORE_ENABLED": "0"})
+
+import model_server  # noqa: E402
+from fake_upstream import make_app, serve_in_thread  # noqa: E402
+
+async_get_json = model_server.upstream.get_json
+
+
+async def blocking_get_json(url, params=None, timeout=None):
+    r = requests.get(url, params=params, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+def percentiles(xs):
+    xs = np.asarray(xs) * 1000
+    if len(xs) == 0:
+        return "      -       -"
+    return f"{np.percentile(xs, 50):>7.0f} {np.percentile(xs, 99):>7.0f}"
+
+
+async def run_load(concurrency, duration, n_locations=2000):
+    base = f"http://127.0.0.1:{SERVER_PORT}"
+    predict_lat, health_lat = [], []
+    errors = 0
+    counter = 0
+    stop = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency + 1)) as client:
+        async def worker():
+            nonlocal errors, counter
+            while time.perf_counter() < stop:
+                i = counter % n_locations
+                counter += 1
+                # Celdas distintas, como bench_suite.drive
+                body = {"latitude": 20 + (i % 40) * 0.5, "longitude": -120 + (i // 40) * 0.5, "hours_ahead": 24}
+                t0 = time.perf_counter()
+                r = await client.post(f"{base}/predict", json=body)
+                if r.status_code == 200:
+                    predict_lat.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        async def prober():
+            while time.perf_counter() < stop:
+                t0 = time.perf_counter()
+                await client.get(f"{base}/health")
+                health_lat.append(time.perf_counter() - t0)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(prober(), *(worker() for _ in range(concurrency)))
+
+    return predict_lat, health_lat, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--delay", type=float, default=0.3, help="retardo del upstream (s)")
+    args = parser.parse_args()
+
+    serve_in_thread(make_app(delay=args.delay), UPSTREAM_PORT)
+    serve_in_thread(model_server.app, SERVER_PORT)
+    # El modelo se carga en segundo plano al arrancar
+    while requests.get(f"http://127.0.0.1:{SERVER_PORT}/health").json()["model_state"] == "loading":
+        time.sleep(0.1)
+
+    print(f"concurrencia={args.concurrency} duración={args.duration}s retardo upstream={args.delay}s")
+    print(f"{'modo':>9} {'req/s':>6} {'errores':>7} | {'predict p50':>11} {'p99':>7} | {'health p50':>10} {'p99':>7}  (ms)")
+    for mode, get_json in [("blocking", blocking_get_json), ("async", async_get_json)]:
+        model_server.upstream.get_json = get_json
+        predict_lat, health_lat, errors = asyncio.run(run_load(args.concurrency, args.duration))
+        rps = len(predict_lat) / args.duration
+        print(f"{mode:>9} {rps:>6.1f} {errors:>7} | {percentiles(predict_lat):>19} | {percentiles(health_lat):>18}")
+
+
+if __name__ == "__main__":
+    main()
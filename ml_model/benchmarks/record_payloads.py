@@ -0,0 +1,50 @@
+"""Graba respuestas reales de Open-Meteo en benchmarks/payloads/ para que
+fake_upstream.py las sirva sin red.
+
+Uso (desde ml_model/):  python benchmarks/record_payloads.py [--lat 38.8951 --lon -77.0364]
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+CURRENT_VARS = "pm10,pm2_5,carbon_monoxide,nitrogen_dioxide,ozone,sulphur_dioxide"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lat", type=float, default=38.8951)
+    parser.add_argument("--lon", type=float, default=-77.0364)
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+
+    os.makedirs(PAYLOAD_DIR, exist_ok=True)
+    now = datetime.now(timezone.utc)
+
+    current = requests.get(URL, params={
+        "latitude": args.lat, "longitude": args.lon,
+        "current": CURRENT_VARS, "timezone": "auto",
+    }, timeout=30)
+    current.raise_for_status()
+
+    hourly = requests.get(URL, params={
+        "latitude": args.lat, "longitude": args.lon,
+        "start_date": (now - timedelta(days=args.days)).strftime("%Y-%m-%d"),
+        "end_date": now.strftime("%Y-%m-%d"),
+        "hourly": "pm2_5", "timezone": "UTC",
+    }, timeout=60)
+    hourly.raise_for_status()
+
+    for kind, r in [("current", current), ("hourly", hourly)]:
+        path = os.path.join(PAYLOAD_DIR, f"air_quality_{kind}.json")
+        with open(path, "w") as f:
+            json.dump(r.json(), f)
+        print(f"✅ {path}")
+
+
+if __name__ == "__main__":
+    main()
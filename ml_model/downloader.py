@@ -0,0 +1,206 @@
+"""Descarga de históricos de Open-Meteo por tramos, concurrente y reanudable.
+
+Cada rango que falta en el HistoryStore se parte en tramos de `chunk_days`
+alineados al calendario. Los tramos se piden en paralelo con un pool
+acotado, y cada respuesta se guarda enseguida como checkpoint (.npz en
+<almacén>/_chunks). En cuanto los tramos de una serie están completos en
+orden, se pasan al almacén y se borra su checkpoint. Si el proceso se
+interrumpe, la siguiente ejecución sólo pide lo que no está ni en el
+almacén ni en los checkpoints. En memoria hay como máximo un JSON por
+worker.
+
+Uso (varias ubicaciones, desde ml_model/):
+    python downloader.py air_quality --start 2022-01-01 --vars pm2_5,pm10 \\
+        --site 38.8951,-77.0364 --site 34.05,-118.24
+"""
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import requests
+
+from history_store import (
+    AQ_URL, DEFAULT_ROOT, HOUR_NS, WEATHER_URL, HistoryStore, from_hour,
+    open_meteo_frame, to_hour,
+)
+
+URLS = {"air_quality": AQ_URL, "weather": WEATHER_URL}
+
+
+class DownloadError(Exception):
+    """`jobs`: los trabajos con algún tramo fallido (en el error final de run)"""
+
+    def __init__(self, message, jobs=()):
+        super().__init__(message)
+        self.jobs = list(jobs)
+
+
+class ChunkedDownloader:
+    """Descarga trabajos {source, url, lat, lon, variables, start, end} al HistoryStore.
+
+    Un tramo que falla se reintenta con backoff exponencial; si agota los
+    reintentos, el resto sigue y al final se lanza DownloadError (lo ya
+    descargado queda en disco para la siguiente ejecución).
+    """
+
+    def __init__(self, store, chunk_days=31, workers=4, retries=3, backoff=2.0, timeout=60):
+        self.store = store
+        self.chunk_hours = chunk_days * 24
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.checkpoint_dir = os.path.join(store.root, "_chunks")
+        self._local = threading.local()
+
+    def chunks(self, start, end):
+        """Tramos [a, b) alineados a múltiplos de chunk_days desde la época"""
+        h0, h1 = to_hour(start), to_hour(end)
+        edges = np.arange((h0 // self.chunk_hours + 1) * self.chunk_hours, h1, self.chunk_hours)
+        bounds = [h0, *edges.tolist(), h1]
+        return [(from_hour(a), from_hour(b)) for a, b in zip(bounds[:-1], bounds[1:]) if a < b]
+
+    def _checkpoint(self, job, a, b):
+        tag = hashlib.sha1(",".join(job["variables"]).encode()).hexdigest()[:8]
+        key = self.store.location_key(job["lat"], job["lon"])
+        return os.path.join(self.checkpoint_dir, job["source"], key,
+                            f"{to_hour(a)}_{to_hour(b)}_{tag}.npz")
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _fetch(self, job, a, b):
+        """Descarga un tramo y lo deja en su checkpoint; devuelve (ruta, reutilizado)"""
+        path = self._checkpoint(job, a, b)
+        if os.path.exists(path):
+            return path, True
+
+        params = {
+            "latitude": job["lat"],
+            "longitude": job["lon"],
+            "start_date": a.strftime("%Y-%m-%d"),
+            "end_date": (b - pd.Timedelta(hours=1)).strftime("%Y-%m-%d"),
+            "hourly": ",".join(job["variables"]),
+            "timezone": "UTC",
+        }
+        for attempt in range(self.retries + 1):
+            try:
+                r = self._session().get(job["url"], params=params, timeout=self.timeout)
+                r.raise_for_status()
+                frame = open_meteo_frame(r.json(), job["variables"])
+                break
+            except (requests.RequestException, ValueError) as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"{job['source']} {params['start_date']} → {params['end_date']}: {e}") from e
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"Reintentando {params['start_date']} → {params['end_date']} en {delay:.1f}s ({e})")
+                time.sleep(delay)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, hours=frame.index.asi8 // HOUR_NS,
+                 **{f"v_{c}": frame[c].to_numpy() for c in frame.columns})
+        os.replace(tmp, path)
+        return path, False
+
+    def _flush(self, job, path, until, chunk):
+        with np.load(path) as data:
+            index = pd.DatetimeIndex(data["hours"] * HOUR_NS, tz="UTC")
+            frame = pd.DataFrame({c: data[f"v_{c}"] for c in job["variables"]}, index=index)
+        # El tramo queda como pedido aunque alguna variable venga vacía
+        self.store.write(job["source"], job["lat"], job["lon"], frame, until=until, requested=chunk)
+        os.remove(path)
+
+    def run(self, jobs):
+        now = pd.Timestamp.now(tz="UTC").floor("h")
+        plans = []
+        for job in jobs:
+            until = min(pd.Timestamp(from_hour(to_hour(job["end"]))), now)
+            gaps = self.store.missing(job["source"], job["lat"], job["lon"],
+                                      job["variables"], job["start"], until)
+            plans.append({"job": job, "until": until,
+                          "chunks": [c for a, b in gaps for c in self.chunks(a, b)],
+                          "done": {}, "next": 0})
+
+        stats = {"chunks": sum(len(p["chunks"]) for p in plans), "fetched": 0, "reused": 0, "failed": []}
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="download") as pool:
+            futures = {
+                pool.submit(self._fetch, plan["job"], a, b): (plan, i)
+                for plan in plans for i, (a, b) in enumerate(plan["chunks"])
+            }
+            for future in as_completed(futures):
+                plan, i = futures[future]
+                try:
+                    path, reused = future.result()
+                except DownloadError as e:
+                    stats["failed"].append(str(e))
+                    plan["failed"] = True
+                    print(f"❌ {e}")
+                    continue
+                stats["reused" if reused else "fetched"] += 1
+                plan["done"][i] = path
+
+                # Pasar al almacén los tramos ya completos en orden
+                while plan["next"] in plan["done"]:
+                    self._flush(plan["job"], plan["done"].pop(plan["next"]), plan["until"],
+                                plan["chunks"][plan["next"]])
+                    plan["next"] += 1
+                n = len(stats["failed"]) + stats["fetched"] + stats["reused"]
+                a, b = plan["chunks"][i]
+                print(f"[{n}/{stats['chunks']}] {plan['job']['source']} "
+                      f"{self.store.location_key(plan['job']['lat'], plan['job']['lon'])} "
+                      f"{a:%Y-%m-%d} → {b:%Y-%m-%d}{' (checkpoint)' if reused else ''}")
+
+        stats["seconds"] = time.perf_counter() - t0
+        if stats["failed"]:
+            raise DownloadError(f"{len(stats['failed'])} tramos fallaron; volver a ejecutar para reanudar",
+                                [p["job"] for p in plans if p.get("failed")])
+        return stats
+
+
+def load_open_meteo(store, source, url, lat, lon, variables, start, end, dtype=np.float64, **kwargs):
+    """Serie horaria de Open-Meteo [start, end) desde el almacén local,
+    descargando por tramos sólo lo que falta"""
+    job = {"source": source, "url": url, "lat": lat, "lon": lon,
+           "variables": list(variables), "start": start, "end": end}
+    ChunkedDownloader(store, **kwargs).run([job])
+    end = min(from_hour(to_hour(end)), pd.Timestamp.now(tz="UTC").floor("h"))
+    return store.read(source, lat, lon, variables, start, end, dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", choices=sorted(URLS))
+    parser.add_argument("--vars", required=True, help="variables separadas por comas")
+    parser.add_argument("--site", action="append", required=True, help="lat,lon (repetible)")
+    parser.add_argument("--start", default="2024-06-01")
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--chunk-days", type=int, default=31)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--url", default=None, help="otra URL compatible (p. ej. una imitación local)")
+    parser.add_argument("--root", default=os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+    args = parser.parse_args()
+
+    store = HistoryStore(args.root)
+    end = args.end or pd.Timestamp.now(tz="UTC").floor("h")
+    jobs = []
+    for site in args.site:
+        lat, lon = (float(v) for v in site.split(","))
+        jobs.append({"source": args.source, "url": args.url or URLS[args.source], "lat": lat, "lon": lon,
+                     "variables": args.vars.split(","), "start": args.start, "end": end})
+    stats = ChunkedDownloader(store, args.chunk_days, args.workers).run(jobs)
+    print(f"✅ {stats['fetched']} tramos descargados, {stats['reused']} desde checkpoint "
+          f"en {stats['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Features del modelo, declaradas una sola vez.
+
+- Lotes (entrenamiento): feature_matrix / feature_frame construyen la
+  tabla completa desde arrays contiguos, con ventanas por strides.
+- Streaming (servidor): RollingFeatures mantiene lags y ventanas de N
+  series con trabajo constante por hora.
+
+La fila de la hora t usa el calendario de t, lag_L = y[t - L] y ventanas
+que terminan en y[t] (incluido); el modelo recursivo predice y[t + 1].
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Tablas de entrenamiento en float32: hora y día son enteros pequeños,
+# exactos en float32, y lags/ventanas de PM2.5 no necesitan más precisión.
+# Las sumas de las ventanas se hacen en float64 y sólo se guarda el resultado
+FEATURE_DTYPE = np.float32
+
+LAGS = [1,2,3,6,12,24,48,72,168]
+WINS = [3,6,12,24,72]
+CALENDAR = ["hour", "dow", "sin_hour", "cos_hour", "sin_dow", "cos_dow"]
+
+
+def feature_names(lags=LAGS, wins=WINS):
+    """Orden de columnas del modelo (se guarda en los metadatos)"""
+    return (
+        CALENDAR
+        + [f"lag_{L}" for L in lags]
+        + [c for w in wins for c in (f"roll_mean_{w}", f"roll_std_{w}")]
+    )
+
+
+FEATURES = feature_names()
+
+# Modo directo: las features del origen más el horizonte y el calendario
+# de la hora objetivo
+DIRECT_EXTRA = ["horizon", "sin_hour_target", "cos_hour_target", "sin_dow_target", "cos_dow_target"]
+DIRECT_FEATURES = FEATURES + DIRECT_EXTRA
+
+
+_SIN_HOUR = np.sin(2*np.pi*np.arange(24)/24)
+_COS_HOUR = np.cos(2*np.pi*np.arange(24)/24)
+_SIN_DOW = np.sin(2*np.pi*np.arange(7)/7)
+_COS_DOW = np.cos(2*np.pi*np.arange(7)/7)
+
+
+def calendar_features(times):
+    """Features de calendario para un DatetimeIndex, en el orden de CALENDAR"""
+    if times.tz is None or str(times.tz) == "UTC":
+        # Horas desde la época: evita los accesores .hour/.dayofweek
+        hours = times.asi8 // 3_600_000_000_000
+        hour = hours % 24
+        dow = (hours // 24 + 3) % 7  # 1970-01-01 fue jueves
+    else:
+        hour = times.hour.to_numpy()
+        dow = times.dayofweek.to_numpy()
+    return np.column_stack([
+        hour,
+        dow,
+        _SIN_HOUR[hour],
+        _COS_HOUR[hour],
+        _SIN_DOW[dow],
+        _COS_DOW[dow],
+    ])
+
+
+def horizon_features(target_times, horizons):
+    """Columnas DIRECT_EXTRA para horas objetivo (DatetimeIndex) y horizontes"""
+    cal = calendar_features(target_times)
+    return np.column_stack([np.asarray(horizons, dtype=float), cal[:, 2:6]])
+
+
+def stack_horizons(X, y, horizons):
+    """Tabla de entrenamiento del modo directo.
+
+    `X` son las features por hora de origen (DataFrame con índice horario,
+    columnas feature_names()) e `y` la serie objetivo con el mismo índice. Cada
+    fila se repite para h = 1..horizons con objetivo y[t + h].
+    """
+    values = X.to_numpy()
+    oks, targets = [], []
+    for h in range(1, horizons + 1):
+        y_h = y.shift(-h).reindex(X.index).to_numpy(dtype=float)
+        oks.append(~np.isnan(y_h))
+        targets.append(y_h[oks[-1]])
+
+    # Tabla final reservada de una vez, con el dtype de X (sin bloques intermedios)
+    n = len(X.columns)
+    out = np.empty((sum(len(t) for t in targets), n + len(DIRECT_EXTRA)), dtype=values.dtype)
+    row = 0
+    for h, ok in enumerate(oks, start=1):
+        k = int(ok.sum())
+        out[row:row + k, :n] = values[ok]
+        out[row:row + k, n:] = horizon_features(X.index[ok] + pd.Timedelta(hours=h), np.full(k, h))
+        row += k
+    return pd.DataFrame(out, columns=list(X.columns) + DIRECT_EXTRA, copy=False), np.concatenate(targets)
+
+
+
+def fit_table(X):
+    """La tabla en float64 justo antes de ajustar: HistGradientBoosting
+    convierte cualquier otro dtype con una copia que vive todo el ajuste.
+    Reasignando (X = fit_table(X)) la tabla float32 se libera antes."""
+    return X.astype(np.float64, copy=False)
+
+
+def feature_matrix(values, times, lags=LAGS, wins=WINS, dtype=FEATURE_DTYPE):
+    """Modo por lotes: matriz (len(values), n_features) de una serie horaria
+    continua, en el orden de feature_names(lags, wins).
+
+    Los lags son copias desplazadas del array y cada ventana es una vista
+    con strides (sliding_window_view) sobre la que se suman valor y
+    cuadrado, las mismas cuentas que RollingFeatures. Donde falta historia
+    o la ventana contiene un NaN queda NaN, como shift/rolling de pandas.
+    Se calcula en float64 y se guarda en `dtype` (FEATURE_DTYPE).
+    """
+    y = np.ascontiguousarray(values, dtype=float)
+    n = len(y)
+    n_cal = len(CALENDAR)
+    # Por columnas: cada feature se escribe en memoria contigua
+    X = np.full((n, n_cal + len(lags) + 2 * len(wins)), np.nan, dtype=dtype, order="F")
+    X[:, :n_cal] = calendar_features(times)
+
+    col = n_cal
+    for L in lags:
+        if L < n:
+            X[L:, col] = y[:n - L]
+        col += 1
+    for w in wins:
+        if w <= n:
+            win = sliding_window_view(y, w)
+            s = win.sum(axis=1)
+            sq = np.einsum("ij,ij->i", win, win)
+            mean = s / w
+            with np.errstate(invalid="ignore", divide="ignore"):
+                var = (sq - s * mean) / (w - 1)
+            X[w - 1:, col] = mean
+            X[w - 1:, col + 1] = np.sqrt(np.maximum(var, 0.0))
+        col += 2
+    return X
+
+
+def feature_frame(y, lags=LAGS, wins=WINS, dtype=FEATURE_DTYPE):
+    """feature_matrix de una pd.Series horaria continua, como DataFrame"""
+    X = feature_matrix(y.to_numpy(dtype=float), y.index, lags, wins, dtype)
+    return pd.DataFrame(X, index=y.index, columns=feature_names(lags, wins), copy=False)
+
+
+class HourlyRingBuffer:
+    """Últimas `capacity` horas de N series en un buffer circular de numpy.
+
+    Cada valor se escribe dos veces (en i y en i + capacity) para que
+    cualquier ventana de las últimas w horas sea un slice contiguo. Todas
+    las series avanzan a la vez (una columna por hora), pero cada una
+    puede arrancar con un histórico de distinta longitud.
+    """
+
+    def __init__(self, capacity=168, n_series=1):
+        self.capacity = capacity
+        self.data = np.zeros((n_series, 2 * capacity))
+        self.head = 0
+        self.size = np.zeros(n_series, dtype=int)
+        self._rows = np.arange(n_series)
+
+    def load(self, row, values):
+        """Carga el histórico de una serie; llamar antes del primer append."""
+        values = np.asarray(values, dtype=float)[-self.capacity:]
+        n = len(values)
+        idx = (self.head - n + np.arange(n)) % self.capacity
+        self.data[row, idx] = values
+        self.data[row, idx + self.capacity] = values
+        self.size[row] = n
+
+    def load_many(self, values):
+        """Carga el histórico de todas las series a la vez desde una matriz
+        (N, horas) alineada en el tiempo; llamar antes del primer append."""
+        values = np.asarray(values, dtype=float)[:, -self.capacity:]
+        n = values.shape[1]
+        idx = (self.head - n + np.arange(n)) % self.capacity
+        self.data[:, idx] = values
+        self.data[:, idx + self.capacity] = values
+        self.size[:] = n
+
+    def append(self, values):
+        self.data[:, self.head] = values
+        self.data[:, self.head + self.capacity] = values
+        self.head = (self.head + 1) % self.capacity
+        np.minimum(self.size + 1, self.capacity, out=self.size)
+
+    def back(self, k):
+        """Valores de hace k horas (k=1 es el último añadido), uno por serie.
+
+        `k` puede ser un array de desfases; entonces devuelve (N, len(k)).
+        Si una serie aún no llega tan atrás se usa su último valor, igual
+        que hacía prepare_features.
+        """
+        end = self.head + self.capacity
+        ks = np.atleast_1d(k)
+        if self.size.min() >= ks.max():
+            out = self.data[:, end - ks]
+        else:
+            ks = np.where(self.size[:, None] >= ks, ks, 1)
+            out = self.data[self._rows[:, None], end - ks]
+        return out if np.ndim(k) else out[:, 0]
+
+
+class RollingFeatures:
+    """Lags y estadísticas de ventana de N series con trabajo O(1) por hora.
+
+    Por cada ventana se mantienen la suma, la suma de cuadrados y el número
+    de NaN: al añadir una hora entra un valor y sale el de hace w horas.
+    Cada `capacity` horas las sumas se recalculan desde el buffer para que
+    el redondeo no se acumule.
+
+    Las features describen la última hora añadida t, igual que en
+    entrenamiento (feature_matrix): lag_L = y[t - L] y las ventanas
+    incluyen y[t].
+    """
+
+    def __init__(self, lags=LAGS, wins=WINS, n_series=1):
+        self.lags = list(lags)
+        self.wins = list(wins)
+        self.capacity = max(max(self.lags) + 1, max(self.wins))
+        self.n_features = len(self.lags) + 2 * len(self.wins)
+        self.buf = HourlyRingBuffer(self.capacity, n_series)
+        self._k = np.array(self.lags) + 1
+        self._w = np.array(self.wins)
+        self.sum = np.zeros((n_series, len(self.wins)))
+        self.sumsq = np.zeros_like(self.sum)
+        self.nans = np.zeros(self.sum.shape, dtype=int)
+        self._steps = 0
+        self._dirty = False
+
+    def load(self, row, values):
+        """Carga el histórico de una serie; llamar antes del primer append."""
+        self.buf.load(row, values)
+        self._dirty = True
+
+    def load_many(self, values):
+        """Histórico de todas las series como matriz (N, horas); ver HourlyRingBuffer"""
+        self.buf.load_many(values)
+        self._dirty = True
+
+    def append(self, values):
+        if self._dirty:
+            self._resync()
+        buf = self.buf
+        new = np.asarray(values, dtype=float)
+        new_nan = np.isnan(new)
+        new0 = np.where(new_nan, 0.0, new)[:, None]
+
+        # Valor que sale de cada ventana (sólo si la ventana ya estaba llena)
+        old = buf.data[:, buf.head + buf.capacity - self._w]
+        full = buf.size[:, None] >= self._w
+        old_nan = np.isnan(old) & full
+        old = np.where(full & ~old_nan, old, 0.0)
+
+        self.sum += new0 - old
+        self.sumsq += new0 * new0 - old * old
+        self.nans += new_nan[:, None].astype(int) - old_nan
+        buf.append(new)
+
+        self._steps += 1
+        if self._steps % self.capacity == 0:
+            self._resync()
+
+    def _resync(self):
+        buf = self.buf
+        end = buf.head + buf.capacity
+        for i, w in enumerate(self.wins):
+            win = buf.data[:, end - w:end]
+            valid = np.arange(w) >= (w - np.minimum(buf.size, w))[:, None]
+            nan = np.isnan(win) & valid
+            v = np.where(valid & ~nan, win, 0.0)
+            self.sum[:, i] = v.sum(axis=1)
+            self.sumsq[:, i] = (v * v).sum(axis=1)
+            self.nans[:, i] = nan.sum(axis=1)
+        self._dirty = False
+
+    def features(self, out=None):
+        """Columnas lag_* y (roll_mean_w, roll_std_w) de la última hora, (N, n_features).
+
+        Ventanas incompletas (histórico corto): media de lo disponible y
+        desviación NaN con un solo valor, 0 sin valores. Una ventana con
+        algún NaN da NaN, como rolling de pandas.
+        """
+        if self._dirty:
+            self._resync()
+        if out is None:
+            out = np.empty((self.sum.shape[0], self.n_features))
+        n_lag = len(self.lags)
+        out[:, :n_lag] = self.buf.back(self._k)
+
+        n = np.minimum(self.buf.size[:, None], self._w)
+        mean = self.sum / np.maximum(n, 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = (self.sumsq - self.sum * mean) / (n - 1)
+        std = np.sqrt(np.maximum(var, 0.0))
+        std[n <= 1] = np.nan
+        std[n == 0] = 0.0
+        has_nan = self.nans > 0
+        mean[has_nan] = np.nan
+        std[has_nan] = np.nan
+        out[:, n_lag::2] = mean
+        out[:, n_lag + 1::2] = std
+        return out
@@ -0,0 +1,195 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from features import (
+    CALENDAR, DIRECT_EXTRA, LAGS, WINS, RollingFeatures, calendar_features,
+    feature_names, horizon_features,
+)
+
+# El modelo se entrenó con un DataFrame; aquí le pasamos arrays en el mismo orden
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+
+def history_to_array(history, end_time, hours_back=168):
+    """Alinea el histórico (dict o Series tiempo -> valor) a la rejilla horaria.
+
+    Devuelve los valores de las horas anteriores a `end_time` (sin incluirla),
+    rellenando huecos con el último valor conocido.
+    """
+    s = pd.Series(history, dtype=float)
+    if s.empty:
+        return np.empty(0)
+    idx = pd.to_datetime(s.index)
+    if idx.tz is None:
+        idx = idx.tz_localize("UTC")
+    s.index = idx.tz_convert("UTC")
+    s = s.sort_index()
+
+    end = pd.Timestamp(end_time)
+    end = (end.tz_localize("UTC") if end.tz is None else end.tz_convert("UTC")).floor("h")
+    grid = pd.date_range(end - pd.Timedelta(hours=hours_back), periods=hours_back, freq="h")
+    s = s[~s.index.duplicated(keep="last")]
+    values = s.reindex(grid).ffill().to_numpy()
+    return values[~np.isnan(values)]
+
+
+def load_histories(rolling, histories):
+    """Una lista de arrays (longitudes distintas) o una matriz (N, horas)"""
+    if isinstance(histories, np.ndarray) and histories.ndim == 2:
+        rolling.load_many(histories)
+    else:
+        for row, history in enumerate(histories):
+            rolling.load(row, history)
+
+
+def step_calendar(start_time, n, hours_ahead):
+    """Calendario de la hora de origen de cada paso, (N, hours_ahead, n_cal).
+
+    `start_time` es una hora común o una por serie (backtest con muchos
+    orígenes a la vez).
+    """
+    if np.ndim(start_time) == 0:
+        times = pd.date_range(pd.Timestamp(start_time) - pd.Timedelta(hours=1),
+                              periods=hours_ahead, freq="h")
+        return np.broadcast_to(calendar_features(times), (n, hours_ahead, len(CALENDAR)))
+    steps = np.tile(np.arange(-1, hours_ahead - 1), n)
+    times = pd.DatetimeIndex(start_time).repeat(hours_ahead) + pd.to_timedelta(steps, unit="h")
+    return calendar_features(times).reshape(n, hours_ahead, len(CALENDAR))
+
+
+class RecursiveForecaster:
+    """Pronóstico recursivo 1 hora adelante sobre RollingFeatures.
+
+    Como en entrenamiento, la hora t se predice con las features de t - 1
+    (calendario de t - 1, lag_L = y[t-1-L], ventanas que terminan en y[t-1]).
+    Dentro del bucle no se construyen objetos de pandas.
+    """
+
+    def __init__(self, model, lags=LAGS, wins=WINS):
+        self.model = model
+        self.lags = list(lags)
+        self.wins = list(wins)
+        self.capacity = max(max(self.lags) + 1, max(self.wins))
+        self.feature_names = feature_names(self.lags, self.wins)
+        self.n_features = len(self.feature_names)
+
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None and list(names) != self.feature_names:
+            raise ValueError("El orden de features del modelo no coincide con feature_names()")
+
+    def clone_with(self, model):
+        """Mismo forecaster con otro modelo (p. ej. un clon por hilo)"""
+        return type(self)(model, self.lags, self.wins)
+
+    def forecast(self, history, start_time, hours_ahead=24):
+        """Predice `hours_ahead` horas desde `start_time`.
+
+        `history` es un array con la serie horaria que termina justo antes
+        de `start_time` (el último elemento es la observación más reciente).
+        """
+        return self.forecast_batch([history], start_time, hours_ahead)[0]
+
+    def forecast_batch(self, histories, start_time, hours_ahead=24, timings=None):
+        """Avanza N pronósticos a la vez: un model.predict de N filas por hora.
+
+        `histories` es una lista de arrays o una matriz (N, horas);
+        `start_time` una hora común o una por serie. Devuelve un array
+        (N, hours_ahead). Si se pasa `timings` (dict), se rellena con los
+        segundos dedicados a "features" y a "model".
+        """
+        t_start = time.perf_counter()
+        n = len(histories)
+        rolling = RollingFeatures(self.lags, self.wins, n)
+        load_histories(rolling, histories)
+
+        # Cada paso usa el calendario de la hora de origen (la anterior)
+        cal = step_calendar(start_time, n, hours_ahead)
+
+        n_cal = len(CALENDAR)
+        x = np.empty((n, self.n_features))
+        out = np.empty((n, hours_ahead))
+        t_model = 0.0
+
+        for i in range(hours_ahead):
+            x[:, :n_cal] = cal[:, i]
+            rolling.features(x[:, n_cal:])
+
+            t0 = time.perf_counter()
+            y_hat = self.model.predict(x)
+            t_model += time.perf_counter() - t0
+            np.maximum(y_hat, 0, out=y_hat)  # No puede ser negativo
+            rolling.append(y_hat)
+            out[:, i] = y_hat
+
+        if timings is not None:
+            timings["model"] = t_model
+            timings["features"] = time.perf_counter() - t_start - t_model
+        return out
+
+
+class DirectForecaster:
+    """Pronóstico directo multi-horizonte: un modelo con el horizonte como
+    feature. Las features del origen se calculan una vez y todas las horas
+    se puntúan en un único model.predict de N * hours_ahead filas.
+
+    Las features de origen son las de RollingFeatures en la hora t0 de la
+    última observación: lag_L = y[t0 - L] y las ventanas incluyen y[t0].
+    """
+
+    def __init__(self, model, lags=LAGS, wins=WINS, horizons=24):
+        self.model = model
+        self.lags = list(lags)
+        self.wins = list(wins)
+        self.horizons = horizons
+        self.capacity = max(max(self.lags) + 1, max(self.wins))
+        self.feature_names = feature_names(self.lags, self.wins) + DIRECT_EXTRA
+        self.n_origin = len(self.feature_names) - len(DIRECT_EXTRA)
+
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None and list(names) != self.feature_names:
+            raise ValueError("El orden de features del modelo no coincide con feature_names() + DIRECT_EXTRA")
+
+    def clone_with(self, model):
+        return type(self)(model, self.lags, self.wins, self.horizons)
+
+    def forecast(self, history, start_time, hours_ahead=24):
+        return self.forecast_batch([history], start_time, hours_ahead)[0]
+
+    def forecast_batch(self, histories, start_time, hours_ahead=24, timings=None):
+        if hours_ahead > self.horizons:
+            raise ValueError(f"El modelo directo predice hasta {self.horizons} horas")
+        t_start = time.perf_counter()
+
+        n = len(histories)
+        rolling = RollingFeatures(self.lags, self.wins, n)
+        load_histories(rolling, histories)
+
+        # Features del origen (la hora anterior a start_time)
+        n_cal = len(CALENDAR)
+        x0 = np.empty((n, self.n_origin))
+        x0[:, :n_cal] = step_calendar(start_time, n, 1)[:, 0]
+        rolling.features(x0[:, n_cal:])
+
+        # Todas las (serie, horizonte) en una sola matriz
+        steps = np.arange(1, hours_ahead + 1)
+        if np.ndim(start_time) == 0:
+            targets = pd.date_range(start_time, periods=hours_ahead, freq="h")
+            extra = np.tile(horizon_features(targets, steps), (n, 1))
+        else:
+            steps = np.tile(steps, n)
+            targets = pd.DatetimeIndex(start_time).repeat(hours_ahead) + pd.to_timedelta(steps - 1, unit="h")
+            extra = horizon_features(targets, steps)
+        X = np.hstack([np.repeat(x0, hours_ahead, axis=0), extra])
+
+        t0 = time.perf_counter()
+        y_hat = self.model.predict(X)
+        t_model = time.perf_counter() - t0
+        np.maximum(y_hat, 0, out=y_hat)  # No puede ser negativo
+
+        if timings is not None:
+            timings["model"] = t_model
+            timings["features"] = time.perf_counter() - t_start - t_model
+        return y_hat.reshape(n, hours_ahead)
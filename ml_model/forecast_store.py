@@ -0,0 +1,82 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+def utc_hour():
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class ForecastStore:
+    """Pronósticos precalculados para las celdas más pedidas.
+
+    Cuenta las peticiones por celda de la rejilla y, una vez por hora
+    (cuando Open-Meteo ya publicó la hora nueva), recalcula en lote las
+    `top_k` celdas más pedidas. Una entrada solo se sirve durante la hora
+    UTC en la que se calculó.
+    """
+
+    def __init__(self, top_k=20, min_requests=2, hours_ahead=72, refresh_delay=300):
+        self.top_k = top_k
+        self.min_requests = min_requests
+        self.hours_ahead = hours_ahead
+        self.refresh_delay = refresh_delay
+        self.counts = Counter()
+        self.entries = {}  # celda -> (hora UTC, respuesta)
+        self.last_refresh = None
+
+    def record(self, cell):
+        self.counts[cell] += 1
+
+    def hot_cells(self):
+        return [c for c, n in self.counts.most_common(self.top_k) if n >= self.min_requests]
+
+    def lookup(self, cell, hours_ahead):
+        entry = self.entries.get(cell)
+        if entry is None or entry[0] != utc_hour() or hours_ahead > self.hours_ahead:
+            return None
+        return entry[1]
+
+    def put(self, cell, response):
+        self.entries[cell] = (utc_hour(), response)
+
+    def clear(self):
+        """Descarta lo precalculado (p. ej. al cambiar de modelo)"""
+        self.entries.clear()
+
+    async def refresh(self, compute):
+        """Recalcula las celdas calientes con `compute(cells)` -> {celda: respuesta}."""
+        cells = self.hot_cells()
+        if cells:
+            results = await compute(cells, self.hours_ahead)
+            for cell, response in results.items():
+                self.put(cell, response)
+
+        # Las celdas que dejaron de pedirse se olvidan poco a poco
+        for cell in list(self.counts):
+            self.counts[cell] //= 2
+            if self.counts[cell] == 0:
+                del self.counts[cell]
+        hot = set(cells)
+        for cell in [c for c in self.entries if c not in hot]:
+            del self.entries[cell]
+
+        self.last_refresh = datetime.now(timezone.utc)
+        print(f"🔄 Pronósticos precalculados: {len(self.entries)} celdas")
+
+    async def run(self, compute):
+        """Bucle de fondo: refresca `refresh_delay` segundos después de cada hora."""
+        while True:
+            next_run = utc_hour() + timedelta(hours=1, seconds=self.refresh_delay)
+            await asyncio.sleep((next_run - datetime.now(timezone.utc)).total_seconds())
+            try:
+                await self.refresh(compute)
+            except Exception as e:
+                print(f"Error refrescando pronósticos precalculados: {e}")
+
+    def stats(self):
+        return {
+            "tracked_cells": len(self.counts),
+            "stored_cells": len(self.entries),
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None,
+        }
@@ -0,0 +1,334 @@
+"""Almacén local de series horarias (Open-Meteo calidad del aire y clima, TEMPO).
+
+Una carpeta por fuente y ubicación con un archivo binario float64 por
+variable (horas contiguas desde su inicio) y un meta.json con el inicio y
+el largo de cada una. Las lecturas son slices de np.memmap y las escrituras
+sólo añaden las horas posteriores a lo guardado, así que un reentrenamiento
+descarga únicamente las horas nuevas (ver downloader.py).
+
+meta.json también guarda los rangos ya pedidos de cada variable
+("checked"): las horas que Open-Meteo devolvió vacías no se vuelven a pedir,
+salvo las de los últimos RECHECK_HOURS, que aún pueden llegar.
+
+Uso como script (importar un CSV horario, p. ej. el de TEMPO):
+    python history_store.py import-csv tempo 38.8951 -77.0364 2024-09_to_2025-09_hourly_def.csv
+    python history_store.py info
+"""
+import argparse
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo el lock entre hilos
+    fcntl = None
+
+HOUR_NS = 3_600_000_000_000
+RECHECK_HOURS = 168  # horas vacías recientes que se vuelven a pedir
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history")
+
+AQ_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+WEATHER_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+
+def to_hour(t):
+    """Timestamp (naive = UTC) -> horas desde la época"""
+    t = pd.Timestamp(t)
+    t = t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
+    return t.value // HOUR_NS
+
+
+def from_hour(h):
+    return pd.Timestamp(int(h) * HOUR_NS, tz="UTC")
+
+
+def _merge_ranges(ranges):
+    """Une rangos [a, b) que se solapan o se tocan"""
+    merged = []
+    for a, b in sorted(r for r in ranges if r[0] < r[1]):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+
+def _utc_index(index):
+    index = pd.DatetimeIndex(index)
+    return index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+
+
+class HistoryStore:
+    """Series horarias por (fuente, ubicación, variable) en disco.
+
+    Los rangos son semiabiertos [start, end) en horas UTC. Las ubicaciones
+    se redondean a `grid_deg` para que puntos casi iguales compartan serie.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, grid_deg=0.01):
+        self.root = root
+        self.grid_deg = grid_deg
+        self._lock = threading.Lock()
+
+    def location_key(self, lat, lon):
+        decimals = max(0, -int(np.floor(np.log10(self.grid_deg))))
+        snap = lambda v: round(round(v / self.grid_deg) * self.grid_deg, decimals)  # noqa: E731
+        return f"{snap(lat):.{decimals}f}_{snap(lon):.{decimals}f}"
+
+    def _dir(self, source, lat, lon):
+        return os.path.join(self.root, source, self.location_key(lat, lon))
+
+    def _meta(self, path):
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_meta(self, path, meta):
+        tmp = os.path.join(path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+
+    @contextmanager
+    def _locked(self, path, shared=False):
+        """Lock de una ubicación entre hilos y procesos; `shared` para
+        lecturas, que pueden ir a la vez entre ellas pero no con escrituras"""
+        if fcntl is None:
+            with self._lock:
+                yield
+            return
+        with open(os.path.join(path, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---------- Lectura ----------
+
+    def coverage(self, source, lat, lon, variable):
+        """(inicio, fin) guardados de una variable, o None"""
+        info = self._meta(self._dir(source, lat, lon)).get(variable)
+        if not info or not info["length"]:
+            return None
+        return from_hour(info["start"]), from_hour(info["start"] + info["length"])
+
+    def _values(self, path, variable, info, h0, h1, dtype=np.float64):
+        out = np.full(h1 - h0, np.nan, dtype=dtype)
+        lo, hi = max(h0, info["start"]), min(h1, info["start"] + info["length"])
+        if lo < hi:
+            data = np.memmap(os.path.join(path, f"{variable}.f64"), dtype=np.float64,
+                             mode="r", shape=(info["length"],))
+            out[lo - h0:hi - h0] = data[lo - info["start"]:hi - info["start"]]
+            del data
+        return out
+
+    def read(self, source, lat, lon, variables, start, end, dtype=np.float64):
+        """DataFrame horario [start, end) con una columna por variable (NaN si falta).
+
+        Con dtype=np.float32 las columnas se leen ya compactas, sin pasar por
+        una copia float64.
+        """
+        path = self._dir(source, lat, lon)
+        h0, h1 = to_hour(start), to_hour(end)
+        index = pd.DatetimeIndex(np.arange(h0, h1) * HOUR_NS, tz="UTC")
+        columns = {var: np.full(h1 - h0, np.nan, dtype=dtype) for var in variables}
+        if not os.path.isdir(path):
+            return pd.DataFrame(columns, index=index)
+        # Meta y archivos con el mismo lock que write(): un archivo reescrito
+        # con otro inicio nunca se lee con el meta anterior
+        with self._locked(path, shared=True):
+            meta = self._meta(path)
+            for var in variables:
+                if meta.get(var):
+                    columns[var] = self._values(path, var, meta[var], h0, h1, dtype)
+        return pd.DataFrame(columns, index=index)
+
+    def missing(self, source, lat, lon, variables, start, end):
+        """Rangos [a, b) que faltan para cubrir [start, end) en todas las
+        variables; cuenta como cubierto lo guardado y lo ya pedido (checked)"""
+        h0, h1 = to_hour(start), to_hour(end)
+        gaps = []
+        meta = self._meta(self._dir(source, lat, lon))
+        for var in variables:
+            info = meta.get(var) or {}
+            covered = [tuple(r) for r in info.get("checked", [])]
+            if info.get("length"):
+                covered.append((info["start"], info["start"] + info["length"]))
+            a = h0
+            for s, e in _merge_ranges(covered):
+                if e <= a:
+                    continue
+                if s >= h1:
+                    break
+                if a < s:
+                    gaps.append((a, s))
+                a = e
+            if a < h1:
+                gaps.append((a, h1))
+        return [(from_hour(a), from_hour(b)) for a, b in _merge_ranges(gaps)]
+
+    # ---------- Escritura ----------
+
+    def write(self, source, lat, lon, frame, until=None, requested=None):
+        """Guarda las horas nuevas de `frame` (índice horario, una columna por variable).
+
+        Sólo se añaden horas posteriores a lo guardado (o anteriores al
+        inicio, que reescriben el archivo). Se ignoran las horas >= `until`
+        y los NaN finales, para volver a pedirlas cuando existan.
+
+        `requested` = (a, b) es el rango que se pidió para obtener `frame`:
+        queda marcado como ya pedido en cada columna, aunque volviera vacío,
+        salvo las horas de las últimas RECHECK_HOURS hasta ahora.
+        """
+        if requested is not None:
+            self._mark_checked(source, lat, lon, frame.columns, *requested, until=until)
+        if frame.empty:
+            return
+        path = self._dir(source, lat, lon)
+        os.makedirs(path, exist_ok=True)
+        hours = _utc_index(frame.index).asi8 // HOUR_NS
+        keep = ~pd.Index(hours).duplicated(keep="last")
+        hours = hours[keep]
+        h0 = hours.min()
+        span = hours.max() - h0 + 1
+        if until is not None:
+            span = min(span, to_hour(until) - h0)
+        if span <= 0:
+            return
+        pos = hours - h0
+        inside = pos < span
+
+        with self._locked(path):
+            meta = self._meta(path)
+            for var in frame.columns:
+                series = np.full(span, np.nan)
+                series[pos[inside]] = frame[var].to_numpy(dtype=float)[keep][inside]
+                valid = np.flatnonzero(~np.isnan(series))
+                if not len(valid):
+                    continue
+                values = series[valid[0]:valid[-1] + 1]
+                meta[var] = {**meta.get(var, {}), **self._merge(path, var, meta.get(var), h0 + valid[0], values)}
+            self._save_meta(path, meta)
+
+    def _mark_checked(self, source, lat, lon, variables, start, end, until=None):
+        # Las horas vacías de la última semana (respecto a ahora) se vuelven a pedir
+        now = pd.Timestamp.now(tz="UTC").floor("h")
+        a, b = to_hour(start), min(to_hour(end), to_hour(now) - RECHECK_HOURS)
+        if until is not None:
+            b = min(b, to_hour(until))
+        if a >= b or not len(variables):
+            return
+        path = self._dir(source, lat, lon)
+        os.makedirs(path, exist_ok=True)
+        with self._locked(path):
+            meta = self._meta(path)
+            for var in variables:
+                info = meta.setdefault(var, {"start": a, "length": 0})
+                checked = [tuple(r) for r in info.get("checked", [])] + [(a, b)]
+                info["checked"] = [[int(x), int(y)] for x, y in _merge_ranges(checked)]
+            self._save_meta(path, meta)
+
+    def _merge(self, path, var, info, first, values):
+        last = first + len(values)
+        file = os.path.join(path, f"{var}.f64")
+        if not info or not info["length"]:
+            with open(file, "wb") as f:
+                f.write(values.tobytes())
+            return {"start": int(first), "length": len(values)}
+
+        start, end = info["start"], info["start"] + info["length"]
+        if first < start:
+            # Horas anteriores a lo guardado: se reescribe el archivo
+            old = self._values(path, var, info, start, end)
+            head = np.full(start - first, np.nan)
+            head[:min(len(values), start - first)] = values[:start - first]
+            tail = values[end - first:] if last > end else np.empty(0)
+            merged = np.concatenate([head, old, tail])
+            with open(file + ".tmp", "wb") as f:
+                f.write(merged.tobytes())
+            os.replace(file + ".tmp", file)
+            return {"start": int(first), "length": len(merged)}
+
+        if last <= end:
+            return info
+        # Append: hueco con NaN si los datos nuevos no empiezan en `end`
+        new = values[max(0, end - first):]
+        if first > end:
+            new = np.concatenate([np.full(first - end, np.nan), new])
+        with open(file, "r+b") as f:
+            f.seek(info["length"] * 8)
+            f.write(new.tobytes())
+            f.truncate()
+        return {"start": start, "length": info["length"] + len(new)}
+
+    # ---------- Sincronización ----------
+
+    def ensure(self, source, lat, lon, variables, start, end, fetch):
+        """Lee [start, end) descargando antes sólo los rangos que faltan.
+
+        `fetch(a, b)` devuelve un DataFrame horario que cubra [a, b).
+        """
+        end = min(from_hour(to_hour(end)), pd.Timestamp.now(tz="UTC").floor("h"))
+        for a, b in self.missing(source, lat, lon, variables, start, end):
+            self.write(source, lat, lon, fetch(a, b), until=end, requested=(a, b))
+        return self.read(source, lat, lon, variables, start, end)
+
+    def locations(self):
+        for source in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            for key in sorted(os.listdir(os.path.join(self.root, source))):
+                yield source, key, self._meta(os.path.join(self.root, source, key))
+
+
+def open_meteo_frame(payload, variables=None):
+    """Respuesta JSON de Open-Meteo (`hourly`) -> DataFrame con índice UTC"""
+    hourly = payload.get("hourly") or {}
+    if "time" not in hourly:
+        # Sin datos: vacío pero con índice horario y las columnas pedidas
+        return pd.DataFrame({c: np.empty(0) for c in variables or []},
+                            index=pd.DatetimeIndex([], tz="UTC"))
+    index = _utc_index(pd.to_datetime(hourly["time"]))
+    cols = variables or [k for k in hourly if k != "time"]
+    return pd.DataFrame({c: pd.to_numeric(pd.Series(hourly.get(c)), errors="coerce").to_numpy()
+                         for c in cols}, index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default=os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import-csv", help="importar un CSV horario (columna de tiempo + variables)")
+    imp.add_argument("source")
+    imp.add_argument("lat", type=float)
+    imp.add_argument("lon", type=float)
+    imp.add_argument("csv")
+    imp.add_argument("--time-column", default=None)
+    sub.add_parser("info", help="listar series guardadas")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.root)
+    if args.cmd == "import-csv":
+        df = pd.read_csv(args.csv)
+        col = args.time_column or next(c for c in ("time", "datetime", "date") if c in df.columns)
+        df.index = pd.to_datetime(df.pop(col), utc=True)
+        df = df.select_dtypes("number").sort_index()
+        store.write(args.source, args.lat, args.lon, df)
+        print(f"✅ {len(df)} horas x {df.shape[1]} variables en {args.source}/{store.location_key(args.lat, args.lon)}")
+    else:
+        for source, key, meta in store.locations():
+            for var, info in meta.items():
+                if not info["length"]:
+                    print(f"{source:<12} {key:<18} {var:<28} sin datos ({len(info.get('checked', []))} rangos pedidos)")
+                    continue
+                print(f"{source:<12} {key:<18} {var:<28} {from_hour(info['start'])} +{info['length']} h")
+
+
+if __name__ == "__main__":
+    main()
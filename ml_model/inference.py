@@ -0,0 +1,184 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tree_eval import FlatTreeModel
+
+MODES = ("inline", "thread", "process")
+
+
+class PoolOverloaded(Exception):
+    pass
+
+
+# Estado de cada worker: en hilos, un forecaster por hilo y modelo (buffers
+# propios); en procesos, los forecasters heredados con fork o abiertos con
+# memmap. Las claves son el sitio de cada modelo (None = modelo general).
+_templates = {}
+_local = threading.local()
+
+
+def _thread_forecaster(templates, key):
+    """Copia por hilo del forecaster `key` de `templates`; se rehace si el
+    trabajo viene de otro juego de modelos (antes o después de un swap)"""
+    cache = _local.__dict__.setdefault("forecasters", {})
+    cached = cache.get(key)
+    if cached is None or cached[0] is not templates:
+        template = templates[key]
+        model = template.model
+        if isinstance(model, FlatTreeModel):
+            model = model.clone()
+        cached = cache[key] = (templates, template.clone_with(model))
+    return cached[1]
+
+
+def _init_process(model_dirs, templates):
+    global _templates
+    if model_dirs is not None:
+        _templates = {key: templates[key].clone_with(FlatTreeModel.load(d))
+                      for key, d in model_dirs.items()}
+
+
+def _run_forecast(templates, key, histories, start_time, hours_ahead):
+    """`templates`: los modelos con los que se envió el trabajo; None en
+    modo process (los del worker, fijados al crearlo)"""
+    timings = {}
+    forecaster = _thread_forecaster(_templates if templates is None else templates, key)
+    out = forecaster.forecast_batch(histories, start_time, hours_ahead, timings)
+    return out, timings
+
+
+def _ping(_):
+    return os.getpid()
+
+
+class InferencePool:
+    """Ejecuta los pronósticos fuera del event loop.
+
+    - inline: en el propio loop (comportamiento original).
+    - thread: ThreadPoolExecutor; numpy libera el GIL en buena parte del trabajo.
+    - process: ProcessPoolExecutor. Con fork los workers heredan el modelo ya
+      cargado (copy-on-write); sin fork, los nodos del FlatTreeModel se guardan
+      una vez en disco y cada worker los abre con memmap de solo lectura.
+
+    Como máximo `workers + queue_size` trabajos pueden estar en curso o en
+    cola; el siguiente recibe PoolOverloaded (el servidor responde 503).
+    """
+
+    def __init__(self, mode="thread", workers=None, queue_size=32):
+        if mode not in MODES:
+            raise ValueError(f"Modo de inferencia desconocido: {mode} (opciones: {', '.join(MODES)})")
+        self.mode = mode
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.queue_size = queue_size
+        self.pending = 0
+        self.rejected = 0
+        self.executor = None
+        self.swaps = 0
+        self._model_dir = None
+        self._run = None
+
+    def start(self, forecasters):
+        """`forecasters`: un forecaster o {clave: forecaster} (un modelo por sitio).
+
+        Bloquea hasta que los workers están listos (en modo process los
+        arranca todos): desde el event loop, llamarlo con run_in_executor.
+        El pool pasa a usar los modelos nuevos al terminar.
+        """
+        global _templates
+        if not isinstance(forecasters, dict):
+            forecasters = {None: forecasters}
+        templates = dict(forecasters)
+        # Con fork los workers heredan este global al crearse (en el ping)
+        _templates = templates
+        executor, model_dir = None, None
+
+        if self.mode == "thread":
+            executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        elif self.mode == "process":
+            methods = multiprocessing.get_all_start_methods()
+            if "fork" in methods:
+                ctx = multiprocessing.get_context("fork")
+                initargs = (None, None)
+            else:
+                if not all(isinstance(f.model, FlatTreeModel) for f in forecasters.values()):
+                    raise RuntimeError("El modo process sin fork requiere el evaluador plano")
+                ctx = multiprocessing.get_context("spawn")
+                model_dir = tempfile.mkdtemp(prefix="flat_model_")
+                model_dirs = {}
+                for i, (key, f) in enumerate(forecasters.items()):
+                    model_dirs[key] = os.path.join(model_dir, str(i))
+                    f.model.save(model_dirs[key])
+                # Se envían los forecasters sin modelo; cada worker abre los nodos con memmap
+                initargs = (model_dirs, {key: f.clone_with(None) for key, f in forecasters.items()})
+            executor = ProcessPoolExecutor(self.workers, mp_context=ctx,
+                                           initializer=_init_process, initargs=initargs)
+            # Arrancar todos los workers ahora y no a mitad de una petición
+            list(executor.map(_ping, range(self.workers)))
+
+        # Cada trabajo lleva sus modelos: los encolados antes de un swap
+        # terminan con los viejos aunque el global ya haya cambiado
+        self._run = functools.partial(_run_forecast, None if self.mode == "process" else templates)
+        self.executor, self._model_dir = executor, model_dir
+
+    def swap(self, forecasters):
+        """Cambia de modelos sin parar el servidor.
+
+        Las peticiones nuevas van a un executor nuevo con `forecasters`; las
+        que ya estaban en curso o en cola terminan en el anterior con los
+        modelos viejos, y después sus workers se cierran.
+        """
+        old, old_dir = self.executor, self._model_dir
+        self.start(forecasters)
+        if old is not None:
+            old.shutdown(wait=False)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        self.swaps += 1
+
+    async def forecast_batch(self, histories, start_time, hours_ahead, key=None):
+        """Devuelve (predicciones, tiempos) con el modelo `key`; los tiempos
+        incluyen "queue_wait"."""
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise PoolOverloaded()
+
+        self.pending += 1
+        t0 = time.perf_counter()
+        try:
+            run, executor = self._run, self.executor
+            if executor is None:
+                out, timings = run(key, histories, start_time, hours_ahead)
+            else:
+                loop = asyncio.get_running_loop()
+                out, timings = await loop.run_in_executor(
+                    executor, run, key, histories, start_time, hours_ahead)
+            elapsed = time.perf_counter() - t0
+            timings["queue_wait"] = max(0.0, elapsed - timings["model"] - timings["features"])
+            return out, timings
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self._model_dir is not None:
+            shutil.rmtree(self._model_dir, ignore_errors=True)
+            self._model_dir = None
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "swaps": self.swaps,
+        }
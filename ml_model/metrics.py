@@ -0,0 +1,140 @@
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Buckets (segundos) pensados para etapas de ms a decenas de segundos
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Para collectors que copian un contador mantenido en otro objeto."""
+        self.values[tuple(labels[n] for n in self.label_names)] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, v in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {v}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # etiquetas -> [conteos por bucket, suma, total]
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            s[0][i] += 1
+        s[1] += value
+        s[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for key, (counts, total, n) in self.series.items():
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_labels(names, key + (b,))} {acc}")
+            lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        return self._add(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self._add(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self._add(Histogram(*args, **kwargs))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Registra una función que actualiza métricas justo antes de exportar."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        for fn in self.collectors:
+            fn()
+        lines = []
+        for m in self.metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "model_server_stage_seconds", "Duración de cada etapa de /predict", labels=("stage",))
+
+# Desglose por petición (modo perfil); None cuando está desactivado
+_profile = contextvars.ContextVar("profile", default=None)
+
+
+def start_profile():
+    profile = {}
+    _profile.set(profile)
+    return profile
+
+
+def record_stage(stage, seconds, histogram=True, profile=True):
+    """`histogram`/`profile`: a dónde va la duración (por defecto a ambos)"""
+    if histogram:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    current = _profile.get() if profile else None
+    if current is not None:
+        current[stage] = current.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name, histogram=True, profile=True):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0, histogram, profile)
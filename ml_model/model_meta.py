@@ -0,0 +1,104 @@
+import itertools
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime, timezone
+
+
+def meta_path(model_path):
+    """Metadatos junto al modelo: trained_model.pkl -> trained_model.meta.json"""
+    return os.path.splitext(model_path)[0] + ".meta.json"
+
+
+def load_meta(model_path):
+    """Metadatos del modelo; un .pkl sin metadatos es el modelo recursivo original"""
+    path = meta_path(model_path)
+    if not os.path.exists(path):
+        return {"mode": "recursive"}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_meta(model_path, meta):
+    with open(meta_path(model_path), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+# ---------- Versiones publicadas (retrain.py) ----------
+# <models_dir>/<versión>/model.pkl + model.meta.json, y <models_dir>/CURRENT
+# con el nombre de la versión activa. CURRENT se reemplaza de forma atómica:
+# el servidor nunca ve una versión a medio escribir.
+
+def current_model_path(models_dir):
+    """Ruta del modelo activo según CURRENT, o None si no hay versiones"""
+    try:
+        with open(os.path.join(models_dir, "CURRENT")) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(models_dir, version, "model.pkl")
+    return path if os.path.exists(path) else None
+
+
+def list_versions(models_dir):
+    """Versiones publicadas, de la más antigua a la más reciente"""
+    if not os.path.isdir(models_dir):
+        return []
+    return sorted(d for d in os.listdir(models_dir)
+                  if os.path.isfile(os.path.join(models_dir, d, "model.pkl")))
+
+
+def set_current(models_dir, version):
+    """Activa una versión ya publicada (también sirve para volver atrás)"""
+    if not os.path.isfile(os.path.join(models_dir, version, "model.pkl")):
+        raise FileNotFoundError(f"No existe la versión {version} en {models_dir}")
+    tmp = os.path.join(models_dir, "CURRENT.tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(models_dir, "CURRENT"))
+
+
+def site_registry(models_dir, site):
+    """Registro propio de un sitio (train_sites.py): <models_dir>/sites/<sitio>/"""
+    return os.path.join(models_dir, "sites", site)
+
+
+def list_sites(models_dir):
+    """{sitio: ruta del modelo activo} de los sitios con alguna versión publicada"""
+    root = os.path.join(models_dir, "sites")
+    if not os.path.isdir(root):
+        return {}
+    sites = {}
+    for site in sorted(os.listdir(root)):
+        if not os.path.isdir(os.path.join(root, site)):
+            continue
+        path = current_model_path(os.path.join(root, site))
+        if path is not None:
+            sites[site] = path
+    return sites
+
+
+def publish(models_dir, model, meta, keep=5):
+    """Guarda una versión nueva, la activa y borra las más antiguas"""
+    # Microsegundos y, si aun así coincide (otro proceso), un sufijo: el orden
+    # alfabético sigue siendo el cronológico
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    os.makedirs(models_dir, exist_ok=True)
+    for n in itertools.count():
+        version = f"{stamp}-{n}" if n else stamp
+        directory = os.path.join(models_dir, version)
+        try:
+            os.mkdir(directory)
+            break
+        except FileExistsError:
+            continue
+    path = os.path.join(directory, "model.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(model, f)
+    save_meta(path, {**meta, "version": version})
+    set_current(models_dir, version)
+
+    for old in list_versions(models_dir)[:-keep] if keep else []:
+        shutil.rmtree(os.path.join(models_dir, old), ignore_errors=True)
+    return path
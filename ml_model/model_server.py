@@ -1,80 +1,366 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import requests
+from typing import List
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
 import pickle
 import uvicorn
 from datetime import datetime
 
+from features import LAGS, WINS
+from forecast_engine import RecursiveForecaster, DirectForecaster, history_to_array
+from model_meta import current_model_path, list_sites, list_versions, load_meta
+from upstream import UpstreamClient
+from upstream_cache import GridCache
+from forecast_store import ForecastStore
+from history_store import HistoryStore, DEFAULT_ROOT, open_meteo_frame
+from tree_eval import compile_model
+from inference import InferencePool, PoolOverloaded
+import metrics
+
 app = FastAPI()
 
-# Variables globales del modelo
+# Open-Meteo (configurable para pruebas contra un upstream local)
+AQ_URL = os.getenv("OPEN_METEO_AQ_URL", "https://air-quality-api.open-meteo.com/v1/air-quality")
+
+upstream = UpstreamClient(
+    max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100")),
+    per_host_limit=int(os.getenv("UPSTREAM_PER_HOST_LIMIT", "10")),
+    retries=int(os.getenv("UPSTREAM_RETRIES", "2")),
+)
+
+# Caché por celda de la rejilla de Open-Meteo y hora UTC
+upstream_cache = GridCache(
+    grid_deg=float(os.getenv("CACHE_GRID_DEG", "0.1")),
+    ttl=int(os.getenv("CACHE_TTL_SECONDS", "3600")),
+    max_bytes=int(float(os.getenv("CACHE_MAX_MB", "64")) * 2**20),
+)
+
+# Histórico horario en disco: sólo se descargan las horas nuevas
+# (HISTORY_STORE_DIR="" lo desactiva)
+HISTORY_STORE_DIR = os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT)
+history_store = HistoryStore(HISTORY_STORE_DIR) if HISTORY_STORE_DIR else None
+
+# Pronósticos precalculados para las celdas más pedidas
+FORECAST_STORE_ENABLED = os.getenv("FORECAST_STORE_ENABLED", "1") == "1"
+FORECAST_STORE_HOURS = int(os.getenv("FORECAST_STORE_HOURS", "72"))
+forecast_store = ForecastStore(
+    top_k=int(os.getenv("FORECAST_STORE_TOP_K", "20")),
+    hours_ahead=FORECAST_STORE_HOURS,
+    refresh_delay=int(os.getenv("FORECAST_STORE_DELAY_SECONDS", "300")),
+)
+refresh_task = None
+
+# Inferencia fuera del event loop: inline | thread | process
+inference = InferencePool(
+    mode=os.getenv("INFERENCE_MODE", "thread"),
+    workers=int(os.getenv("INFERENCE_WORKERS", "0")) or None,
+    queue_size=int(os.getenv("INFERENCE_QUEUE_SIZE", "32")),
+)
+
+# Métricas (Prometheus en /metrics) y perfil por petición (X-Profile: 1)
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+REQUEST_SECONDS = metrics.registry.histogram(
+    "model_server_request_seconds", "Duración total por endpoint", labels=("endpoint", "source"))
+IN_FLIGHT = metrics.registry.gauge(
+    "model_server_in_flight_requests", "Peticiones en curso por endpoint", labels=("endpoint",))
+UPSTREAM_ERRORS = metrics.registry.counter(
+    "model_server_upstream_errors_total", "Errores al consultar Open-Meteo", labels=("endpoint",))
+UPSTREAM_CALLS = metrics.registry.counter(
+    "model_server_upstream_calls_total", "Llamadas HTTP a Open-Meteo", labels=("result",))
+CACHE_EVENTS = metrics.registry.counter(
+    "model_server_cache_events_total", "Eventos de la caché de Open-Meteo", labels=("event",))
+CACHE_SIZE = metrics.registry.gauge(
+    "model_server_cache_bytes", "Tamaño estimado de la caché de Open-Meteo")
+INFERENCE_PENDING = metrics.registry.gauge(
+    "model_server_inference_pending", "Pronósticos en curso o en cola en el pool")
+INFERENCE_REJECTED = metrics.registry.counter(
+    "model_server_inference_rejected_total", "Pronósticos rechazados por saturación (503)")
+
+# Registro de modelos: si MODELS_DIR tiene versiones publicadas (retrain.py,
+# train_and_save.py --publish) se usa la activa (CURRENT); si no, MODEL_PATH.
+# El modelo se carga en segundo plano al arrancar y se vigila cada
+# MODEL_WATCH_SECONDS (0 = sólo al arrancar y con POST /model/reload).
+# Los modelos por sitio (train_sites.py, MODELS_DIR/sites/<sitio>/) atienden
+# las ubicaciones a menos de SITE_MAX_KM de su sitio; el resto, el general
+MODEL_PATH = os.getenv("MODEL_PATH", "trained_model.pkl")
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "30"))
+SITE_MAX_KM = float(os.getenv("SITE_MAX_KM", "250"))
+SMOKE_MAX_PM25 = 1000.0
 model = None
-lags = [1,2,3,6,12,24,48,72,168]
-wins = [3,6,12,24,72]
+model_meta = {}
+model_path = None
+model_stamp = None
+forecaster = None
+site_models = {}  # sitio -> {"lat", "lon", "path", "stamp", "meta", "forecaster"}
 target = "pm2_5"
+model_status = {"state": "loading", "error": None, "loaded_at": None, "rejected": []}
+rejected_stamps = set()
+reload_lock = asyncio.Lock()
+watch_task = None
+
+def resolve_model_path():
+    return current_model_path(MODELS_DIR) or MODEL_PATH
+
+def model_stamp_of(path):
+    """Identifica el artefacto: la ruta y su fecha (MODEL_PATH se puede reescribir)"""
+    return path, os.stat(path).st_mtime_ns
+
+def smoke_check(built):
+    """Pronóstico de prueba antes de activar un modelo: historias sintéticas
+    de varios niveles, con huecos y cortas; la salida debe ser finita y plausible"""
+    rng = np.random.default_rng(0)
+    hours = built.capacity + 24
+    t = np.arange(hours)
+    histories = [level * (1 + 0.4 * np.sin(2 * np.pi * t / 24)) + rng.gamma(2.0, 1.0, hours)
+                 for level in (3, 10, 35, 80)]
+    gap = histories[1].copy()
+    gap[-30:-20] = np.nan
+    histories += [gap, histories[2][-24:]]
+    steps = min(24, getattr(built, "horizons", 24))
+    out = built.forecast_batch(histories, pd.Timestamp.now(tz="UTC").floor("h"), steps)
+    if out.shape != (len(histories), steps) or not np.isfinite(out).all():
+        raise ValueError("El pronóstico de prueba no es válido (forma o valores no finitos)")
+    if out.max() > SMOKE_MAX_PM25:
+        raise ValueError(f"El pronóstico de prueba no es plausible (máximo {out.max():.1f})")
+
+def load_model(path):
+    """Carga un modelo, arma su forecaster y lo valida; lanza excepción si no es válido"""
+    with open(path, 'rb') as f:
+        loaded = pickle.load(f)
+    meta = load_meta(path)
+    lags = meta.get("lags", LAGS)
+    wins = meta.get("wins", WINS)
+    # Evaluador de árboles en arrays planos (validado contra model.predict)
+    if meta["mode"] == "direct":
+        built = DirectForecaster(compile_model(loaded), lags, wins, horizons=meta["horizons"])
+    else:
+        built = RecursiveForecaster(compile_model(loaded), lags, wins)
+    if meta.get("features", built.feature_names) != built.feature_names:
+        raise ValueError("Las features de los metadatos no coinciden con features.py")
+    smoke_check(built)
+    return loaded, meta, built
+
+def load_current():
+    """(modelo, metadatos, forecaster) activos, o Nones (benchmarks y scripts)"""
+    try:
+        return load_model(resolve_model_path())
+    except Exception as e:
+        print(f"⚠️ Error cargando modelo: {e}")
+        return None, {}, None
+
+def all_forecasters():
+    """{clave: forecaster} para el pool de inferencia (None = modelo general)"""
+    out = {name: m["forecaster"] for name, m in site_models.items()}
+    if forecaster is not None:
+        out[None] = forecaster
+    return out
+
+def activate(path, loaded, meta, built):
+    global model, model_meta, model_path, forecaster
+    model, model_meta, model_path, forecaster = loaded, meta, path, built
+
+def cap_store_hours():
+    # Los modelos directos no pronostican más allá de sus horizontes
+    horizons = [f.horizons for f in all_forecasters().values() if isinstance(f, DirectForecaster)]
+    forecast_store.hours_ahead = min([FORECAST_STORE_HOURS, *horizons])
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(6371.0 * 2 * np.arcsin(np.sqrt(a)))
+
+def route(lat, lon):
+    """Modelo que atiende una ubicación: el sitio más cercano dentro de
+    SITE_MAX_KM (cualquier distancia si no hay modelo general), o None"""
+    if not site_models:
+        return None
+    name, km = min(((n, distance_km(lat, lon, m["lat"], m["lon"])) for n, m in site_models.items()),
+                   key=lambda item: item[1])
+    return name if km <= SITE_MAX_KM or forecaster is None else None
+
+def history_hours():
+    return max(f.capacity for f in all_forecasters().values())
+
+async def reload_model(force=False):
+    """Carga las versiones activas en segundo plano y las cambia sin reiniciar.
+
+    Revisa el modelo general y los de cada sitio; sólo se cargan los que
+    cambiaron. Las peticiones siguen atendiéndose con los modelos
+    anteriores mientras se cargan y validan los nuevos; una versión que
+    falla no se activa ni se vuelve a intentar salvo con `force`.
+    """
+    global refresh_task, model_stamp
+    async with reload_lock:
+        wanted = {None: resolve_model_path(), **list_sites(MODELS_DIR)}
+        stamps = {}
+        for key, path in wanted.items():
+            try:
+                stamps[key] = model_stamp_of(path)
+            except FileNotFoundError:
+                pass
+        if not stamps:
+            raise FileNotFoundError(f"No existe el modelo {wanted[None]}")
+
+        current = {name: m["stamp"] for name, m in site_models.items()}
+        if model is not None:
+            current[None] = model_stamp
+        changed = [key for key, stamp in stamps.items()
+                   if force or (stamp != current.get(key) and stamp not in rejected_stamps)]
+        removed = [name for name in site_models if name not in stamps]
+        if not changed and not removed:
+            return False
+
+        loop = asyncio.get_running_loop()
+        loaded, errors = {}, []
+        for key in changed:
+            path = stamps[key][0]
+            try:
+                loaded[key] = await loop.run_in_executor(None, load_model, path)
+            except Exception as e:
+                rejected_stamps.add(stamps[key])
+                errors.append(f"{path}: {e}")
+        model_status.update(error="; ".join(errors) or None,
+                            rejected=sorted(path for path, _ in rejected_stamps))
+        if not loaded and not removed:
+            if model is None and not site_models:
+                model_status["state"] = "error"
+            raise ValueError(model_status["error"])
+
+        first = not all_forecasters()
+        for key, (new_model, meta, built) in loaded.items():
+            if key is None:
+                activate(stamps[key][0], new_model, meta, built)
+                model_stamp = stamps[key]
+            else:
+                site = meta.get("site") or {}
+                if "lat" not in site:
+                    print(f"⚠️ El modelo del sitio {key} no tiene coordenadas en sus metadatos")
+                    continue
+                site_models[key] = {"lat": site["lat"], "lon": site["lon"], "path": stamps[key][0],
+                                    "stamp": stamps[key], "meta": meta, "forecaster": built}
+        for name in removed:
+            del site_models[name]
+        if not all_forecasters():
+            raise ValueError(model_status["error"] or "Ningún modelo válido")
 
-# Cargar modelo al iniciar
-try:
-    with open('trained_model.pkl', 'rb') as f:
-        model = pickle.load(f)
-    print("✅ Modelo cargado correctamente")
-except Exception as e:
-    print(f"⚠️ Error cargando modelo: {e}")
+        # start/swap esperan a que arranquen los workers: fuera del event loop
+        swap = inference.start if first else inference.swap
+        await loop.run_in_executor(None, swap, all_forecasters())
+        cap_store_hours()
+        forecast_store.clear()
+        model_status.update(state="ready", loaded_at=datetime.now().isoformat(timespec="seconds"))
+        if FORECAST_STORE_ENABLED and refresh_task is None:
+            refresh_task = asyncio.create_task(forecast_store.run(compute_cells))
+        for key, (_, meta, _) in loaded.items():
+            print(f"{'✅ Modelo cargado' if first else '🔁 Modelo recargado'} "
+                  f"({'sitio ' + key if key else 'general'}, modo {meta['mode']}, {stamps[key][0]})")
+        return True
+
+async def watch_models():
+    """Carga inicial y vigilancia del registro en segundo plano"""
+    while True:
+        try:
+            await reload_model()
+        except Exception as e:
+            print(f"⚠️ Error cargando modelo: {e}")
+            if model is None and not site_models:
+                model_status.update(state="error", error=str(e))
+        if MODEL_WATCH_SECONDS <= 0:
+            return
+        await asyncio.sleep(MODEL_WATCH_SECONDS)
+
+def require_model():
+    if model is None and not site_models:
+        if model_status["state"] == "loading":
+            raise HTTPException(status_code=503, detail="Modelo cargando, reintente en unos segundos")
+        raise HTTPException(status_code=503, detail="Modelo no entrenado")
+
+@contextmanager
+def track_request(endpoint, request):
+    """Mide la petición; si el perfil está activo devuelve el desglose por etapa"""
+    profile = None
+    if PROFILE_REQUESTS or request.headers.get("x-profile") == "1":
+        profile = metrics.start_profile()
+    IN_FLIGHT.inc(endpoint=endpoint)
+    info = {"source": "on_demand", "profile": profile, "t0": time.perf_counter()}
+    try:
+        yield info
+    finally:
+        IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(time.perf_counter() - info["t0"], endpoint=endpoint, source=info["source"])
+
+def with_profile(response, info):
+    if info["profile"] is None:
+        return response
+    return {
+        **response,
+        "profile": {
+            "stages_ms": {k: round(v * 1000, 3) for k, v in info["profile"].items()},
+            "total_ms": round((time.perf_counter() - info["t0"]) * 1000, 3)
+        }
+    }
 
 class PredictionRequest(BaseModel):
     latitude: float
     longitude: float
     hours_ahead: int = 24
 
-@app.post("/predict")
-async def predict_air_quality(req: PredictionRequest):
-    if model is None:
-        raise HTTPException(status_code=503, detail="Modelo no entrenado")
+class Location(BaseModel):
+    latitude: float
+    longitude: float
+
+class BatchPredictionRequest(BaseModel):
+    locations: List[Location]
+    hours_ahead: int = 24
+
+MAX_BATCH_LOCATIONS = 100
+
+async def load_location(lat, lon):
+    """Descarga datos actuales e histórico de un punto y arma la serie horaria"""
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="Coordenadas fuera de rango")
     
-    # 1. Obtener datos actuales de Open-Meteo
-    current_data = await get_current_air_quality(req.latitude, req.longitude)
+    # 1. Datos actuales y histórico reciente (últimas 168 horas = 7 días)
+    current_data, historical = await asyncio.gather(
+        get_current_air_quality(lat, lon),
+        get_historical_data(lat, lon, hours_back=history_hours())
+    )
     
     if not current_data:
         raise HTTPException(status_code=500, detail="No se pudieron obtener datos actuales")
     
+    current_time = pd.Timestamp.now(tz='UTC')
+    
+    # 2. Serie horaria en array: histórico + observación actual
+    with metrics.stage("history_prep"):
+        history = history_to_array(historical, current_time, hours_back=history_hours())
+        history = np.append(history, current_data.get("pm2_5", 0))
+    
+    return current_data, current_time, history
+
+def build_response(lat, lon, current_data, current_time, y_hats, source="on_demand", site=None):
     current_pm25 = current_data.get("pm2_5", 0)
     current_o3 = current_data.get("ozone", 0)
     current_no2 = current_data.get("nitrogen_dioxide", 0)
     current_co = current_data.get("carbon_monoxide", 0)
-    current_time = pd.Timestamp.now(tz='UTC')
-    
-    # 2. Obtener histórico reciente para lags (últimas 168 horas = 7 días)
-    historical = await get_historical_data(
-        req.latitude, 
-        req.longitude,
-        hours_back=168
-    )
-    
-    # 3. Crear serie histórica
-    series_ext = pd.Series(historical, name=target)
-    series_ext.loc[current_time] = current_pm25
     
-    # 4. Generar predicciones
-    predictions = []
     future_times = pd.date_range(
         current_time + pd.Timedelta(hours=1),
-        periods=req.hours_ahead,
+        periods=len(y_hats),
         freq="h",  # Cambiado de "H" a "h"
         tz='UTC'
     )
     
-    for i, t in enumerate(future_times):
-        features = prepare_features(t, series_ext)
-        X_row = pd.DataFrame([features], index=[t])
-        
-        y_hat = model.predict(X_row)[0]
-        y_hat = max(0, y_hat)  # No puede ser negativo
-        
-        # Añadir a la serie para próximas predicciones
-        series_ext.loc[t] = y_hat
-        
+    predictions = []
+    for i, (t, y_hat) in enumerate(zip(future_times, y_hats)):
         predictions.append({
             "hours_ahead": i + 1,
             "pm25": round(float(y_hat), 2),
@@ -84,63 +370,161 @@ async def predict_air_quality(req: PredictionRequest):
     
     return {
         "success": True,
-        "location": {"lat": req.latitude, "lon": req.longitude},
+        "location": {"lat": lat, "lon": lon},
         "current_pm25": round(current_pm25, 2),
         "current_aqi": pm25_to_aqi(current_pm25),
         "current_o3": round(current_o3, 1),
         "current_no2": round(current_no2, 1),
         "current_co": round(current_co, 1),
-        "predictions": predictions
+        "predictions": predictions,
+        "source": source,
+        "model_site": site,
+        "generated_at": current_time.isoformat()
     }
 
-def prepare_features(t, series_ext):
-    """Prepara features según el entrenamiento"""
-    features = {
-        "hour": t.hour,
-        "dow": t.dayofweek,
-        "sin_hour": np.sin(2*np.pi*t.hour/24),
-        "cos_hour": np.cos(2*np.pi*t.hour/24),
-        "sin_dow": np.sin(2*np.pi*t.dayofweek/7),
-        "cos_dow": np.cos(2*np.pi*t.dayofweek/7),
-    }
+@app.post("/predict")
+async def predict_air_quality(req: PredictionRequest, request: Request):
+    require_model()
     
-    # Lags
-    for L in lags:
-        lag_time = t - pd.Timedelta(hours=L)
-        # Redondear a hora completa
-        lag_time = lag_time.floor('h')
+    with track_request("predict", request) as info:
+        # Celdas calientes: respuesta precalculada en la hora actual
+        # Sin el store no hay refresco que haga decaer los conteos: no se cuentan
+        stored = None
+        if FORECAST_STORE_ENABLED:
+            cell = upstream_cache.snap(req.latitude, req.longitude)
+            forecast_store.record(cell)
+            stored = forecast_store.lookup(cell, req.hours_ahead)
+        if stored is not None:
+            info["source"] = "precomputed"
+            return with_profile({
+                **stored,
+                "location": {"lat": req.latitude, "lon": req.longitude},
+                "predictions": stored["predictions"][:req.hours_ahead]
+            }, info)
         
-        if lag_time in series_ext.index:
-            features[f"lag_{L}"] = series_ext.loc[lag_time]
-        else:
-            features[f"lag_{L}"] = series_ext.iloc[-1] if len(series_ext) > 0 else 0
-    
-    # Rolling windows
-    for w in wins:
-        window_start = t - pd.Timedelta(hours=w)
-        window_end = t - pd.Timedelta(hours=1)
-        # Redondear a horas completas
-        window_start = window_start.floor('h')
-        window_end = window_end.floor('h')
+        current_data, current_time, history = await load_location(req.latitude, req.longitude)
         
-        try:
-            # Usar fechas exactas disponibles en el índice
-            available_times = series_ext.loc[window_start:window_end]
-            if len(available_times) > 0:
-                features[f"roll_mean_{w}"] = available_times.mean()
-                features[f"roll_std_{w}"] = available_times.std()
-            else:
-                features[f"roll_mean_{w}"] = series_ext.iloc[-1] if len(series_ext) > 0 else 0
-                features[f"roll_std_{w}"] = 0
-        except:
-            features[f"roll_mean_{w}"] = series_ext.iloc[-1] if len(series_ext) > 0 else 0
-            features[f"roll_std_{w}"] = 0
+        # 3. Generar predicciones
+        start_time = current_time + pd.Timedelta(hours=1)
+        locations = [(req.latitude, req.longitude)]
+        y_hats, sites = await forecast_routed(locations, [history], start_time, req.hours_ahead)
+        
+        response = build_response(req.latitude, req.longitude, current_data, current_time, y_hats[0],
+                                  site=sites[0])
+        return with_profile(response, info)
+
+@app.post("/predict/batch")
+async def predict_air_quality_batch(req: BatchPredictionRequest, request: Request):
+    """Predicción para N puntos: un model.predict de N filas por hora"""
+    with track_request("predict_batch", request) as info:
+        return with_profile(await _predict_batch(req), info)
+
+async def _predict_batch(req):
+    require_model()
+    if len(req.locations) > MAX_BATCH_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BATCH_LOCATIONS} ubicaciones por petición")
+    
+    # 1. Descargar todos los puntos en paralelo; un error no tumba el lote
+    loaded = await asyncio.gather(
+        *(load_location(loc.latitude, loc.longitude) for loc in req.locations),
+        return_exceptions=True
+    )
+    
+    ok = [i for i, r in enumerate(loaded) if not isinstance(r, BaseException)]
     
-    return features
+    # 2. Pronóstico conjunto de los puntos válidos (un lote por modelo)
+    results = [None] * len(req.locations)
+    if ok:
+        current_time = pd.Timestamp.now(tz='UTC')
+        y_hats, sites = await forecast_routed(
+            [(req.locations[i].latitude, req.locations[i].longitude) for i in ok],
+            [loaded[i][2] for i in ok],
+            current_time + pd.Timedelta(hours=1),
+            req.hours_ahead
+        )
+        for row, i in enumerate(ok):
+            loc = req.locations[i]
+            current_data = loaded[i][0]
+            results[i] = build_response(loc.latitude, loc.longitude, current_data, current_time, y_hats[row],
+                                        site=sites[row])
+    
+    # 3. Errores por ubicación, en el mismo orden de la petición
+    for i, r in enumerate(loaded):
+        if isinstance(r, BaseException):
+            loc = req.locations[i]
+            detail = r.detail if isinstance(r, HTTPException) else str(r)
+            results[i] = {
+                "success": False,
+                "location": {"lat": loc.latitude, "lon": loc.longitude},
+                "error": detail
+            }
+    
+    return {
+        "success": True,
+        "count": len(results),
+        "results": results
+    }
+
+async def run_forecast(histories, start_time, hours_ahead, key=None):
+    """Pronóstico en el pool de inferencia con el modelo `key`; 503 si está saturado"""
+    try:
+        y_hats, timings = await inference.forecast_batch(histories, start_time, hours_ahead, key)
+    except PoolOverloaded:
+        raise HTTPException(status_code=503, detail="Servidor saturado, reintente en unos segundos")
+    except ValueError as e:
+        # p. ej. hours_ahead mayor que los horizontes del modelo directo
+        raise HTTPException(status_code=400, detail=str(e))
+    for stage, seconds in timings.items():
+        metrics.record_stage(stage, seconds)
+    return y_hats
+
+async def forecast_routed(locations, histories, start_time, hours_ahead):
+    """Pronóstico de cada ubicación con el modelo de su sitio (route).
+
+    Las ubicaciones del mismo modelo van en un solo lote; devuelve las
+    predicciones en el orden de entrada y el sitio usado por cada una.
+    """
+    sites = [route(lat, lon) for lat, lon in locations]
+    groups = {}
+    for i, site in enumerate(sites):
+        groups.setdefault(site, []).append(i)
+    batches = await asyncio.gather(*(
+        run_forecast([histories[i] for i in rows], start_time, hours_ahead, site)
+        for site, rows in groups.items()
+    ))
+    y_hats = [None] * len(locations)
+    for rows, batch in zip(groups.values(), batches):
+        for row, i in enumerate(rows):
+            y_hats[i] = batch[row]
+    return y_hats, sites
+
+async def compute_cells(cells, hours_ahead):
+    """Pronóstico en lote para celdas de la rejilla (refresco en segundo plano)"""
+    loaded = await asyncio.gather(
+        *(load_location(lat, lon) for lat, lon in cells),
+        return_exceptions=True
+    )
+    ok = [i for i, r in enumerate(loaded) if not isinstance(r, BaseException)]
+    if not ok:
+        return {}
+    
+    current_time = pd.Timestamp.now(tz='UTC')
+    y_hats, sites = await forecast_routed(
+        [cells[i] for i in ok],
+        [loaded[i][2] for i in ok],
+        current_time + pd.Timedelta(hours=1),
+        hours_ahead
+    )
+    results = {}
+    for row, i in enumerate(ok):
+        lat, lon = cells[i]
+        results[cells[i]] = build_response(lat, lon, loaded[i][0], current_time, y_hats[row],
+                                           source="precomputed", site=sites[row])
+    return results
 
 async def get_current_air_quality(lat, lon):
     """Obtiene calidad del aire actual"""
-    url = "https://air-quality-api.open-meteo.com/v1/air-quality"
+    lat, lon = upstream_cache.snap(lat, lon)
     vars_ = ",".join([
         "pm10","pm2_5","carbon_monoxide","nitrogen_dioxide",
         "ozone","sulphur_dioxide"
@@ -153,51 +537,72 @@ async def get_current_air_quality(lat, lon):
         "timezone": "auto"
     }
     
+    # Con single-flight la descarga corre en el contexto de la primera
+    # petición: el histograma la cuenta una vez y cada perfil, su espera
+    async def fetch():
+        with metrics.stage("upstream_current", profile=False):
+            return await upstream.get_json(AQ_URL, params, timeout=30)
+    
     try:
-        r = requests.get(url, params=params, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+        with metrics.stage("upstream_current", histogram=False):
+            data = await upstream_cache.get("current", lat, lon, fetch)
         return data.get("current", {})
     except Exception as e:
+        UPSTREAM_ERRORS.inc(endpoint="current")
         print(f"Error obteniendo datos actuales: {e}")
         return None
 
 async def get_historical_data(lat, lon, hours_back=168):
-    """Obtiene datos históricos de las últimas N horas"""
-    url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-    
-    now = datetime.now()
-    end_date = now.strftime("%Y-%m-%d")
+    """Obtiene datos históricos de las últimas N horas.
+
+    Con el almacén local sólo se piden a Open-Meteo las horas que faltan
+    desde la última guardada; si Open-Meteo falla se usa lo guardado. El
+    almacén (disco y flock) se usa fuera del event loop.
+    """
+    lat, lon = upstream_cache.snap(lat, lon)
+    now = pd.Timestamp.now(tz="UTC").floor("h")
     start = now - pd.Timedelta(hours=hours_back)
-    start_date = start.strftime("%Y-%m-%d")
-    
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": start_date,
-        "end_date": end_date,
-        "hourly": "pm2_5",
-        "timezone": "UTC"
-    }
+    loop = asyncio.get_running_loop()
+    if history_store:
+        gaps = await loop.run_in_executor(None, history_store.missing, "air_quality", lat, lon,
+                                          ["pm2_5"], start, now)
+    else:
+        gaps = [(start, now)]
     
     try:
-        r = requests.get(url, params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        
-        hourly = data.get("hourly", {})
-        times = hourly.get("time", [])
-        values = hourly.get("pm2_5", [])
-        
-        # Crear serie temporal
-        df = pd.DataFrame({"time": times, "pm2_5": values})
-        df["time"] = pd.to_datetime(df["time"])
-        df = df.set_index("time")
-        
-        return df["pm2_5"].to_dict()
+        if gaps:
+            params = {
+                "latitude": lat,
+                "longitude": lon,
+                "start_date": gaps[0][0].strftime("%Y-%m-%d"),
+                "end_date": (gaps[-1][1] - pd.Timedelta(hours=1)).strftime("%Y-%m-%d"),
+                "hourly": "pm2_5",
+                "timezone": "UTC"
+            }
+            
+            async def fetch():
+                with metrics.stage("upstream_history", profile=False):
+                    return await upstream.get_json(AQ_URL, params, timeout=60)
+            
+            with metrics.stage("upstream_history", histogram=False):
+                data = await upstream_cache.get(f"history_{params['start_date']}", lat, lon, fetch)
+            frame = open_meteo_frame(data, ["pm2_5"])
+            if not history_store:
+                return frame["pm2_5"]
+            with metrics.stage("history_store"):
+                await loop.run_in_executor(None, functools.partial(
+                    history_store.write, "air_quality", lat, lon, frame, until=now,
+                    requested=(gaps[0][0], gaps[-1][1])))
     except Exception as e:
+        UPSTREAM_ERRORS.inc(endpoint="history")
         print(f"Error obteniendo histórico: {e}")
-        return {}
+        if not history_store:
+            return {}
+    
+    with metrics.stage("history_store"):
+        frame = await loop.run_in_executor(None, history_store.read, "air_quality", lat, lon,
+                                           ["pm2_5"], start, now)
+    return frame["pm2_5"]
 
 def pm25_to_aqi(pm25):
     """Convierte PM2.5 a AQI según estándares EPA"""
@@ -214,14 +619,90 @@ def pm25_to_aqi(pm25):
     else:
         return int(300 + ((pm25 - 250.4) / 99.6) * 100)
 
+@app.on_event("startup")
+async def startup():
+    # Sin esperar al modelo: /health responde en cuanto arranca el proceso
+    global watch_task
+    watch_task = asyncio.create_task(watch_models())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if refresh_task is not None:
+        refresh_task.cancel()
+    if watch_task is not None:
+        watch_task.cancel()
+    inference.shutdown()
+    await upstream.aclose()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        **upstream_cache.stats(),
+        "forecast_store": forecast_store.stats(),
+        "inference": inference.stats()
+    }
+
+@metrics.registry.collector
+def collect_metrics():
+    cache = upstream_cache.stats()
+    for event in ("hits", "misses", "coalesced", "evictions", "expirations"):
+        CACHE_EVENTS.set(cache[event], event=event)
+    CACHE_SIZE.set(cache["bytes"])
+    UPSTREAM_CALLS.set(upstream.requests, result="sent")
+    UPSTREAM_CALLS.set(upstream.retried, result="retried")
+    UPSTREAM_CALLS.set(upstream.failed, result="failed")
+    INFERENCE_PENDING.set(inference.pending)
+    INFERENCE_REJECTED.set(inference.rejected)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/model/reload")
+async def model_reload(force: bool = False):
+    """Carga la versión activa del registro (o MODEL_PATH) sin reiniciar"""
+    try:
+        reloaded = await reload_model(force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo cargar el modelo: {e}")
+    return {
+        "reloaded": reloaded,
+        "model_path": model_path,
+        "model_version": model_meta.get("version")
+    }
+
+@app.get("/model")
+async def model_info():
+    return {
+        **model_status,
+        "model_path": model_path,
+        "meta": model_meta,
+        "versions": list_versions(MODELS_DIR),
+        "sites": {
+            name: {"lat": m["lat"], "lon": m["lon"], "path": m["path"],
+                   "version": m["meta"].get("version"), "metrics": m["meta"].get("metrics")}
+            for name, m in site_models.items()
+        }
+    }
+
 @app.get("/health")
 async def health():
     return {
         "status": "ok",
         "model_loaded": model is not None,
+        "model_state": model_status["state"],
+        "forecast_mode": model_meta.get("mode"),
+        "model_version": model_meta.get("version"),
+        "site_models": len(site_models),
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/ready")
+async def ready():
+    """200 cuando hay un modelo listo para predecir, 503 mientras carga"""
+    require_model()
+    return {"status": "ready", "model_version": model_meta.get("version")}
+
 if __name__ == "__main__":
     print("🚀 Iniciando servidor ML en puerto 8000")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""Reentrenamiento incremental con versiones que el servidor recarga en caliente.
+
+La matriz de features se guarda en caché (<models_dir>/features_cache.npz)
+y en cada ejecución sólo se calculan las filas de las horas nuevas, con las
+`capacity` horas anteriores como contexto de lags y ventanas.
+
+- Incremental: una etapa corta de boosting sobre el residuo del modelo
+  actual en los últimos `--window-days` (StagedBoosting). Se acepta sólo si
+  no empeora el MAE en las `--val-hours` más recientes.
+- Completo: el mismo HistGradientBoostingRegressor que train_and_save.py (o
+  los parámetros de tune.py con --params) sobre todas las filas; con --full,
+  cada `--full-every-days` o al llegar a `--max-stages` etapas.
+
+El warm_start de sklearn no sirve aquí: al reajustar vuelve a calcular los
+bins con los datos nuevos y los árboles anteriores quedan con umbrales de
+otros bins.
+
+Cada modelo se publica como <models_dir>/<versión>/model.pkl y CURRENT
+apunta a la activa; el servidor la detecta (MODEL_WATCH_SECONDS) o la carga
+con POST /model/reload, y la valida antes de activarla.
+
+Uso (desde ml_model/, p. ej. cada hora con cron):
+    python retrain.py
+    python retrain.py --full --mode direct --horizons 24
+"""
+import argparse
+import json
+import os
+import pickle
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from downloader import load_open_meteo
+from features import FEATURE_DTYPE, LAGS, WINS, feature_matrix, feature_names, fit_table, stack_horizons
+from history_store import AQ_URL, DEFAULT_ROOT, HOUR_NS, HistoryStore, to_hour
+from model_meta import current_model_path, load_meta, publish
+from staged_model import StagedBoosting
+
+LAT, LON = 38.8951, -77.0364
+TARGET = "pm2_5"
+
+
+class FeatureCache:
+    """Filas (hora, features, y, y_next) ya calculadas de una serie horaria"""
+
+    def __init__(self, path, lags=LAGS, wins=WINS):
+        self.path = path
+        self.lags, self.wins = list(lags), list(wins)
+        self.columns = feature_names(lags, wins)
+        self.capacity = max(max(lags) + 1, max(wins))
+        self.hours = np.empty(0, dtype=np.int64)
+        self.X = np.empty((0, len(self.columns)), dtype=FEATURE_DTYPE)
+        self.y = np.empty(0)
+        self.y_next = np.empty(0)
+        self.until = None  # primera hora no incluida en el último update
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        with np.load(self.path, allow_pickle=False) as data:
+            if list(data["columns"]) != self.columns:
+                print("⚠️ Caché de features con otras columnas; se recalcula")
+                return self
+            self.hours, self.X = data["hours"], data["X"].astype(FEATURE_DTYPE, copy=False)
+            self.y, self.y_next = data["y"], data["y_next"]
+            self.until = int(data["until"])
+        return self
+
+    def save(self):
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, hours=self.hours, X=self.X, y=self.y, y_next=self.y_next,
+                 until=self.until, columns=np.array(self.columns))
+        os.replace(tmp, self.path)
+
+    def update(self, y):
+        """Añade las filas completas de las horas de `y` posteriores a la caché.
+
+        Devuelve cuántas filas nuevas hay. Las horas sin y_next aún no son
+        filas: se calculan en la siguiente ejecución.
+        """
+        idx = y.index.asi8 // HOUR_NS
+        first = self.until if self.until is not None else int(idx[0])
+        ctx = np.searchsorted(idx, first - self.capacity)
+        tail = y.iloc[ctx:]
+        X = feature_matrix(tail.to_numpy(), tail.index, self.lags, self.wins)
+        values = tail.to_numpy()
+        y_next = np.append(values[1:], np.nan)
+        hours = idx[ctx:]
+        ok = (hours >= first) & ~np.isnan(X).any(axis=1) & ~np.isnan(values) & ~np.isnan(y_next)
+        # La última hora con y_next conocido marca hasta dónde está calculado
+        known = np.flatnonzero(~np.isnan(y_next))
+        until = int(hours[known[-1]]) + 1 if len(known) else first
+
+        self.hours = np.concatenate([self.hours, hours[ok]])
+        self.X = np.vstack([self.X, X[ok]])
+        self.y = np.concatenate([self.y, values[ok]])
+        self.y_next = np.concatenate([self.y_next, y_next[ok]])
+        self.until = max(until, first)
+        return int(ok.sum())
+
+    def frame(self, mask=slice(None)):
+        index = pd.DatetimeIndex(self.hours[mask] * HOUR_NS, tz="UTC")
+        return pd.DataFrame(self.X[mask], index=index, columns=self.columns)
+
+
+def training_set(cache, y, mask, mode, horizons):
+    """(X, objetivo) del modo del modelo para las filas `mask` de la caché"""
+    X = cache.frame(mask)
+    if mode == "direct":
+        return stack_horizons(X, y, horizons)
+    return X, cache.y_next[mask]
+
+
+def mae(model, X, target):
+    return float(np.abs(model.predict(X) - target).mean()) if len(target) else None
+
+
+def full_model(X, target, params=None):
+    """Ajuste completo; `params` de tune.py (best.json) o los de train_and_save.py"""
+    if params:
+        # max_iter de best.json ya es el que eligió el early stopping de
+        # tune.py; con "auto" (activo desde 10k filas) se volvería a cortar
+        params = {"early_stopping": False, **params}
+    else:
+        params = {"max_depth": 6, "learning_rate": 0.05, "max_iter": 500}
+    model = HistGradientBoostingRegressor(**params, random_state=42)
+    return model.fit(X, target)
+
+
+def load_params(path):
+    """Hiperparámetros de tune.py (--params best.json), o None"""
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)["params"]
+
+
+def stage_model(X, target, max_iter):
+    model = HistGradientBoostingRegressor(
+        max_depth=4, learning_rate=0.05, max_iter=max_iter, min_samples_leaf=40, random_state=42
+    )
+    return model.fit(X, target)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models-dir", default=os.getenv("MODELS_DIR", "models"))
+    parser.add_argument("--mode", choices=["recursive", "direct"], default=None,
+                        help="por defecto el del modelo activo (o recursive)")
+    parser.add_argument("--horizons", type=int, default=None,
+                        help="horas del modelo directo; por defecto las del activo (o 24)")
+    parser.add_argument("--start", default="2024-06-01")
+    parser.add_argument("--end", default=None, help="fin exclusivo (UTC); por defecto la hora actual")
+    parser.add_argument("--full", action="store_true", help="forzar reentrenamiento completo")
+    parser.add_argument("--full-every-days", type=float, default=7)
+    parser.add_argument("--max-stages", type=int, default=24)
+    parser.add_argument("--window-days", type=float, default=30)
+    parser.add_argument("--val-hours", type=int, default=72)
+    parser.add_argument("--stage-iter", type=int, default=30)
+    parser.add_argument("--keep", type=int, default=5, help="versiones a conservar")
+    parser.add_argument("--params", default=None, help="best.json de tune.py para el ajuste completo")
+    args = parser.parse_args()
+
+    os.makedirs(args.models_dir, exist_ok=True)
+    store = HistoryStore(os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+    end = pd.Timestamp(args.end, tz="UTC") if args.end else pd.Timestamp.now(tz="UTC").floor("h")
+
+    # Mismo saneo del objetivo que train_and_save.py
+    y = load_open_meteo(store, "air_quality", AQ_URL, LAT, LON, [TARGET], args.start, end,
+                        dtype=np.float32)[TARGET]
+    y = y.asfreq("h").ffill(limit=3).bfill(limit=1)
+
+    cache = FeatureCache(os.path.join(args.models_dir, "features_cache.npz")).load()
+    added = cache.update(y)
+    cache.save()
+    if not len(cache.hours):
+        raise ValueError("No hay filas completas para entrenar. Revisa fechas/variables.")
+    print(f"Caché de features: {len(cache.hours)} filas ({added} nuevas)")
+
+    current = current_model_path(args.models_dir)
+    meta = load_meta(current) if current else {}
+    model = None
+    if current:
+        with open(current, "rb") as f:
+            model = pickle.load(f)
+    mode = args.mode or meta.get("mode", "recursive")
+    horizons = (args.horizons or meta.get("horizons") or 24) if mode == "direct" else None
+    now = datetime.now(timezone.utc)
+
+    trained_until = meta.get("trained_until")
+    new = cache.hours > to_hour(trained_until) if trained_until else np.ones(len(cache.hours), dtype=bool)
+    if model is not None and not new.any() and not args.full:
+        print("Sin horas nuevas desde la versión activa; nada que hacer")
+        return
+
+    stages = len(getattr(model, "stages", [model]))
+    # Etapa sobre el residuo en la ventana reciente; las últimas horas validan
+    window = cache.hours >= cache.hours[-1] - int(args.window_days * 24)
+    val = cache.hours > cache.hours[-1] - args.val_hours
+    last_full = meta.get("last_full_at")
+    full = (
+        args.full or model is None
+        or mode != meta.get("mode") or horizons != meta.get("horizons")
+        or meta.get("lags", LAGS) != cache.lags or meta.get("wins", WINS) != cache.wins
+        or last_full is None
+        or now - datetime.fromisoformat(last_full) >= pd.Timedelta(days=args.full_every_days)
+        or stages >= args.max_stages
+        or not (window & ~val).any()
+    )
+
+    metrics = {"new_rows": int(new.sum())}
+    if model is not None and new.any() and meta.get("mode") == mode:
+        # Error del modelo activo en horas que no vio (prequential)
+        X_new, t_new = training_set(cache, y, new, mode, horizons)
+        metrics["prequential_mae"] = mae(model, X_new, t_new)
+
+    if full:
+        X, target = training_set(cache, y, slice(None), mode, horizons)
+        X = fit_table(X)
+        print(f"Reentrenamiento completo ({mode}, {len(target)} filas)")
+        model = full_model(X, target, load_params(args.params))
+        stages = 1
+        last_full = now.isoformat(timespec="seconds")
+    else:
+        X_fit, t_fit = training_set(cache, y, window & ~val, mode, horizons)
+        X_fit = fit_table(X_fit)
+        X_val, t_val = training_set(cache, y, val, mode, horizons)
+        stage = stage_model(X_fit, t_fit - model.predict(X_fit), args.stage_iter)
+        candidate = StagedBoosting.extend(model, stage)
+        before, after = mae(model, X_val, t_val), mae(candidate, X_val, t_val)
+        metrics.update(val_mae_before=before, val_mae_after=after)
+        print(f"Etapa {stages + 1}: MAE validación {before:.3f} → {after:.3f}")
+        if after > before:
+            print("La etapa empeora la validación; se mantiene la versión activa")
+            return
+        model = candidate
+        stages += 1
+
+    path = publish(args.models_dir, model, {
+        "mode": mode,
+        "horizons": horizons,
+        "features": list(model.feature_names_in_),
+        "lags": cache.lags,
+        "wins": cache.wins,
+        "target": TARGET,
+        "trained_at": now.isoformat(timespec="seconds"),
+        "trained_until": pd.Timestamp(int(cache.hours[-1]) * HOUR_NS, tz="UTC").isoformat(),
+        "last_full_at": last_full,
+        "stages": stages,
+        "metrics": metrics,
+    }, keep=args.keep)
+    print(f"✅ Versión publicada en {path}")
+
+
+if __name__ == "__main__":
+    main()
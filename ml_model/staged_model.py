@@ -0,0 +1,30 @@
+import numpy as np
+
+
+class StagedBoosting:
+    """Suma de HistGradientBoostingRegressor entrenados en etapas.
+
+    La primera etapa es el ajuste completo; cada etapa siguiente es un
+    boosting corto sobre el residuo de las anteriores en las horas más
+    recientes (retrain.py). Equivale a añadir iteraciones de boosting sin
+    tocar los árboles ya entrenados. FlatTreeModel compila todas las etapas
+    en un solo evaluador.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        first = self.stages[0]
+        self.n_features_in_ = first.n_features_in_
+        if hasattr(first, "feature_names_in_"):
+            self.feature_names_in_ = first.feature_names_in_
+
+    @classmethod
+    def extend(cls, model, stage):
+        """Modelo anterior (etapas o un HGB simple) con una etapa más"""
+        return cls(getattr(model, "stages", [model]) + [stage])
+
+    def predict(self, X):
+        out = np.zeros(len(X))
+        for stage in self.stages:
+            out += stage.predict(X)
+        return out
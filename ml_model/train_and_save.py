@@ -1,107 +1,75 @@
+import argparse
+import os
 import pickle
+import time
 from sklearn.ensemble import HistGradientBoostingRegressor
 
-import requests
 import pandas as pd
 import matplotlib.pyplot as plt
 
 import numpy as np
 from math import sqrt
 from sklearn.metrics import mean_absolute_error, mean_squared_error
-from datetime import datetime
-
-# Endpoint
-url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-
-# Parámetros (intervalo de fechas)
-params = {
-    "latitude": 38.8951,
-    "longitude": -77.0364,
-    "start_date": "2024-06-01",
-    "end_date": "2025-10-03",
-    "hourly": ",".join([
-        "pm10","pm2_5","carbon_monoxide","carbon_dioxide",
-        "nitrogen_dioxide","ozone","sulphur_dioxide",
-        "aerosol_optical_depth","dust","uv_index","uv_index_clear_sky"
-    ])
-}
-
-# Llamada a la API
-r = requests.get(url, params=params, timeout=60)
-r.raise_for_status()
-data = r.json()
-
-# Extraer datos horarios
-hourly = data.get("hourly", {})
-units = data.get("hourly_units", {})
-timezone = data.get("timezone")
-
-# Pasar a DataFrame
-df = pd.DataFrame(hourly)
-df["time"] = pd.to_datetime(df["time"])
-df = df.set_index("time").sort_index()
-
-
-import requests
-import pandas as pd
-
-# Endpoint de histórico (no es el mismo que el de calidad del aire)
-URL = "https://archive-api.open-meteo.com/v1/archive"
-
-# Parámetros
-params = {
-    "latitude": 38.8951,
-    "longitude": -77.0364,
-    "start_date": "2024-06-01",
-    "end_date": "2025-10-03",  # cámbialo si quieres otro fin
-    "hourly": ",".join([
-        "temperature_2m",
-        "relative_humidity_2m",
-        "rain",
-        "snowfall",
-        "snow_depth",
-        "soil_temperature_100_to_255cm",
-        "dew_point_2m",
-        "precipitation",
-        "cloud_cover",
-        "surface_pressure",
-        "wind_speed_10m",
-    ]),
-    "timezone": "auto"  # horas en la zona local del punto (puedes quitarlo para UTC)
-}
-
-# Llamada a la API
-r = requests.get(URL, params=params, timeout=60)
-r.raise_for_status()
-data = r.json()
-
-# Extraer datos horarios y unidades
-hourly = data.get("hourly")
-units = data.get("hourly_units", {})
-tz = data.get("timezone")
-
-if not hourly:
-    raise ValueError("La respuesta no contiene 'hourly'. Revisa fechas/variables.")
-
-# --- df2: DataFrame con índice de tiempo ---
-df2 = pd.DataFrame(hourly)
-if "time" not in df2 or df2.empty:
-    raise ValueError("No se encontró la columna 'time' o el DataFrame llegó vacío.")
-
-df2["time"] = pd.to_datetime(df2["time"])
-df2 = df2.set_index("time").sort_index()
-
-
-# Asegura parseo de fechas
-df_ = df.reset_index().rename(columns={"index":"time"}) if "time" not in df.columns else df.copy()
-df2_ = df2.reset_index().rename(columns={"index":"time"}) if "time" not in df2.columns else df2.copy()
-
-df_["time"] = pd.to_datetime(df_["time"])
-df2_["time"] = pd.to_datetime(df2_["time"])
-
-# Merge por columna 'time'
-df_unificado = pd.merge(df_, df2_, on="time", how="outer", suffixes=("_aq", "_wx"))
-df_unificado = df_unificado.sort_values("time").set_index("time")
+from datetime import datetime, timezone
+
+from features import feature_frame, fit_table, stack_horizons
+from downloader import load_open_meteo
+from history_store import AQ_URL, DEFAULT_ROOT, WEATHER_URL, HistoryStore
+from forecast_engine import RecursiveForecaster, DirectForecaster
+from backtest import backtest, print_report
+from model_meta import save_meta, meta_path, publish
+from tree_eval import compile_model
+
+# Modo del modelo guardado: recursive (1 hora + realimentación) o direct
+# (un modelo con el horizonte como feature, todas las horas en un predict)
+parser = argparse.ArgumentParser()
+parser.add_argument("--mode", choices=["recursive", "direct"], default="recursive")
+parser.add_argument("--horizons", type=int, default=24, help="horas del modelo directo")
+parser.add_argument("--output", default="trained_model.pkl")
+parser.add_argument("--start", default="2024-06-01")
+parser.add_argument("--end", default=None, help="fin exclusivo (UTC); por defecto la hora actual")
+parser.add_argument("--publish", action="store_true",
+                    help="publicar además como versión nueva del registro (MODELS_DIR)")
+args = parser.parse_args()
+
+LAT, LON = 38.8951, -77.0364
+
+# Series horarias desde el almacén local (history_store.py): sólo se
+# descargan de Open-Meteo las horas que aún no están guardadas, por tramos
+# concurrentes que se pueden reanudar si la descarga se corta (downloader.py)
+store = HistoryStore(os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+end = pd.Timestamp(args.end, tz="UTC") if args.end else pd.Timestamp.now(tz="UTC").floor("h")
+
+# Calidad del aire
+df = load_open_meteo(store, "air_quality", AQ_URL, LAT, LON, [
+    "pm10","pm2_5","carbon_monoxide","carbon_dioxide",
+    "nitrogen_dioxide","ozone","sulphur_dioxide",
+    "aerosol_optical_depth","dust","uv_index","uv_index_clear_sky"
+], args.start, end, dtype=np.float32)
+
+# Clima (endpoint de histórico, no es el mismo que el de calidad del aire).
+# Se guarda en UTC, igual que la calidad del aire
+df2 = load_open_meteo(store, "weather", WEATHER_URL, LAT, LON, [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "rain",
+    "snowfall",
+    "snow_depth",
+    "soil_temperature_100_to_255cm",
+    "dew_point_2m",
+    "precipitation",
+    "cloud_cover",
+    "surface_pressure",
+    "wind_speed_10m",
+], args.start, end, dtype=np.float32)
+
+if df.empty or df.isna().all().all():
+    raise ValueError("No hay datos de calidad del aire. Revisa fechas/variables.")
+
+
+# Ambas series vienen del almacén con el mismo índice horario UTC
+# (datetime64, float32): se unen por índice sin pasar por columnas "time"
+df_unificado = df.join(df2, how="outer", lsuffix="_aq", rsuffix="_wx").sort_index()
 
 
 ###
@@ -134,25 +102,12 @@ y = base[target].copy()
 y = y.ffill(limit=3).bfill(limit=1)
 
 # ===== 2) Ingeniería de características (solo del objetivo + calendario) =====
-dfm = pd.DataFrame({target: y})
-
-# Estacionalidad calendario
-dfm["hour"] = dfm.index.hour
-dfm["dow"]  = dfm.index.dayofweek
-dfm["sin_hour"] = np.sin(2*np.pi*dfm["hour"]/24)
-dfm["cos_hour"] = np.cos(2*np.pi*dfm["hour"]/24)
-dfm["sin_dow"]  = np.sin(2*np.pi*dfm["dow"]/7)
-dfm["cos_dow"]  = np.cos(2*np.pi*dfm["dow"]/7)
-
-# Lags y ventanas (capturan memoria diaria/semanal)
+# Calendario, lags y ventanas (memoria diaria/semanal) salen de features.py,
+# el mismo módulo que usa el servidor al predecir
 lags = [1,2,3,6,12,24,48,72,168]  # 168 = 7 días
-for L in lags:
-    dfm[f"lag_{L}"] = dfm[target].shift(L)
-
 wins = [3,6,12,24,72]
-for w in wins:
-    dfm[f"roll_mean_{w}"] = dfm[target].rolling(w).mean()
-    dfm[f"roll_std_{w}"]  = dfm[target].rolling(w).std()
+dfm = feature_frame(y, lags, wins)
+dfm.insert(0, target, y)
 
 # Etiqueta: predecir 1 hora adelante
 dfm["y_next"] = dfm[target].shift(-1)
@@ -171,13 +126,67 @@ y_test  = dfm.loc[dfm.index >  split_date, "y_next"]
 model = HistGradientBoostingRegressor(
     max_depth=6, learning_rate=0.05, max_iter=500, random_state=42
 )
-model.fit(X_train, y_train)
+model.fit(fit_table(X_train), y_train)
 
 pred = model.predict(X_test)
 mae  = mean_absolute_error(y_test, pred)
 rmse = sqrt(mean_squared_error(y_test, pred))
 print(f"MAE test: {mae:.3f} | RMSE test: {rmse:.3f}")
 
+# ===== 4b) Modo directo y comparación en los 30 días de test =====
+def holdout_eval(forecaster, series, origins, horizons):
+    """Error por horizonte y latencia de un pronóstico por origen"""
+    errors = np.empty((len(origins), horizons))
+    latency = np.empty(len(origins))
+    for i, t0 in enumerate(origins):
+        history = series.loc[:t0].to_numpy()[-200:]
+        start = t0 + pd.Timedelta(hours=1)
+        t = time.perf_counter()
+        pred = forecaster.forecast(history, start, horizons)
+        latency[i] = time.perf_counter() - t
+        truth = series.loc[start:t0 + pd.Timedelta(hours=horizons)].to_numpy()
+        errors[i] = pred - truth
+    return {
+        "mae_by_horizon": np.abs(errors).mean(axis=0).round(4).tolist(),
+        "rmse_by_horizon": np.sqrt((errors ** 2).mean(axis=0)).round(4).tolist(),
+        "mae": float(np.abs(errors).mean()),
+        "rmse": float(np.sqrt((errors ** 2).mean())),
+        "latency_ms_p50": float(np.percentile(latency, 50) * 1000),
+        "latency_ms_p95": float(np.percentile(latency, 95) * 1000),
+    }
+
+metrics = {"mae_1h": mae, "rmse_1h": rmse}
+
+# Pronóstico recursivo de producción desde cada hora del test (backtest.py)
+bt = backtest(RecursiveForecaster(compile_model(model), lags, wins), y,
+              X_test.index + pd.Timedelta(hours=1), args.horizons)
+print("\nBacktest recursivo en test:")
+print_report(bt)
+metrics["backtest"] = {k: bt[k] for k in ("origins", "hours_ahead", "model", "persistence")}
+direct_model = None
+if args.mode == "direct":
+    H = args.horizons
+    # Objetivos sólo dentro del periodo de entrenamiento (sin fuga al test)
+    Xd_train, yd_train = stack_horizons(X_train, y.loc[:split_date], H)
+    Xd_train = fit_table(Xd_train)
+    direct_model = HistGradientBoostingRegressor(
+        max_depth=6, learning_rate=0.05, max_iter=500, random_state=42
+    )
+    direct_model.fit(Xd_train, yd_train)
+
+    # Un origen cada 6 h con H horas de verdad disponibles
+    origins = X_test.index[X_test.index + pd.Timedelta(hours=H) <= y.index.max()][::6]
+    compared = {
+        "recursive": holdout_eval(RecursiveForecaster(compile_model(model), lags, wins), y, origins, H),
+        "direct": holdout_eval(DirectForecaster(compile_model(direct_model), lags, wins, H), y, origins, H),
+    }
+    print(f"\nComparación en test ({len(origins)} orígenes, {H} h):")
+    print(f"{'modo':<10} {'MAE':>7} {'RMSE':>7} {'MAE h1':>7} {f'MAE h{H}':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for name, m in compared.items():
+        print(f"{name:<10} {m['mae']:>7.3f} {m['rmse']:>7.3f} {m['mae_by_horizon'][0]:>7.3f} "
+              f"{m['mae_by_horizon'][-1]:>7.3f} {m['latency_ms_p50']:>7.2f} {m['latency_ms_p95']:>7.2f}")
+    metrics["holdout"] = compared
+
 # ===== 5) Pronóstico desde AHORA hasta fin del día actual =====
 # Obtener hora actual del sistema
 now = datetime.now()
@@ -210,54 +219,43 @@ else:
     # Generar rango de horas futuras
     future_times = pd.date_range(current_hour, end_of_day, freq="h", tz=dfm.index.tz)
     
-    # Serie extendida con verdad histórica + placeholder para futuros
-    series_ext = dfm[target].copy()
-    results = []
-    
-    for t in future_times:
-        # Features calendario
-        row = {
-            "hour": t.hour,
-            "dow": t.dayofweek,
-            "sin_hour": np.sin(2*np.pi*t.hour/24),
-            "cos_hour": np.cos(2*np.pi*t.hour/24),
-            "sin_dow":  np.sin(2*np.pi*t.dayofweek/7),
-            "cos_dow":  np.cos(2*np.pi*t.dayofweek/7),
-        }
-        # Lags desde la serie extendida (que ya incluye predicciones previas)
-        for L in lags:
-            lag_time = t - pd.Timedelta(hours=L)
-            if lag_time in series_ext.index:
-                row[f"lag_{L}"] = series_ext.loc[lag_time]
-            else:
-                # Si no hay dato histórico, usar el último disponible
-                row[f"lag_{L}"] = series_ext.iloc[-1]
-        
-        # Rolling con histórico reciente (hasta t-1)
-        for w in wins:
-            window_start = t - pd.Timedelta(hours=w)
-            window_end = t - pd.Timedelta(hours=1)
-            window = series_ext.loc[window_start:window_end]
-            if len(window) > 0:
-                row[f"roll_mean_{w}"] = window.mean()
-                row[f"roll_std_{w}"]  = window.std()
-            else:
-                # Si no hay suficientes datos, usar valores del último dato
-                row[f"roll_mean_{w}"] = series_ext.iloc[-1]
-                row[f"roll_std_{w}"]  = 0
-        
-        X_row = pd.DataFrame([row], index=[t])
-        y_hat = model.predict(X_row)[0]
-        # Añadimos la predicción para que sirva de lag en el siguiente paso
-        series_ext.loc[t] = y_hat
-        results.append((t, y_hat))
+    # Mismo pronóstico recursivo que el servidor (features en streaming,
+    # cada predicción se realimenta como lag del paso siguiente)
+    forecaster = RecursiveForecaster(model, lags, wins)
+    y_hats = forecaster.forecast(y.dropna().to_numpy(), current_hour, hours_remaining)
+    results = list(zip(future_times, y_hats))
     
     forecast_today = pd.Series({t: y for t, y in results}, name=f"forecast_{target}")
     print(f"\nPredicciones generadas para {len(forecast_today)} horas restantes del día")
     print(forecast_today)
 
-# Guardar
-with open('trained_model.pkl', 'wb') as f:
-    pickle.dump(model, f)
-
-print("✅ Modelo guardado en trained_model.pkl")
\ No newline at end of file
+# Guardar (el servidor elige el modo leyendo los metadatos)
+saved = direct_model if args.mode == "direct" else model
+with open(args.output, 'wb') as f:
+    pickle.dump(saved, f)
+
+meta = {
+    "mode": args.mode,
+    "horizons": args.horizons if args.mode == "direct" else None,
+    "features": list(saved.feature_names_in_),
+    "lags": lags,
+    "wins": wins,
+    "target": target,
+    "trained_at": datetime.now().isoformat(timespec="seconds"),
+    "metrics": metrics,
+}
+save_meta(args.output, meta)
+
+print(f"✅ Modelo guardado en {args.output} (metadatos en {meta_path(args.output)})")
+
+# Registro de versiones: el servidor la detecta y la activa sin reiniciar
+if args.publish:
+    # Los 30 días de test no se usaron para ajustar: retrain.py los ve como nuevos
+    trained_until = X_train.index.max()
+    path = publish(os.getenv("MODELS_DIR", "models"), saved, {
+        **meta,
+        "trained_until": trained_until.isoformat(),
+        "last_full_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "stages": 1,
+    })
+    print(f"✅ Versión publicada en {path}")
\ No newline at end of file
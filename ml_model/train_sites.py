@@ -0,0 +1,223 @@
+"""Entrenamiento de un modelo por sitio en paralelo.
+
+1. Descarga concurrente al HistoryStore de lo que falte de todos los
+   sitios (downloader.py).
+2. Un proceso por sitio (ProcessPoolExecutor, un proceso nuevo por
+   sitio para que la memoria se libere al terminar): features, ajuste con
+   los 30 últimos días como test, y publicación en el registro del sitio
+   (<models_dir>/sites/<nombre>/, ver model_meta.py).
+3. Resumen de MAE/RMSE y tiempos por sitio en <models_dir>/sites/summary.json.
+
+El número de procesos es el menor entre --workers y los que caben en
+--memory-mb según una estimación del pico de memoria por sitio; los hilos
+de sklearn se reparten entre los procesos. El servidor enruta cada
+/predict al modelo del sitio más cercano.
+
+Uso (desde ml_model/):
+    python train_sites.py --site washington:38.8951,-77.0364 --site la:34.05,-118.24
+    python train_sites.py --sites-file sites.json --workers 4 --memory-mb 4000
+(sites.json: [{"name": "washington", "lat": 38.8951, "lon": -77.0364}, ...])
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from math import sqrt
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from downloader import ChunkedDownloader, DownloadError
+from features import DIRECT_EXTRA, LAGS, WINS, feature_frame, feature_names, fit_table, stack_horizons
+from history_store import AQ_URL, DEFAULT_ROOT, HistoryStore
+from model_meta import publish, site_registry
+from retrain import full_model, load_params
+
+try:
+    import resource
+except ImportError:  # Windows: sin pico de memoria por proceso
+    resource = None
+
+TARGET = "pm2_5"
+TEST_DAYS = 30
+
+
+def parse_sites(args):
+    sites = []
+    if args.sites_file:
+        with open(args.sites_file) as f:
+            sites += [{"name": s["name"], "lat": float(s["lat"]), "lon": float(s["lon"])}
+                      for s in json.load(f)]
+    for spec in args.site or []:
+        name, coords = spec.split(":")
+        lat, lon = (float(v) for v in coords.split(","))
+        sites.append({"name": name, "lat": lat, "lon": lon})
+    names = [s["name"] for s in sites]
+    if not sites or len(set(names)) != len(names):
+        raise SystemExit("Hace falta al menos un sitio y nombres sin repetir")
+    return sites
+
+
+def estimate_mb(hours, mode, horizons):
+    """Pico aproximado de un ajuste: la tabla de entrenamiento en float64 dos
+    veces (fit_table y la división de validación de sklearn), sus bins en
+    uint8 y ~150 MB del intérprete con numpy/pandas/sklearn. La tabla
+    float32 se construye y se suelta antes, con menos memoria que esto"""
+    n_cols = len(feature_names()) + (len(DIRECT_EXTRA) if mode == "direct" else 0)
+    rows = hours * (horizons if mode == "direct" else 1)
+    return 150 + rows * n_cols * (8 * 2 + 1) / 2**20
+
+
+def load_target(store, site, start, end):
+    # Mismo saneo del objetivo que train_and_save.py
+    y = store.read("air_quality", site["lat"], site["lon"], [TARGET], start, end, dtype=np.float32)[TARGET]
+    return y.asfreq("h").ffill(limit=3).bfill(limit=1)
+
+
+def fit_site(job):
+    """Trabajo de un proceso: entrena, evalúa y publica el modelo de un sitio"""
+    t_start = time.perf_counter()
+    site, mode, horizons = job["site"], job["mode"], job["horizons"]
+    with threadpool_limits(limits=job["threads"]):
+        store = HistoryStore(job["store_root"])
+        y = load_target(store, site, job["start"], job["end"])
+        if y.notna().sum() < 24 * (TEST_DAYS + 14):
+            raise ValueError(f"{site['name']}: historia insuficiente ({y.notna().sum()} horas)")
+
+        dfm = feature_frame(y)
+        dfm["y_next"] = y.shift(-1)
+        dfm = dfm.dropna()
+        split = dfm.index.max() - pd.Timedelta(days=TEST_DAYS)
+        train, test = dfm.loc[:split], dfm.loc[split + pd.Timedelta(hours=1):]
+        X_train, X_test = train.drop(columns="y_next"), test.drop(columns="y_next")
+        if mode == "direct":
+            # Objetivos sólo dentro del periodo de entrenamiento (sin fuga al test)
+            X_fit, y_fit = stack_horizons(X_train, y.loc[:split], horizons)
+            X_eval, y_eval = stack_horizons(X_test, y, horizons)
+        else:
+            X_fit, y_fit = X_train, train["y_next"].to_numpy()
+            X_eval, y_eval = X_test, test["y_next"].to_numpy()
+
+        X_fit = fit_table(X_fit)
+        t0 = time.perf_counter()
+        model = full_model(X_fit, y_fit, job["params"])
+        fit_seconds = time.perf_counter() - t0
+        err = model.predict(X_eval) - y_eval
+        metrics = {"mae": float(np.abs(err).mean()), "rmse": float(sqrt((err ** 2).mean()))}
+
+        path = publish(site_registry(job["models_dir"], site["name"]), model, {
+            "mode": mode,
+            "horizons": horizons,
+            "features": list(model.feature_names_in_),
+            "lags": LAGS,
+            "wins": WINS,
+            "target": TARGET,
+            "site": site,
+            "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "trained_until": X_train.index.max().isoformat(),
+            "last_full_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "stages": 1,
+            "metrics": metrics,
+        })
+
+    return {
+        **site,
+        **metrics,
+        "rows": len(y_fit),
+        "fit_seconds": fit_seconds,
+        "total_seconds": time.perf_counter() - t_start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+        "path": path,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--site", action="append", help="nombre:lat,lon (repetible)")
+    parser.add_argument("--sites-file", default=None, help="JSON con [{name, lat, lon}]")
+    parser.add_argument("--mode", choices=["recursive", "direct"], default="recursive")
+    parser.add_argument("--horizons", type=int, default=24)
+    parser.add_argument("--start", default="2024-06-01")
+    parser.add_argument("--end", default=None, help="fin exclusivo (UTC); por defecto la hora actual")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--memory-mb", type=float, default=4096, help="memoria total para los ajustes")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--params", default=None, help="best.json de tune.py")
+    parser.add_argument("--models-dir", default=os.getenv("MODELS_DIR", "models"))
+    parser.add_argument("--root", default=os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+    args = parser.parse_args()
+
+    sites = parse_sites(args)
+    horizons = args.horizons if args.mode == "direct" else None
+    end = pd.Timestamp(args.end, tz="UTC") if args.end else pd.Timestamp.now(tz="UTC").floor("h")
+    t_start = time.perf_counter()
+
+    # 1. Historia de todos los sitios (sólo se descarga lo que falta); un
+    # sitio con tramos fallidos queda en `failed` y el resto se entrena
+    store = HistoryStore(args.root)
+    jobs = [{"source": "air_quality", "url": AQ_URL, "lat": s["lat"], "lon": s["lon"],
+             "variables": [TARGET], "start": args.start, "end": end, "site": s} for s in sites]
+    failed = []
+    try:
+        stats = ChunkedDownloader(store, workers=args.download_workers).run(jobs)
+        print(f"Historia: {stats['fetched']} tramos descargados en {stats['seconds']:.1f}s")
+    except DownloadError as e:
+        print(f"❌ Historia: {e}")
+        for job in e.jobs:
+            failed.append({**job["site"], "error": f"descarga incompleta: {e}"})
+            print(f"❌ {job['site']['name']}: descarga incompleta, se omite")
+        skipped = {job["site"]["name"] for job in e.jobs}
+        sites = [s for s in sites if s["name"] not in skipped]
+
+    # 2. Procesos según la memoria disponible
+    hours = int((end - pd.Timestamp(args.start, tz="UTC")) / pd.Timedelta(hours=1))
+    per_site = estimate_mb(hours, args.mode, horizons or 1)
+    workers = max(1, min(args.workers, len(sites), int(args.memory_mb // per_site)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"{len(sites)} sitios, {workers} procesos x {threads} hilos "
+          f"(~{per_site:.0f} MB por sitio, presupuesto {args.memory_mb:.0f} MB)")
+
+    results = []
+    with ProcessPoolExecutor(workers, max_tasks_per_child=1) as pool:
+        futures = {
+            pool.submit(fit_site, {
+                "site": site, "mode": args.mode, "horizons": horizons, "threads": threads,
+                "start": args.start, "end": end, "store_root": args.root, "models_dir": args.models_dir,
+                "params": load_params(args.params),
+            }): site for site in sites
+        }
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                results.append(future.result())
+                print(f"✅ {site['name']}: MAE {results[-1]['mae']:.3f} en {results[-1]['total_seconds']:.1f}s")
+            except Exception as e:
+                failed.append({**site, "error": str(e)})
+                print(f"❌ {site['name']}: {e}")
+
+    # 3. Resumen
+    wall = time.perf_counter() - t_start
+    results.sort(key=lambda r: r["name"])
+    print(f"\n{'sitio':<16} {'filas':>9} {'MAE':>7} {'RMSE':>7} {'ajuste s':>9} {'total s':>8} {'pico MB':>8}")
+    for r in results:
+        peak = f"{r['peak_rss_mb']:>8.0f}" if r["peak_rss_mb"] else f"{'-':>8}"
+        print(f"{r['name']:<16} {r['rows']:>9} {r['mae']:>7.3f} {r['rmse']:>7.3f} "
+              f"{r['fit_seconds']:>9.1f} {r['total_seconds']:>8.1f} {peak}")
+    serial = sum(r["total_seconds"] for r in results)
+    print(f"Total {wall:.1f}s (suma por sitio {serial:.1f}s)")
+
+    summary_path = os.path.join(args.models_dir, "sites", "summary.json")
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    with open(summary_path, "w") as f:
+        json.dump({"mode": args.mode, "horizons": horizons, "workers": workers, "threads": threads,
+                   "wall_seconds": wall, "sites": results, "failed": failed}, f, indent=2)
+    print(f"Resumen en {summary_path}")
+    if failed:
+        raise SystemExit(f"{len(failed)} sitios fallaron")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import copy
+import json
+import os
+
+import numpy as np
+
+# Arrays de nodos que definen el modelo (el resto son buffers de trabajo)
+NODE_ARRAYS = ["feature", "threshold", "missing_left", "left", "right", "value", "roots"]
+
+
+class FlatTreeModel:
+    """Evaluador de un HistGradientBoostingRegressor sobre arrays planos.
+
+    Todos los nodos de todos los árboles se copian a arrays contiguos
+    (feature, umbral, hijo izquierdo/derecho, valor). La predicción avanza
+    todos los árboles a la vez, un nivel por iteración, sobre buffers
+    preasignados: para lotes de hasta `max_rows` filas no se reserva
+    memoria por llamada salvo el array de salida.
+
+    Se evita así la validación y el reparto en hilos que sklearn hace en
+    cada predict, que domina el coste para una sola fila.
+    """
+
+    def __init__(self, model, max_rows=256):
+        # Un modelo por etapas (StagedBoosting) se evalúa como un solo
+        # ensemble: árboles concatenados y suma de los valores iniciales
+        stages = getattr(model, "stages", [model])
+        for stage in stages:
+            if getattr(stage, "_predictors", None) is None:
+                raise TypeError("Se esperaba un HistGradientBoostingRegressor entrenado")
+            if type(stage._loss.link).__name__ != "IdentityLink":
+                raise TypeError("Solo se soportan pérdidas con link identidad (regresión)")
+        predictors = [it for stage in stages for it in stage._predictors]
+        if any(len(it) != 1 for it in predictors):
+            raise TypeError("Solo se soporta un árbol por iteración")
+
+        trees = [it[0].nodes for it in predictors]
+        if any(t["is_categorical"].any() for t in trees):
+            raise TypeError("Los splits categóricos no están soportados")
+
+        offsets = np.cumsum([0] + [len(t) for t in trees[:-1]])
+        nodes = np.concatenate(trees)
+        shift = np.repeat(offsets, [len(t) for t in trees])
+        own = np.arange(len(nodes))
+        leaf = nodes["is_leaf"].astype(bool)
+
+        # Las hojas apuntan a sí mismas: el recorrido se queda quieto al llegar
+        self.feature = np.where(leaf, 0, nodes["feature_idx"]).astype(np.intp)
+        self.threshold = np.where(leaf, np.inf, nodes["num_threshold"])
+        self.missing_left = nodes["missing_go_to_left"].astype(bool)
+        self.left = np.where(leaf, own, nodes["left"] + shift).astype(np.intp)
+        self.right = np.where(leaf, own, nodes["right"] + shift).astype(np.intp)
+        self.value = np.where(leaf, nodes["value"], 0.0)
+        self.roots = offsets.astype(np.intp)
+        self.depth = int(max(t["depth"].max() for t in trees))
+        self.baseline = float(sum(np.ravel(stage._baseline_prediction)[0] for stage in stages))
+
+        self.n_features_in_ = model.n_features_in_
+        if hasattr(model, "feature_names_in_"):
+            self.feature_names_in_ = model.feature_names_in_
+        self.model = model
+        self._alloc(max_rows)
+
+    def clone(self):
+        """Copia que comparte los arrays de nodos pero tiene buffers propios
+        (los buffers no se pueden compartir entre hilos)."""
+        other = copy.copy(self)
+        other._alloc(self.max_rows)
+        return other
+
+    def save(self, directory):
+        """Guarda los arrays de nodos como .npy para abrirlos con memmap."""
+        os.makedirs(directory, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        meta = {
+            "depth": self.depth,
+            "baseline": self.baseline,
+            "n_features_in_": self.n_features_in_,
+            "feature_names_in_": [str(c) for c in getattr(self, "feature_names_in_", [])],
+        }
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, max_rows=256):
+        """Abre un modelo guardado con save(); los nodos quedan en memmap de
+        solo lectura, así varios procesos comparten las mismas páginas."""
+        self = cls.__new__(cls)
+        for name in NODE_ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.depth = meta["depth"]
+        self.baseline = meta["baseline"]
+        self.n_features_in_ = meta["n_features_in_"]
+        if meta["feature_names_in_"]:
+            self.feature_names_in_ = np.array(meta["feature_names_in_"], dtype=object)
+        self.model = None
+        self._alloc(max_rows)
+        return self
+
+    def _alloc(self, max_rows):
+        n_trees = len(self.roots)
+        shape = (max_rows, n_trees)
+        self.max_rows = max_rows
+        self._node = np.empty(shape, dtype=np.intp)
+        self._next = np.empty(shape, dtype=np.intp)
+        self._idx = np.empty(shape, dtype=np.intp)
+        self._x = np.empty(shape)
+        self._thr = np.empty(shape)
+        self._go_left = np.empty(shape, dtype=bool)
+        self._missing = np.empty(shape, dtype=bool)
+        self._missing_left = np.empty(shape, dtype=bool)
+        self._row_offset = (np.arange(max_rows) * self.n_features_in_)[:, None]
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X debe tener forma (n, {self.n_features_in_})")
+
+        out = np.empty(len(X))
+        for start in range(0, len(X), self.max_rows):
+            chunk = X[start:start + self.max_rows]
+            self._predict_chunk(chunk, out[start:start + len(chunk)])
+        return out
+
+    def _predict_chunk(self, X, out):
+        n = len(X)
+        node = self._node[:n]
+        nxt = self._next[:n]
+        idx = self._idx[:n]
+        xv = self._x[:n]
+        thr = self._thr[:n]
+        go_left = self._go_left[:n]
+        missing = self._missing[:n]
+        missing_left = self._missing_left[:n]
+        flat = X.ravel()
+        has_nan = np.isnan(flat).any()
+
+        # mode="clip": los índices son válidos por construcción y así
+        # np.take escribe directo en `out` sin buffer intermedio
+        node[:] = self.roots
+        for _ in range(self.depth):
+            np.take(self.feature, node, out=idx, mode="clip")
+            np.add(idx, self._row_offset[:n], out=idx)
+            np.take(flat, idx, out=xv, mode="clip")
+            np.take(self.threshold, node, out=thr, mode="clip")
+            np.less_equal(xv, thr, out=go_left)
+            if has_nan:
+                # NaN: se va por el lado que el árbol aprendió para faltantes
+                np.isnan(xv, out=missing)
+                np.take(self.missing_left, node, out=missing_left, mode="clip")
+                np.logical_and(missing, missing_left, out=missing)
+                np.logical_or(go_left, missing, out=go_left)
+            np.take(self.right, node, out=nxt, mode="clip")
+            np.take(self.left, node, out=idx, mode="clip")
+            np.copyto(nxt, idx, where=go_left)
+            node, nxt = nxt, node
+
+        np.take(self.value, node, out=thr, mode="clip")
+        np.sum(thr, axis=1, out=out)
+        out += self.baseline
+
+
+def threshold_probe(flat, n_rows=256, seed=0):
+    """Lote de prueba construido con los umbrales reales de los árboles.
+
+    Cada valor es un umbral exacto (caso `<=`), uno desplazado ligeramente
+    o NaN, para recorrer las dos ramas de muchos splits.
+    """
+    rng = np.random.default_rng(seed)
+    split = flat.left != np.arange(len(flat.left))
+    X = np.zeros((n_rows, flat.n_features_in_))
+    for j in range(flat.n_features_in_):
+        thr = flat.threshold[split & (flat.feature == j)]
+        if len(thr) == 0:
+            continue
+        col = rng.choice(thr, n_rows) + rng.choice([-1e-6, 0.0, 1e-6], n_rows)
+        col[rng.random(n_rows) < 0.05] = np.nan
+        X[:, j] = col
+    return X
+
+
+def compile_model(model, X_check=None, atol=1e-9):
+    """Devuelve un FlatTreeModel equivalente a `model`, o el modelo original
+    si no se puede convertir o no coincide con model.predict en `X_check`
+    (por defecto, threshold_probe).
+    """
+    try:
+        flat = FlatTreeModel(model)
+    except TypeError as e:
+        print(f"⚠️ Evaluador plano no disponible: {e}")
+        return model
+
+    if X_check is None:
+        X_check = threshold_probe(flat)
+    diff = np.max(np.abs(flat.predict(X_check) - model.predict(X_check)))
+    if not diff <= atol:
+        print(f"⚠️ Evaluador plano descartado (diferencia {diff:.2e})")
+        return model
+    return flat
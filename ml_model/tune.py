@@ -0,0 +1,288 @@
+"""Búsqueda de hiperparámetros con validación cruzada temporal.
+
+- Folds con origen móvil: cada fold prueba `--fold-days` días y entrena con
+  todo lo anterior (ventana creciente), como se usa el modelo en producción.
+- Los (trial, fold) se evalúan en paralelo en un pool de procesos con un
+  hilo de sklearn cada uno; la matriz de features se calcula una vez y se
+  pasa a los workers al arrancar.
+- Early stopping de sklearn (n_iter_no_change sobre una fracción del
+  entrenamiento): max_iter es un techo y no hace falta buscarlo.
+- Objetivo = MAE medio de los folds + `--latency-weight` x latencia (ms) de
+  un pronóstico recursivo de 24 h con el evaluador plano: un modelo
+  algo menos preciso pero mucho más rápido puede ganar.
+- `--budget-seconds`: no se empiezan trials nuevos pasado ese tiempo.
+- Cada trial terminado se guarda en <models_dir>/tuning/trials.jsonl con una
+  clave de parámetros + datos (--start, --end, filas) + folds; al repetir,
+  esos trials no se vuelven a evaluar. Sin --end el fin es el inicio del día
+  UTC actual, así que las repeticiones del mismo día reutilizan la caché.
+
+El mejor se guarda en <models_dir>/tuning/best.json; retrain.py y
+train_sites.py lo usan con --params.
+
+Uso (desde ml_model/):
+    python tune.py --trials 40 --budget-seconds 600 --workers 4
+    python tune.py --latency-weight 0.05 --end 2025-09-01
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor
+from threadpoolctl import threadpool_limits
+
+from features import LAGS, WINS, feature_frame, feature_names
+from forecast_engine import RecursiveForecaster
+from history_store import DEFAULT_ROOT, HOUR_NS, HistoryStore
+from retrain import LAT, LON
+from train_sites import load_target
+from tree_eval import compile_model
+
+# Parámetros actuales de train_and_save.py (referencia, trial 0)
+BASELINE = {"max_depth": 6, "learning_rate": 0.05, "max_iter": 500}
+
+SPACE = {
+    "max_depth": [3, 4, 5, 6, 8, None],
+    "max_leaf_nodes": [7, 15, 31, 63],
+    "min_samples_leaf": [10, 20, 50, 100],
+    "l2_regularization": [0.0, 0.1, 1.0, 10.0],
+    "max_bins": [63, 127, 255],
+}
+LEARNING_RATE = (0.02, 0.3)  # log-uniforme
+MAX_ITER = 1000
+LATENCY_HOURS = 24
+LATENCY_REPEATS = 15
+
+# Datos del worker (initializer del pool)
+_data = {}
+
+
+def sample_params(rng, n):
+    """El baseline y n - 1 combinaciones aleatorias (misma semilla, misma lista)"""
+    out = [dict(BASELINE)]
+    lo, hi = np.log(LEARNING_RATE[0]), np.log(LEARNING_RATE[1])
+    while len(out) < n:
+        params = {k: v[rng.integers(len(v))] for k, v in SPACE.items()}
+        params["learning_rate"] = round(float(np.exp(rng.uniform(lo, hi))), 4)
+        params["max_iter"] = MAX_ITER
+        params = {k: (int(v) if isinstance(v, np.integer) else v) for k, v in params.items()}
+        if params not in out:
+            out.append(params)
+    return out
+
+
+def make_folds(times, n_folds, fold_days):
+    """[(fin de entrenamiento, inicio de test, fin de test)] en índices de fila.
+
+    El test de cada fold son `fold_days` días; los últimos n_folds bloques
+    del periodo. Se entrena con las filas cuyo objetivo (y[t+1]) es
+    anterior al inicio del test.
+    """
+    folds = []
+    end = times[-1] + pd.Timedelta(hours=1)
+    for k in range(n_folds, 0, -1):
+        t0 = end - pd.Timedelta(days=fold_days * k)
+        t1 = t0 + pd.Timedelta(days=fold_days)
+        train_end = times.searchsorted(t0 - pd.Timedelta(hours=1))
+        folds.append((int(train_end), int(times.searchsorted(t0)), int(times.searchsorted(t1))))
+    return folds
+
+
+def trial_key(params, fingerprint):
+    blob = json.dumps({"params": params, "data": fingerprint}, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def _init_worker(X, y_next, hours, history, history_start):
+    _data.update(X=X, y_next=y_next, hours=hours, history=history, history_start=history_start)
+
+
+def evaluate_fold(params, fold, measure_latency):
+    """Ajusta un fold y devuelve error, iteraciones y (opcional) latencia"""
+    train_end, test_start, test_end = fold
+    X, y = _data["X"], _data["y_next"]
+    with threadpool_limits(limits=1):
+        model = HistGradientBoostingRegressor(
+            **params, early_stopping=True, validation_fraction=0.1,
+            n_iter_no_change=20, random_state=42,
+        )
+        t0 = time.perf_counter()
+        model.fit(X[:train_end], y[:train_end])
+        fit_seconds = time.perf_counter() - t0
+        err = model.predict(X[test_start:test_end]) - y[test_start:test_end]
+
+        result = {
+            "mae": float(np.abs(err).mean()),
+            "rmse": float(np.sqrt((err ** 2).mean())),
+            "n_iter": int(model.n_iter_),
+            "fit_seconds": fit_seconds,
+        }
+        if measure_latency:
+            # Pronóstico de 24 h desde el inicio del test, como en /predict
+            forecaster = RecursiveForecaster(compile_model(model))
+            origin = int(_data["hours"][test_start])
+            stop = origin - _data["history_start"]
+            history = _data["history"][max(0, stop - forecaster.capacity):stop]
+            start = pd.Timestamp(origin * HOUR_NS, tz="UTC")
+            times = []
+            for _ in range(LATENCY_REPEATS):
+                t0 = time.perf_counter()
+                forecaster.forecast(history, start, LATENCY_HOURS)
+                times.append(time.perf_counter() - t0)
+            # Mínimo de las repeticiones: los workers comparten CPU y la mediana se contamina
+            result["latency_ms"] = float(np.min(times) * 1000)
+    return result
+
+
+def summarize(params, folds, latency_weight):
+    mae = float(np.mean([f["mae"] for f in folds]))
+    latency = next(f["latency_ms"] for f in folds if "latency_ms" in f)
+    return {
+        "params": params,
+        "mae": mae,
+        "mae_std": float(np.std([f["mae"] for f in folds])),
+        "rmse": float(np.mean([f["rmse"] for f in folds])),
+        "latency_ms": latency,
+        "n_iter": int(np.median([f["n_iter"] for f in folds])),
+        "fit_seconds": float(sum(f["fit_seconds"] for f in folds)),
+        "objective": mae + latency_weight * latency,
+        "folds": folds,
+    }
+
+
+def pareto(trials):
+    """Trials no dominados en (MAE, latencia)"""
+    return [t for t in trials
+            if not any(o["mae"] <= t["mae"] and o["latency_ms"] <= t["latency_ms"]
+                       and (o["mae"], o["latency_ms"]) != (t["mae"], t["latency_ms"]) for o in trials)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--fold-days", type=float, default=14)
+    parser.add_argument("--budget-seconds", type=float, default=900)
+    parser.add_argument("--latency-weight", type=float, default=0.02,
+                        help="µg/m³ de MAE que vale 1 ms de latencia")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lat", type=float, default=LAT)
+    parser.add_argument("--lon", type=float, default=LON)
+    parser.add_argument("--start", default="2024-06-01")
+    parser.add_argument("--end", default=None, help="fin exclusivo (UTC); por defecto el inicio del día actual")
+    parser.add_argument("--models-dir", default=os.getenv("MODELS_DIR", "models"))
+    parser.add_argument("--root", default=os.getenv("HISTORY_STORE_DIR", DEFAULT_ROOT))
+    args = parser.parse_args()
+    t_start = time.perf_counter()
+
+    # Datos: la serie ya guardada en el almacén (train_and_save/retrain la descargan)
+    # Fin en un límite estable (el día) para que la clave de la caché no cambie cada hora
+    end = pd.Timestamp(args.end, tz="UTC") if args.end else pd.Timestamp.now(tz="UTC").floor("D")
+    y = load_target(HistoryStore(args.root), {"lat": args.lat, "lon": args.lon}, args.start, end)
+    dfm = feature_frame(y)
+    dfm["y_next"] = y.shift(-1)
+    dfm = dfm.dropna()
+    if len(dfm) < 24 * args.fold_days * (args.folds + 2):
+        raise SystemExit(f"Historia insuficiente para {args.folds} folds de {args.fold_days} días "
+                         f"({len(dfm)} filas)")
+    # En float64: cada fold ajusta sobre una vista X[:train_end] sin copiarla
+    X = np.ascontiguousarray(dfm[feature_names()].to_numpy(), dtype=np.float64)
+    y_next = dfm["y_next"].to_numpy()
+    hours = dfm.index.asi8 // HOUR_NS
+    folds = make_folds(dfm.index, args.folds, args.fold_days)
+
+    fingerprint = {
+        "lat": args.lat, "lon": args.lon, "start": args.start, "end": end.isoformat(),
+        "rows": len(dfm), "folds": folds, "features": feature_names(), "lags": LAGS, "wins": WINS,
+    }
+    tuning_dir = os.path.join(args.models_dir, "tuning")
+    os.makedirs(tuning_dir, exist_ok=True)
+    cache_path = os.path.join(tuning_dir, "trials.jsonl")
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            for line in f:
+                record = json.loads(line)
+                cached[record["key"]] = record
+
+    candidates = sample_params(np.random.default_rng(args.seed), args.trials)
+    keys = [trial_key(p, fingerprint) for p in candidates]
+    done = {k: cached[k] for k in keys if k in cached}
+    todo = [(k, p) for k, p in zip(keys, candidates) if k not in done]
+    print(f"{len(dfm)} filas, {args.folds} folds de {args.fold_days:g} días; "
+          f"{len(candidates)} trials ({len(done)} en caché), {args.workers} procesos")
+
+    # Trials en paralelo (un trabajo por fold); sin trials nuevos pasado el presupuesto
+    history = y.to_numpy()
+    history_start = int(y.index.asi8[0] // HOUR_NS)
+    results, skipped = {}, 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                             initargs=(X, y_next, hours, history, history_start)) as pool, \
+            open(cache_path, "a") as cache_file:
+        pending = {}
+        queue = list(todo)
+
+        def submit_next():
+            key, params = queue.pop(0)
+            results[key] = {"params": params, "folds": [None] * len(folds)}
+            for i, fold in enumerate(folds):
+                # La latencia se mide en el último fold (el modelo más parecido al de producción)
+                future = pool.submit(evaluate_fold, params, fold, i == len(folds) - 1)
+                pending[future] = (key, i)
+
+        while queue or pending:
+            while queue and len(pending) < 2 * args.workers:
+                if time.perf_counter() - t_start > args.budget_seconds:
+                    skipped = len(queue)
+                    queue.clear()
+                    break
+                submit_next()
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, i = pending.pop(future)
+                results[key]["folds"][i] = future.result()
+                if all(results[key]["folds"]):
+                    trial = summarize(results[key]["params"], results[key]["folds"], args.latency_weight)
+                    done[key] = {"key": key, **trial}
+                    cache_file.write(json.dumps(done[key]) + "\n")
+                    cache_file.flush()
+                    print(f"[{len(done)}/{len(candidates)}] MAE {trial['mae']:.3f} "
+                          f"latencia {trial['latency_ms']:.2f} ms, {trial['n_iter']} iter: {trial['params']}")
+
+    # El objetivo se recalcula: el peso de la latencia puede cambiar entre ejecuciones
+    trials = []
+    for record in done.values():
+        record["objective"] = record["mae"] + args.latency_weight * record["latency_ms"]
+        trials.append(record)
+    trials.sort(key=lambda t: t["objective"])
+    front = {id(t) for t in pareto(trials)}
+
+    print(f"\n{'#':>3} {'objetivo':>9} {'MAE':>7} {'±':>6} {'RMSE':>7} {'ms':>7} {'iter':>5}  parámetros")
+    for rank, t in enumerate(trials[:15], 1):
+        mark = "*" if id(t) in front else " "
+        print(f"{rank:>3} {t['objective']:>9.3f} {t['mae']:>7.3f} {t['mae_std']:>6.3f} {t['rmse']:>7.3f} "
+              f"{t['latency_ms']:>7.2f} {t['n_iter']:>5}{mark} {t['params']}")
+    print("(* = frontera MAE/latencia)")
+    if skipped:
+        print(f"⏱️ Presupuesto agotado: {skipped} trials sin evaluar (se retoman en la siguiente ejecución)")
+
+    best = trials[0]
+    # Modelo final: las iteraciones que eligió el early stopping, sin él
+    params = {**best["params"], "max_iter": best["n_iter"], "early_stopping": False}
+    with open(os.path.join(tuning_dir, "best.json"), "w") as f:
+        json.dump({"params": params, "mae": best["mae"], "latency_ms": best["latency_ms"],
+                   "objective": best["objective"], "latency_weight": args.latency_weight,
+                   "data": fingerprint}, f, indent=2)
+    print(f"✅ Mejor: {params} → {os.path.join(tuning_dir, 'best.json')} "
+          f"({time.perf_counter() - t_start:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
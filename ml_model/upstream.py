@@ -0,0 +1,82 @@
+import asyncio
+import random
+from urllib.parse import urlsplit
+
+import httpx
+
+# Respuestas que vale la pena reintentar
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class UpstreamClient:
+    """Cliente HTTP asíncrono para Open-Meteo.
+
+    Un solo httpx.AsyncClient con pool keep-alive, un semáforo por host
+    para no saturar al proveedor y reintentos con backoff exponencial.
+    """
+
+    def __init__(self, max_connections=100, max_keepalive=20, per_host_limit=10,
+                 retries=2, backoff=0.5, timeout=30):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30,
+        )
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._client = None
+        self._host_limits = {}
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    async def get_json(self, url, params=None, timeout=None):
+        client = self._get_client()
+        limit = self._host_limit(url)
+        timeout = timeout or self.timeout
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                self.requests += 1
+                async with limit:
+                    r = await client.get(url, params=params, timeout=timeout)
+                if r.status_code not in RETRY_STATUS or last:
+                    if r.is_error:
+                        self.failed += 1
+                    r.raise_for_status()
+                    return r.json()
+                error = UpstreamError(f"HTTP {r.status_code} desde {url}")
+            except httpx.TransportError as e:
+                if last:
+                    self.failed += 1
+                    raise UpstreamError(f"{type(e).__name__} desde {url}") from e
+                error = e
+
+            self.retried += 1
+            # Backoff exponencial con jitter (el semáforo ya está liberado)
+            delay = self.backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Reintentando {url} en {delay:.1f}s ({error})")
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,122 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def estimate_size(obj):
+    """Tamaño aproximado en bytes de un payload JSON ya parseado"""
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + obj.nbytes
+    return sys.getsizeof(obj)
+
+
+class GridCache:
+    """Caché LRU con TTL para respuestas de Open-Meteo.
+
+    La clave es (tipo, lat/lon redondeadas a la rejilla del upstream, hora
+    UTC actual), así que puntos cercanos comparten entrada y todo caduca al
+    cambiar la hora. Peticiones concurrentes para la misma clave esperan a
+    una única descarga (single-flight). Los errores no se cachean.
+    """
+
+    def __init__(self, grid_deg=0.1, ttl=3600, max_bytes=64 * 2**20):
+        self.grid_deg = grid_deg
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()  # clave -> (expira, bytes, valor)
+        self._inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def snap(self, lat, lon):
+        g = self.grid_deg
+        return round(round(lat / g) * g, 6), round(round(lon / g) * g, 6)
+
+    def key(self, kind, lat, lon):
+        hour = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+        return (kind, lat, lon, hour)
+
+    async def get(self, kind, lat, lon, fetch):
+        """Devuelve el valor cacheado o llama a `fetch()` (una sola vez por clave).
+
+        `lat` y `lon` deben venir ya redondeadas con snap().
+        """
+        key = self.key(kind, lat, lon)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[2]
+            self._drop(key)
+            self.expirations += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fill(key, fetch))
+            # Evita el aviso "exception never retrieved" si nadie espera
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+
+        # shield: si un cliente se desconecta no se cancela la descarga de los demás
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, fetch):
+        try:
+            value = await fetch()
+            self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+        }